@@ -0,0 +1,161 @@
+"""切块去重基准：比较一次游戏会话后，三种上传方式需要传输的字节数
+
+- 整个 ZIP：ZIP 模式每次上传整个存档压缩包
+- 整文件：增量模式只上传内容变化的文件
+- 内容切块：增量模式下大文件只上传变化的块
+- 区块布局：区域文件按区块布局切分，只上传被改写的区块所在的段
+
+最后检查按内容切块的吞吐量，低于 --min-throughput 时以非零状态退出。
+
+在仓库根目录运行：python -m benchmarks.chunking [--regions 16] [--edits 40] [--min-throughput 20]
+"""
+import io
+import sys
+import time
+import zlib
+import random
+import struct
+import zipfile
+import argparse
+from mcgoogledrive.chunking import chunk_boundaries, chunk_data, chunk_params, DEFAULT_CHUNK_THRESHOLD
+from mcgoogledrive.region import REGION_LAYOUT
+
+SECTOR = 4096
+CHUNKS_PER_REGION = 32 * 32
+
+def _chunk_payload(rnd, x, z, version):
+    """生成一个区块的数据：带少量随机性的结构化内容，压缩率与真实区块数据接近"""
+    palette = [b'minecraft:stone', b'minecraft:dirt', b'minecraft:grass_block', b'minecraft:water', b'minecraft:deepslate']
+    body = b''.join(rnd.choice(palette) + bytes([rnd.randrange(16)]) for _ in range(rnd.randrange(400, 1600)))
+    return zlib.compress(struct.pack('>iii', x, z, version) + body)
+
+class SyntheticRegion:
+    """模拟 .mca 区域文件：8KiB 头部（位置表 + 时间戳）后按 4KiB 扇区存放压缩后的区块"""
+
+    def __init__(self, rnd):
+        self.rnd = rnd
+        self.chunks = [_chunk_payload(rnd, index % 32, index // 32, 0) for index in range(CHUNKS_PER_REGION)]
+        self.timestamps = [0] * CHUNKS_PER_REGION
+        self.sectors = []
+        offset = 2
+        for data in self.chunks:
+            count = (len(data) + 5 + SECTOR - 1) // SECTOR
+            self.sectors.append((offset, count))
+            offset += count
+
+    def edit(self, index, version):
+        """改写一个区块；变大放不下原扇区时像游戏一样追加到文件末尾"""
+        data = _chunk_payload(self.rnd, index % 32, index // 32, version)
+        count = (len(data) + 5 + SECTOR - 1) // SECTOR
+        offset, old_count = self.sectors[index]
+        if count > old_count:
+            offset = max(start + size for start, size in self.sectors)
+        self.sectors[index] = (offset, count)
+        self.chunks[index] = data
+        self.timestamps[index] = version
+
+    def to_bytes(self):
+        size = max(start + count for start, count in self.sectors) * SECTOR
+        out = bytearray(size)
+        for index, ((offset, count), data) in enumerate(zip(self.sectors, self.chunks)):
+            out[index * 4:index * 4 + 4] = struct.pack('>I', offset << 8 | count)
+            out[SECTOR + index * 4:SECTOR + index * 4 + 4] = struct.pack('>I', self.timestamps[index])
+            out[offset * SECTOR:offset * SECTOR + len(data) + 5] = struct.pack('>IB', len(data) + 1, 2) + data
+        return bytes(out)
+
+def zip_size(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, data in files.items():
+            zip_ref.writestr(name, data)
+    return buffer.tell()
+
+def chunk_set(files, params, threshold, layout=None):
+    chunks = {}
+    for name, data in files.items():
+        if len(data) < threshold:
+            chunks[f'file:{name}'] = len(data)
+            continue
+        for chunk_hash, start, end in chunk_data(data, params, layout if name.endswith('.mca') else None):
+            chunks[chunk_hash] = end - start
+    return chunks
+
+def run(regions, edits, sessions, seed, params, threshold):
+    rnd = random.Random(seed)
+    world = [SyntheticRegion(rnd) for _ in range(regions)]
+    files = {f'region/r.{index}.0.mca': region.to_bytes() for index, region in enumerate(world)}
+    files['level.dat'] = rnd.randbytes(2048)
+    total = sum(len(data) for data in files.values())
+    print(f'合成存档：{regions} 个区域文件，共 {total / 1e6:.1f} MB')
+
+    layouts = (None, REGION_LAYOUT)
+    previous = []
+    for layout, label in zip(layouts, ('内容切块', '区块布局')):
+        started = time.perf_counter()
+        previous.append(chunk_set(files, params, threshold, layout))
+        seconds = time.perf_counter() - started
+        print(f'{label}：首次切分 {len(previous[-1])} 块，{total / 1e6 / seconds:.1f} MB/s')
+    print(f'{"会话":>4} {"整个 ZIP":>12} {"整文件":>12} {"内容切块":>12} {"区块布局":>12}')
+    totals = [0, 0, 0, 0]
+    for session in range(1, sessions + 1):
+        # 一次会话：玩家在少数几个区域内活动，改写其中若干区块，并更新 level.dat
+        touched = rnd.sample(range(regions), max(1, regions // 4))
+        for _ in range(edits):
+            world[rnd.choice(touched)].edit(rnd.randrange(CHUNKS_PER_REGION), session)
+        new_files = {f'region/r.{index}.0.mca': region.to_bytes() for index, region in enumerate(world)}
+        new_files['level.dat'] = rnd.randbytes(2048)
+        whole_zip = zip_size(new_files)
+        whole_files = sum(len(data) for name, data in new_files.items() if files.get(name) != data)
+        changed = {name: data for name, data in new_files.items() if files.get(name) != data}
+        values = [whole_zip, whole_files]
+        for layout, known in zip(layouts, previous):
+            new_chunks = chunk_set(changed, params, threshold, layout)
+            values.append(sum(size for chunk_hash, size in new_chunks.items() if chunk_hash not in known))
+            known.update(new_chunks)
+        files = new_files
+        for index, value in enumerate(values):
+            totals[index] += value
+        print(f'{session:>4}', *(f'{value / 1e6:>10.2f}MB' for value in values))
+    print(f'{"合计":>4}', *(f'{value / 1e6:>10.2f}MB' for value in totals))
+    print(f'内容切块相对整个 ZIP 节省 {1 - totals[2] / totals[0]:.1%}，相对整文件节省 {1 - totals[2] / totals[1]:.1%}')
+    print(f'区块布局相对整个 ZIP 节省 {1 - totals[3] / totals[0]:.1%}，相对整文件节省 {1 - totals[3] / totals[1]:.1%}')
+
+def check_throughput(params, size, minimum, seed):
+    """对随机数据按内容切块，返回吞吐量是否达到 minimum MB/s"""
+    try:
+        import numpy  # noqa: F401
+        method = 'numpy'
+    except ImportError:
+        method = '纯 Python'
+    data = random.Random(seed).randbytes(size)
+    started = time.perf_counter()
+    chunk_boundaries(data, params)
+    throughput = size / 1e6 / (time.perf_counter() - started)
+    print(f'内容切块吞吐量（{method}）：{throughput:.1f} MB/s，要求至少 {minimum:.1f} MB/s')
+    if throughput < minimum:
+        print('吞吐量不足' + ('，安装 numpy 后切块会快很多' if method != 'numpy' else ''))
+        return False
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--regions', type=int, default=16)
+    parser.add_argument('--edits', type=int, default=40, help='每次会话改写的区块数')
+    parser.add_argument('--sessions', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--min-size', type=int)
+    parser.add_argument('--avg-size', type=int)
+    parser.add_argument('--max-size', type=int)
+    parser.add_argument('--threshold', type=int, default=DEFAULT_CHUNK_THRESHOLD)
+    parser.add_argument('--throughput-size', type=int, default=32 * 1024 * 1024, help='吞吐量检查使用的数据字节数')
+    parser.add_argument('--min-throughput', type=float, default=20.0, help='按内容切块的最低吞吐量（MB/s），0 表示不检查')
+    args = parser.parse_args(argv)
+    overrides = {key: value for key, value in (('min_size', args.min_size), ('avg_size', args.avg_size),
+                                               ('max_size', args.max_size)) if value}
+    params = chunk_params(overrides)
+    run(args.regions, args.edits, args.sessions, args.seed, params, args.threshold)
+    if args.min_throughput and not check_throughput(params, args.throughput_size, args.min_throughput, args.seed):
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
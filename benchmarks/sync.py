@@ -0,0 +1,226 @@
+"""同步性能基准：在本地模拟的 Google Drive 上测量压缩、上传、下载、解压与版本比较的耗时
+
+生成指定大小的合成存档（区域文件 + 玩家数据等小文件）和若干 MOD jar，
+通过 LocalDriveBackend 按设定的延迟与带宽执行真实的同步代码路径，不需要 Google 账号。
+
+在仓库根目录运行：
+    python -m benchmarks.sync --sizes 100M,1G --mods 300 --latency 0.05 --bandwidth 50M --json result.json
+    python -m benchmarks.sync --baseline result.json     # 与上次结果比较，变慢超过容差时退出码为 1
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+from contextlib import contextmanager
+
+REGION_FILE_SIZE = 6 * 1024 * 1024
+SMALL_FILES = 200
+BLOCK = 64 * 1024
+
+class StageError(RuntimeError):
+    pass
+
+def parse_size(text):
+    from mcgoogledrive.bandwidth import parse_rate
+    return parse_rate(text)
+
+def _synthetic_bytes(rnd, size):
+    """一半随机、一半零字节的数据，压缩率约 50%，与区域文件相近"""
+    half = BLOCK // 2
+    blocks = [rnd.randbytes(half) + bytes(half) for _ in range(size // BLOCK)]
+    return b''.join(blocks) + rnd.randbytes(size % BLOCK)
+
+def make_world(world_path, size, rnd):
+    """生成约 size 字节的合成存档"""
+    os.makedirs(os.path.join(world_path, 'region'), exist_ok=True)
+    os.makedirs(os.path.join(world_path, 'playerdata'), exist_ok=True)
+    with open(os.path.join(world_path, 'level.dat'), 'wb') as f:
+        f.write(rnd.randbytes(4096))
+    for index in range(SMALL_FILES):
+        with open(os.path.join(world_path, 'playerdata', f'{index:08x}.dat'), 'wb') as f:
+            f.write(_synthetic_bytes(rnd, rnd.randrange(1024, 16 * 1024)))
+    remaining = size
+    index = 0
+    while remaining > 0:
+        length = min(REGION_FILE_SIZE, remaining)
+        with open(os.path.join(world_path, 'region', f'r.{index % 64}.{index // 64}.mca'), 'wb') as f:
+            f.write(_synthetic_bytes(rnd, length))
+        remaining -= length
+        index += 1
+
+def make_mods(mods_path, count, rnd):
+    """生成 count 个 jar（已压缩的内容，大小 20KiB 到约 4MiB 不等）"""
+    os.makedirs(mods_path, exist_ok=True)
+    total = 0
+    for index in range(count):
+        size = int(min(4 * 1024 * 1024, 20 * 1024 * rnd.lognormvariate(1.5, 1.2)))
+        with open(os.path.join(mods_path, f'mod-{index:04d}.jar'), 'wb') as f:
+            f.write(rnd.randbytes(size))
+        total += size
+    return total
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+@contextmanager
+def stage(results, name):
+    """计时一个阶段；同步函数记录了 ERROR 日志时视为失败"""
+    from mcgoogledrive.cli import ErrorCollector
+    collector = ErrorCollector()
+    logging.getLogger().addHandler(collector)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logging.getLogger().removeHandler(collector)
+    results[name] = round(time.perf_counter() - started, 3)
+    if collector.errors:
+        raise StageError(f'{name} 失败：{collector.errors[0]}')
+    print(f'  {name:<28} {results[name]:>9.2f} s', flush=True)
+
+def run_size(workdir, size, args, rnd):
+    """对一种存档大小执行全部阶段，返回 {阶段: 秒}；同时按扫描、压缩、上传等步骤统计到 metrics 中"""
+    from mcgoogledrive.drive_sync import GoogleDriveSync
+    from mcgoogledrive.storage import LocalDriveBackend
+    from mcgoogledrive.file_operations import compress_folder, extract_zip, upload_file, download_file, upload_save, \
+        download_save, upload_save_incremental, download_save_incremental, upload_mod, download_mod, compare_versions
+
+    game = os.path.join(workdir, 'game')
+    other = os.path.join(workdir, 'other')
+    world = 'bench'
+    make_world(os.path.join(game, 'saves', world), size, rnd)
+    make_mods(os.path.join(game, 'mods'), args.mods, rnd)
+    backend = LocalDriveBackend(os.path.join(workdir, 'drive') if args.on_disk else None, latency=args.latency,
+                                upload_bandwidth=args.upload_bandwidth, download_bandwidth=args.download_bandwidth)
+    drive_sync = GoogleDriveSync()
+    drive_sync.use_backend(backend)
+    service, folder_id = drive_sync.service, drive_sync.folder_id
+
+    results = {}
+    zip_path = os.path.join(workdir, 'bench.zip')
+    with stage(results, 'compress'):
+        compress_folder(os.path.join(game, 'saves', world), zip_path)
+    with stage(results, 'extract'):
+        extract_zip(zip_path, os.path.join(workdir, 'extracted'))
+    with stage(results, 'upload_file'):
+        remote = upload_file(service, folder_id, zip_path, 'raw.zip')
+    with stage(results, 'download_file'):
+        download_file(service, remote['id'], os.path.join(workdir, 'raw.zip'), size=remote['size'])
+    os.remove(zip_path)
+    os.remove(os.path.join(workdir, 'raw.zip'))
+    shutil.rmtree(os.path.join(workdir, 'extracted'))
+
+    with stage(results, 'upload_save_zip'):
+        upload_save(service, folder_id, world, game, force=True)
+    with stage(results, 'upload_save_zip_streaming'):
+        upload_save(service, folder_id, world, game, streaming=True, force=True)
+    with stage(results, 'download_save_zip'):
+        download_save(service, folder_id, world, other, force=True)
+    with stage(results, 'download_save_zip_streaming'):
+        download_save(service, folder_id, world, other, streaming=True, force=True)
+    shutil.rmtree(other)
+
+    with stage(results, 'upload_incremental'):
+        upload_save_incremental(service, folder_id, world, game, force=True, retention=None)
+    with stage(results, 'upload_incremental_noop'):
+        upload_save_incremental(service, folder_id, world, game, retention=None)
+    with stage(results, 'download_incremental'):
+        download_save_incremental(service, folder_id, world, other, force=True)
+    with stage(results, 'compare'):
+        compare_versions(service, folder_id, world, game)
+
+    with stage(results, 'upload_mods'):
+        upload_mod(service, folder_id, game, force=True)
+    with stage(results, 'download_mods'):
+        download_mod(service, folder_id, other, force=True)
+    return results
+
+def compare_baseline(results, baseline, tolerance):
+    """返回比基线慢超过 tolerance（比例）的 [(大小, 阶段, 基线秒, 本次秒)]"""
+    regressions = []
+    for size, stages in results.items():
+        for name, seconds in stages.items():
+            before = baseline.get(size, {}).get(name)
+            # 很短的阶段波动大，不参与比较
+            if before and before >= 0.1 and seconds > before * (1 + tolerance):
+                regressions.append((size, name, before, seconds))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100M', help='逗号分隔的存档大小，例如 100M,1G,10G')
+    parser.add_argument('--mods', type=int, default=300, help='MOD jar 数量')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟每个请求的往返延迟（秒）')
+    parser.add_argument('--bandwidth', default='0', help='模拟上下行带宽（字节/秒，可写 50M），0 表示不限')
+    parser.add_argument('--upload-bandwidth', help='单独指定上行带宽')
+    parser.add_argument('--download-bandwidth', help='单独指定下行带宽')
+    parser.add_argument('--on-disk', action='store_true', help='模拟存储保存在磁盘上（10G 以上的存档需要）')
+    parser.add_argument('--workdir', help='工作目录（默认临时目录，结束后删除）')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='把结果（包括各步骤的耗时与字节数统计）写入该 JSON 文件')
+    parser.add_argument('--trace', help='把每次操作以 JSON Lines 写入该文件')
+    parser.add_argument('--baseline', help='与该 JSON 结果比较')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许比基线慢的比例（默认 0.2）')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出同步日志')
+    args = parser.parse_args(argv)
+    args.upload_bandwidth = parse_size(args.upload_bandwidth or args.bandwidth)
+    args.download_bandwidth = parse_size(args.download_bandwidth or args.bandwidth)
+    from mcgoogledrive.metrics import configure_metrics, reset as reset_metrics, snapshot as metrics_snapshot
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='mcgds-bench-'))
+    os.makedirs(workdir, exist_ok=True)
+    configure_metrics(trace_path=args.trace)
+    previous_cwd = os.getcwd()
+    rnd = random.Random(args.seed)
+    results = {}
+    metrics = {}
+    # 同步代码把文件索引与上传断点写在当前目录的 config/ 下
+    os.chdir(workdir)
+    try:
+        for size_text in args.sizes.split(','):
+            size = parse_size(size_text)
+            run_dir = os.path.join(workdir, size_text)
+            os.makedirs(run_dir, exist_ok=True)
+            print(f'存档 {size_text}（{size / 1e6:.0f} MB），MOD {args.mods} 个', flush=True)
+            reset_metrics()
+            results[size_text] = run_size(run_dir, size, args, rnd)
+            metrics[size_text] = metrics_snapshot()
+            shutil.rmtree(run_dir)
+    except StageError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        os.chdir(previous_cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'latency': args.latency, 'upload_bandwidth': args.upload_bandwidth,
+                        'download_bandwidth': args.download_bandwidth, 'mods': args.mods},
+        'results': results,
+        'metrics': metrics,
+    }
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare_baseline(results, baseline, args.tolerance)
+        for size, name, before, seconds in regressions:
+            print(f'变慢：{size} {name} {before:.2f} s -> {seconds:.2f} s（+{seconds / before - 1:.0%}）')
+        if regressions:
+            return 1
+        print('与基线相比没有超过容差的变慢')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
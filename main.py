@@ -1,10 +1,6 @@
-import logging
-import tkinter as tk
-from mcgoogledrive.ui import GoogleDriveSyncApp
+import sys
+from mcgoogledrive.cli import main
 
 if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-    logging.info('启动应用程序')
-    root = tk.Tk()
-    app = GoogleDriveSyncApp(root)
-    root.mainloop()
+    # 不带参数时启动图形界面，带参数时作为命令行使用（见 python -m mcgoogledrive --help）
+    sys.exit(main())
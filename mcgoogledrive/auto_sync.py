@@ -0,0 +1,170 @@
+import os
+import time
+import fnmatch
+import logging
+import threading
+from mcgoogledrive.file_operations import upload_save_paths, upload_mod, MODS_EXCLUDE
+from mcgoogledrive.scheduler import JobScheduler, PENDING
+
+# 同一存档的连续写入（区块保存时大量 .mca 改写）在该时间内合并为一次上传
+DEFAULT_DEBOUNCE = 5
+# 游戏仍在运行（session.lock 被占用）时，需要这么久没有写入才认为存档已静止
+DEFAULT_QUIESCENCE = 30
+POLL_INTERVAL = 1
+
+SESSION_LOCK = 'session.lock'
+# 本程序自己产生的临时文件
+IGNORED_SUFFIXES = ('.part', '.tmp')
+# 只读访问（opened / closed_no_write）不算变动
+WRITE_EVENTS = ('created', 'modified', 'deleted', 'moved', 'closed')
+
+def world_in_use(world_path):
+    """session.lock 被游戏锁定时返回 True；无法判断（文件不存在或平台不支持）时返回 False"""
+    lock_path = os.path.join(world_path, SESSION_LOCK)
+    try:
+        f = open(lock_path, 'rb')
+    except FileNotFoundError:
+        return False
+    except PermissionError:
+        return True
+    with f:
+        try:
+            import fcntl
+        except ImportError:
+            # Windows 上游戏持有的锁会让读取失败
+            try:
+                f.read(1)
+                return False
+            except PermissionError:
+                return True
+        try:
+            fcntl.lockf(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.lockf(f, fcntl.LOCK_UN)
+        return False
+
+class _Pending:
+    def __init__(self):
+        self.paths = set()
+        self.last_event = 0
+
+class AutoSync:
+    """监视 saves/<存档> 与 mods/，存档静止后只上传变动过的路径
+
+    - 文件事件按目标（存档名或 MOD）收集，debounce 秒内的连续写入合并为一次
+    - 存档 session.lock 已释放，或连续 quiescence 秒没有写入后才提交上传任务
+    - 存档按变动路径增量更新远端清单；MOD 仍打包为 mods.zip 上传
+    """
+
+    def __init__(self, service, folder_id, save_path, worlds, include_mods=False, scheduler=None,
+                 debounce=DEFAULT_DEBOUNCE, quiescence=DEFAULT_QUIESCENCE, upload_options=None, incremental_options=None):
+        self.service = service
+        self.folder_id = folder_id
+        self.save_path = save_path
+        self.saves_folder = os.path.abspath(os.path.join(save_path, 'saves'))
+        self.mods_folder = os.path.abspath(os.path.join(save_path, 'mods'))
+        self.patterns = worlds
+        self.include_mods = include_mods
+        self.scheduler = scheduler or JobScheduler(1)
+        self.debounce = debounce
+        self.quiescence = max(quiescence, debounce)
+        self.upload_options = upload_options or {}
+        self.incremental_options = incremental_options or {}
+        self._pending = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+
+    def start(self):
+        try:
+            from watchdog.observers import Observer
+        except ImportError:
+            raise RuntimeError('自动上传需要 watchdog，请先运行 pip install watchdog')
+        self._observer = Observer()
+        self._observer.schedule(self, self.saves_folder, recursive=True)
+        if self.include_mods and os.path.isdir(self.mods_folder):
+            self._observer.schedule(self, self.mods_folder, recursive=True)
+        self._observer.start()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logging.info('已开始监视存档 %s%s', ', '.join(self.patterns), '（含 MOD）' if self.include_mods else '')
+
+    def stop(self):
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread:
+            self._thread.join()
+        logging.info('已停止监视')
+
+    # watchdog 事件回调（Observer 只调用 dispatch，不必继承 FileSystemEventHandler）
+    def dispatch(self, event):
+        if event.event_type not in WRITE_EVENTS or (event.is_directory and event.event_type == 'modified'):
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        for path in filter(None, paths):
+            self.touch(os.fsdecode(path))
+
+    def touch(self, path):
+        """记录一个变动路径"""
+        path = os.path.abspath(path)
+        name = os.path.basename(path)
+        if name == SESSION_LOCK or name.endswith(IGNORED_SUFFIXES):
+            return
+        target = self._target(path)
+        if target is None:
+            return
+        with self._lock:
+            pending = self._pending.setdefault(target, _Pending())
+            pending.paths.add(path)
+            pending.last_event = time.monotonic()
+
+    def _target(self, path):
+        if path.startswith(self.mods_folder + os.sep):
+            if not self.include_mods or os.path.basename(path) in MODS_EXCLUDE:
+                return None
+            return 'mods'
+        if not path.startswith(self.saves_folder + os.sep):
+            return None
+        world = os.path.relpath(path, self.saves_folder).split(os.sep)[0]
+        # saves/<存档>.zip 等不在存档文件夹内的文件（ZIP 上传的临时文件）
+        if world == os.path.relpath(path, self.saves_folder):
+            return None
+        if not any(fnmatch.fnmatchcase(world, pattern) for pattern in self.patterns):
+            return None
+        return world
+
+    def _ready(self, target, pending, now):
+        job = self._jobs.get(target)
+        if job is not None and job.status == PENDING:
+            # 上一批还在排队时继续累积，避免被调度器当作重复任务合并而丢失路径
+            return False
+        idle = now - pending.last_event
+        if idle < self.debounce:
+            return False
+        if idle >= self.quiescence or target == 'mods':
+            return True
+        return not world_in_use(os.path.join(self.saves_folder, target))
+
+    def _run(self):
+        while not self._stop.wait(POLL_INTERVAL):
+            now = time.monotonic()
+            with self._lock:
+                ready = [(target, pending) for target, pending in self._pending.items() if self._ready(target, pending, now)]
+                for target, _ in ready:
+                    del self._pending[target]
+            for target, pending in ready:
+                self._submit(target, sorted(pending.paths))
+
+    def _submit(self, target, paths):
+        if target == 'mods':
+            job = self.scheduler.submit('自动上传 MOD', 'mods', upload_mod, self.service, self.folder_id, self.save_path,
+                                        **self.upload_options)
+        else:
+            job = self.scheduler.submit(f'自动上传存档 {target}', f'saves:{target}', upload_save_paths,
+                                        self.service, self.folder_id, target, self.save_path, paths, **self.incremental_options)
+        self._jobs[target] = job
@@ -0,0 +1,177 @@
+import time
+import logging
+import threading
+from mcgoogledrive.scheduler import check_cancelled
+from mcgoogledrive.metrics import stage
+
+UPLOAD = 'upload'
+DOWNLOAD = 'download'
+# 等待令牌时每隔这么久检查一次取消请求和新的限速值
+WAIT_INTERVAL = 0.5
+# 自适应分块：让每个请求耗时约 TARGET_REQUEST_SECONDS 秒
+TARGET_REQUEST_SECONDS = 4
+MIN_ADAPTIVE_SIZE = 256 * 1024
+MAX_ADAPTIVE_SIZE = 64 * 1024 * 1024
+# 吞吐量的指数移动平均系数
+THROUGHPUT_SMOOTHING = 0.3
+
+_limiters = {}
+_sizers = {}
+_adaptive = True
+_lock = threading.Lock()
+
+# 辅助函数
+
+def parse_rate(value):
+    """把 "2M"、"512K"、"1048576" 或数字解析为每秒字节数；0 或空表示不限速"""
+    if value in (None, ''):
+        return 0
+    if isinstance(value, (int, float)):
+        return max(0, int(value))
+    text = str(value).strip().upper().rstrip('B').rstrip('I')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return max(0, int(float(text[:-1]) * units[text[-1]]))
+    return max(0, int(float(text)))
+
+def format_rate(rate):
+    return f'{rate / 1024:.0f} KiB/s' if rate else '不限速'
+
+def get_limiter(direction):
+    """返回某个方向（上传 / 下载）所有传输共用的令牌桶"""
+    with _lock:
+        if direction not in _limiters:
+            _limiters[direction] = TokenBucket()
+        return _limiters[direction]
+
+def get_chunk_sizer(direction, initial):
+    """返回某个方向所有传输共用的自适应分块大小，关闭自适应时返回 None"""
+    with _lock:
+        if not _adaptive:
+            return None
+        if direction not in _sizers:
+            _sizers[direction] = AdaptiveChunkSize(initial)
+        return _sizers[direction]
+
+def configure_bandwidth(upload_limit=0, download_limit=0, adaptive=True):
+    """设置上传 / 下载限速与是否自适应调整分块大小，可在传输进行中随时调用"""
+    global _adaptive
+    get_limiter(UPLOAD).set_rate(parse_rate(upload_limit))
+    get_limiter(DOWNLOAD).set_rate(parse_rate(download_limit))
+    with _lock:
+        _adaptive = adaptive
+    logging.info('带宽限制：上传 %s，下载 %s', format_rate(get_limiter(UPLOAD).rate), format_rate(get_limiter(DOWNLOAD).rate))
+
+class TokenBucket:
+    """令牌桶限速器，多个线程共用同一个桶时总速率不超过 rate 字节/秒
+
+    传输完成后再扣除实际字节数；令牌可以暂时为负，调用方等到欠额补足后才发起下一个请求，
+    因此即使单个请求大于桶容量，长期平均速率也不超过限制。rate 为 0 时不限速。
+    """
+
+    def __init__(self, rate=0, burst=None):
+        self._cond = threading.Condition()
+        self.rate = 0
+        self.burst = 0
+        self._tokens = 0
+        self._updated = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate, burst=None):
+        """修改限速（字节/秒），正在等待的线程按新的速率重新计算等待时间"""
+        with self._cond:
+            self._refill()
+            self.rate = max(0, rate or 0)
+            # 默认允许一秒的突发
+            self.burst = burst or self.rate
+            self._tokens = min(self._tokens, self.burst)
+            if not self.rate:
+                self._tokens = 0
+            self._cond.notify_all()
+
+    def consume(self, count):
+        """扣除 count 个令牌，欠额未补足前阻塞；等待期间响应任务取消"""
+        with self._cond:
+            if not self.rate or count <= 0:
+                return
+            self._refill()
+            self._tokens -= count
+            while self._tokens < 0 and self.rate:
+                self._cond.wait(min(-self._tokens / self.rate, WAIT_INTERVAL))
+                check_cancelled()
+                self._refill()
+
+class AdaptiveChunkSize:
+    """按实测吞吐量调整每个请求传输的字节数，使单个请求耗时约 target 秒
+
+    请求很快完成时（往返延迟占比高）增大分块以提高吞吐；请求变慢时（限速、网络拥塞）减小分块，
+    让突发更短、取消和重试的代价更低。每次最多增大为原来的 2 倍，出错时减半，并按 alignment 对齐。
+    """
+
+    def __init__(self, initial, minimum=MIN_ADAPTIVE_SIZE, maximum=MAX_ADAPTIVE_SIZE, alignment=MIN_ADAPTIVE_SIZE,
+                 target=TARGET_REQUEST_SECONDS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.alignment = alignment
+        self.target = target
+        self.throughput = None
+        self._lock = threading.Lock()
+        self.size = self._clamp(initial)
+
+    def _clamp(self, size):
+        size = max(self.minimum, min(self.maximum, int(size)))
+        return max(self.alignment, size // self.alignment * self.alignment)
+
+    def record(self, count, seconds):
+        """记录一次请求传输的字节数与耗时（包括限速等待），返回调整后的分块大小"""
+        with self._lock:
+            if count <= 0 or seconds <= 0:
+                return self.size
+            throughput = count / seconds
+            # 变慢时立即采用新的测量值，变快时平滑上升，避免偶然的一次快速请求让分块过大
+            if self.throughput is None or throughput < self.throughput:
+                self.throughput = throughput
+            else:
+                self.throughput += THROUGHPUT_SMOOTHING * (throughput - self.throughput)
+            self.size = self._clamp(min(self.throughput * self.target, self.size * 2))
+            return self.size
+
+    def size_for(self, limiter):
+        """下一个请求的大小；限速时不超过 target 秒内允许传输的字节数，避免一次长时间的满速突发"""
+        with self._lock:
+            if limiter.rate:
+                return min(self.size, self._clamp(limiter.rate * self.target))
+            return self.size
+
+    def failed(self):
+        with self._lock:
+            self.size = self._clamp(self.size / 2)
+            return self.size
+
+def next_download_chunk(downloader):
+    """执行 MediaIoBaseDownload.next_chunk()：按实际下载的字节数限速，并调整下一次请求的大小"""
+    limiter = get_limiter(DOWNLOAD)
+    sizer = get_chunk_sizer(DOWNLOAD, downloader._chunksize)
+    if sizer:
+        downloader._chunksize = sizer.size_for(limiter)
+    progress = downloader._progress
+    started = time.monotonic()
+    try:
+        with stage(DOWNLOAD) as span:
+            status, done = downloader.next_chunk()
+            received = downloader._progress - progress
+            span.add(received)
+    except Exception:
+        if sizer:
+            sizer.failed()
+        raise
+    limiter.consume(received)
+    # 文件末尾不满一块的请求主要反映往返延迟，不用于估计吞吐量
+    if sizer and received >= downloader._chunksize:
+        sizer.record(received, time.monotonic() - started)
+    return status, done
@@ -0,0 +1,97 @@
+import time
+import logging
+from mcgoogledrive.scheduler import check_cancelled
+from mcgoogledrive.resumable import is_transient, backoff_delay, error_status, MAX_RETRIES
+
+# Google Drive 每个批量请求最多包含 100 个子请求
+MAX_BATCH_SIZE = 100
+
+class DriveBatch:
+    """把多个元数据请求（查询、创建、删除、更新属性）合并为 Drive 批量请求，减少往返次数
+
+    add() 收集请求，execute() 按 max_size 拆分后发送；整个批量请求的网络错误，
+    以及单个子请求的限流和服务端错误（429、5xx）按指数退避重试，重试时只重新发送失败的子请求。
+    批量请求不能包含文件内容的上传和下载。
+    """
+
+    def __init__(self, service, max_size=MAX_BATCH_SIZE, max_retries=MAX_RETRIES):
+        self.service = service
+        self.max_size = max(1, min(max_size, MAX_BATCH_SIZE))
+        self.max_retries = max_retries
+        self._requests = []
+
+    def __len__(self):
+        return len(self._requests)
+
+    def add(self, request, callback=None):
+        """添加一个请求（尚未 execute 的 HttpRequest），返回它在结果中的序号；callback(结果, 异常) 在 execute 时调用"""
+        self._requests.append((request, callback))
+        return len(self._requests) - 1
+
+    def execute(self):
+        """发送全部请求，返回与添加顺序一致的 [(结果, 异常)]，成功的子请求异常为 None
+
+        重试用尽或不可重试的子请求在结果中带有异常，由调用方决定如何处理；批量请求本身无法发送时直接抛出异常。
+        """
+        requests, self._requests = self._requests, []
+        results = [(None, None)] * len(requests)
+        pending = list(range(len(requests)))
+        attempt = 0
+        while pending:
+            check_cancelled()
+            failed = []
+            for start in range(0, len(pending), self.max_size):
+                failed += self._send(requests, pending[start:start + self.max_size], results)
+            if not failed or attempt >= self.max_retries:
+                break
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logging.warning('批量请求中 %d 个子请求出错（%s），%.1f 秒后第 %d 次重试',
+                            len(failed), results[failed[0]][1], delay, attempt)
+            time.sleep(delay)
+            pending = failed
+        for (_, callback), (response, error) in zip(requests, results):
+            if callback:
+                callback(response, error)
+        return results
+
+    def _send(self, requests, indexes, results):
+        """发送一组请求，记录结果，返回需要重试的序号"""
+        if len(indexes) == 1:
+            # 只有一个请求时直接发送，不必包装成批量请求
+            index = indexes[0]
+            try:
+                results[index] = (requests[index][0].execute(), None)
+            except Exception as e:
+                if error_status(e) is None and not is_transient(e):
+                    raise
+                results[index] = (None, e)
+            return [index] if is_transient(results[index][1]) else []
+
+        def record(index):
+            def callback(request_id, response, exception):
+                results[index] = (response, exception)
+            return callback
+
+        batch = self.service.new_batch_http_request()
+        for index in indexes:
+            batch.add(requests[index][0], callback=record(index))
+        try:
+            batch.execute()
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            for index in indexes:
+                results[index] = (None, e)
+        return [index for index in indexes if results[index][1] is not None and is_transient(results[index][1])]
+
+def execute_batch(service, requests, max_size=MAX_BATCH_SIZE, max_retries=MAX_RETRIES):
+    """以批量请求执行 requests，返回结果列表；有子请求最终失败时抛出第一个异常"""
+    batch = DriveBatch(service, max_size=max_size, max_retries=max_retries)
+    for request in requests:
+        batch.add(request)
+    results = batch.execute()
+    for _, error in results:
+        if error is not None:
+            raise error
+    return [response for response, _ in results]
@@ -0,0 +1,153 @@
+import bisect
+import random
+import hashlib
+from collections import namedtuple
+from mcgoogledrive.region import region_boundaries, is_region_file, REGION_LAYOUT
+from mcgoogledrive.metrics import stage, CHUNK
+
+ChunkParams = namedtuple('ChunkParams', ['min_size', 'avg_size', 'max_size'])
+
+# 区域文件按 4KiB 扇区存储区块，单个区块压缩后通常只有几 KiB 到几十 KiB
+DEFAULT_CHUNK_PARAMS = ChunkParams(min_size=16 * 1024, avg_size=64 * 1024, max_size=256 * 1024)
+# 小于该大小的文件仍整体作为一个数据块存储
+DEFAULT_CHUNK_THRESHOLD = 1024 * 1024
+# 配置项 chunking 的默认值，设为 null 时关闭切块；region 为 false 时区域文件也按内容切块
+DEFAULT_CHUNKING = dict(DEFAULT_CHUNK_PARAMS._asdict(), threshold=DEFAULT_CHUNK_THRESHOLD, region=True)
+
+_MASK64 = (1 << 64) - 1
+# Gear 表必须固定，否则同样的内容在不同进程中会切出不同的块
+_rng = random.Random(0x6d63676473)
+_GEAR = [_rng.getrandbits(64) for _ in range(256)]
+del _rng
+# Gear 哈希只与最近 64 个字节有关；numpy 按块计算窗口哈希，每块 1MiB
+_WINDOW = 64
+_WINDOW_BLOCK = 1024 * 1024
+
+def chunk_params(value=None):
+    """从配置或清单中的 dict 得到切块参数"""
+    if not value:
+        return DEFAULT_CHUNK_PARAMS
+    if isinstance(value, ChunkParams):
+        return value
+    params = DEFAULT_CHUNK_PARAMS._replace(**{key: int(value[key]) for key in ChunkParams._fields if key in value})
+    if not params.min_size <= params.avg_size <= params.max_size or params.avg_size & (params.avg_size - 1):
+        raise ValueError(f'切块参数无效：{params}（需满足 min <= avg <= max，且 avg 为 2 的幂）')
+    return params
+
+def _masks(avg_size):
+    # 归一化切块（FastCDC）：未到平均长度时用更严格的掩码，超过后用更宽松的掩码，使块长集中在平均值附近
+    bits = avg_size.bit_length() - 1
+    strict = ((1 << (bits + 1)) - 1) << (64 - bits - 1)
+    loose = ((1 << (bits - 1)) - 1) << (64 - bits + 1)
+    return strict, loose
+
+def _scan(data, i, normal, stop, strict, loose):
+    """从 i 起逐字节计算 Gear 哈希直到 stop，返回第一个切点，没有则返回 None"""
+    gear = _GEAR
+    mask64 = _MASK64
+    h = 0
+    for mask, limit in ((strict, min(normal, stop)), (loose, stop)):
+        for byte in data[i:limit]:
+            h = ((h << 1) + gear[byte]) & mask64
+            i += 1
+            if not h & mask:
+                return i
+    return None
+
+def _window_cuts(data, strict, loose):
+    """用 numpy 一次算出每个位置的 64 字节窗口 Gear 哈希，返回满足严格、宽松掩码的切点列表；没有 numpy 时返回 None
+
+    哈希每次左移一位后截断到 64 位，只与最近 64 个字节有关，因此可以按窗口整体计算：
+    每轮把相隔 1、2、4…32 个字节的部分和移位相加，6 轮即得到完整窗口，与逐字节计算的结果一致。
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    gear = np.array(_GEAR, dtype=np.uint64)
+    strict, loose = np.uint64(strict), np.uint64(loose)
+    size = len(data)
+    strict_cuts, loose_cuts = [], []
+    for block in range(0, size, _WINDOW_BLOCK):
+        # 每段向前多取 63 个字节，使段首位置的窗口也是完整的
+        lo = max(0, block - _WINDOW + 1)
+        hi = min(block + _WINDOW_BLOCK, size)
+        h = gear[np.frombuffer(data, dtype=np.uint8, count=hi - lo, offset=lo)]
+        shift = 1
+        while shift < _WINDOW:
+            h[shift:] += h[:-shift] << np.uint64(shift)
+            shift *= 2
+        h = h[block - lo:]
+        # 严格掩码包含宽松掩码的所有位，只需在宽松命中的位置中再筛选；位置 j 处命中时切点在 j + 1
+        hits = np.flatnonzero((h & loose) == 0)
+        loose_cuts.extend((hits + block + 1).tolist())
+        strict_cuts.extend((hits[(h[hits] & strict) == 0] + block + 1).tolist())
+    return strict_cuts, loose_cuts
+
+def _next_cut(cuts, lo, hi):
+    index = bisect.bisect_left(cuts, lo)
+    if index < len(cuts) and cuts[index] <= hi:
+        return cuts[index]
+    return None
+
+def chunk_boundaries(data, params=DEFAULT_CHUNK_PARAMS):
+    """用 Gear 滚动哈希按内容切块，返回每个块的 (起始, 结束) 偏移
+
+    切点只取决于附近的内容，文件中间插入或改写几个区块后，其余块的边界和哈希保持不变。
+    安装了 numpy 时向量化计算哈希，切出的块与纯 Python 计算完全相同。
+    """
+    min_size, avg_size, max_size = params
+    strict, loose = _masks(avg_size)
+    size = len(data)
+    cuts = _window_cuts(data, strict, loose) if size > min_size else None
+    boundaries = []
+    start = 0
+    while start < size:
+        end = min(start + max_size, size)
+        if end - start <= min_size:
+            boundaries.append((start, end))
+            break
+        # 前 min_size 字节内不会切块，不必计算哈希
+        i = start + min_size
+        normal = min(start + avg_size, end)
+        if cuts is None:
+            cut = _scan(data, i, normal, end, strict, loose)
+        else:
+            # 哈希从 i 处清零，前 63 个位置的窗口不完整，逐字节计算；之后与整体算出的窗口哈希相同
+            head = min(i + _WINDOW - 1, end)
+            cut = _scan(data, i, normal, head, strict, loose)
+            if cut is None and head < normal:
+                cut = _next_cut(cuts[0], head + 1, normal)
+            if cut is None:
+                cut = _next_cut(cuts[1], max(head, normal) + 1, end)
+        cut = cut or end
+        boundaries.append((start, cut))
+        start = cut
+    return boundaries
+
+def _hash_chunks(data, boundaries):
+    view = memoryview(data)
+    return [(hashlib.sha256(view[start:end]).hexdigest(), start, end) for start, end in boundaries]
+
+def chunk_data(data, params=DEFAULT_CHUNK_PARAMS, layout=None):
+    """返回 [(块哈希, 起始, 结束)]；layout 为 'region' 时优先按区域文件的区块布局切分"""
+    with stage(CHUNK) as span:
+        span.add(len(data))
+        boundaries = region_boundaries(data, params) if layout == REGION_LAYOUT else None
+        if boundaries is None:
+            boundaries = chunk_boundaries(data, params)
+        return _hash_chunks(data, boundaries)
+
+def chunk_file(file_path, params=DEFAULT_CHUNK_PARAMS, region=True):
+    """读取文件并切块，返回 (文件内容, [(块哈希, 起始, 结束)], 布局)
+
+    region 为 True 时 .mca 文件按区块布局切分（布局为 'region'），头部无法解析时退回按内容切块（布局为 None）。
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    with stage(CHUNK) as span:
+        span.add(len(data))
+        boundaries = region_boundaries(data, params) if region and is_region_file(file_path) else None
+        if boundaries is not None:
+            return data, _hash_chunks(data, boundaries), REGION_LAYOUT
+        return data, _hash_chunks(data, chunk_boundaries(data, params)), None
@@ -0,0 +1,372 @@
+import os
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+from datetime import datetime
+from functools import partial
+from mcgoogledrive.config import load_config, upload_options, download_options, batch_options, incremental_options, \
+    bandwidth_options, metrics_options
+from mcgoogledrive.bandwidth import configure_bandwidth, parse_rate
+from mcgoogledrive.metrics import configure_metrics, is_enabled as metrics_enabled, snapshot as metrics_snapshot, \
+    start_metrics_server
+from mcgoogledrive.utils import setup_logging
+from mcgoogledrive.scheduler import JobScheduler, DONE, FAILED, CANCELLED, DEFAULT_MAX_WORKERS
+from mcgoogledrive.folder_scan import DEFAULT_MAX_AGE
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_AUTH = 3
+EXIT_CANCELLED = 130
+
+DEFAULT_DAEMON_INTERVAL = 600
+
+class ErrorCollector(logging.Handler):
+    """收集同步期间的 ERROR 日志：同步函数出错时只记录日志，命令行据此判断成功与否"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.errors = []
+
+    def emit(self, record):
+        self.errors.append(record.getMessage())
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'无法序列化 {type(value).__name__}')
+
+def output(args, result, text=None):
+    """--json 时向标准输出写一行 JSON，否则输出可读文本（日志写在标准错误）"""
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, default=_json_default), flush=True)
+    elif text:
+        print(text, flush=True)
+
+def run_job(scheduler, name, target, fn, *args, **kwargs):
+    """通过调度器运行一个同步任务并等待结束，Ctrl-C 时取消任务"""
+    collector = ErrorCollector()
+    logging.getLogger().addHandler(collector)
+    started = time.monotonic()
+    job = scheduler.submit(name, target, fn, *args, **kwargs)
+    try:
+        while True:
+            try:
+                status = scheduler.wait(job)
+                break
+            except KeyboardInterrupt:
+                logging.warning('收到中断信号，正在取消任务')
+                scheduler.cancel(job.id)
+    finally:
+        logging.getLogger().removeHandler(collector)
+    if status == DONE and collector.errors:
+        status = FAILED
+    return {
+        'job': name,
+        'target': target,
+        'status': status,
+        'ok': status == DONE,
+        'errors': collector.errors,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+def exit_code(result):
+    if result['ok']:
+        return EXIT_OK
+    return EXIT_CANCELLED if result['status'] == CANCELLED else EXIT_FAILED
+
+def apply_bandwidth(args, config):
+    """按配置（命令行参数优先）设置限速；守护进程收到 SIGHUP 时重新读取配置再次调用"""
+    options = bandwidth_options(config)
+    if args.upload_limit is not None:
+        options['upload_limit'] = args.upload_limit
+    if args.download_limit is not None:
+        options['download_limit'] = args.download_limit
+    configure_bandwidth(**options)
+
+def apply_metrics(args, config):
+    """按配置开启阶段统计；--trace 或 --metrics-port 也会开启统计"""
+    options = metrics_options(config)
+    if args.trace:
+        options.update(enabled=True, trace_path=args.trace)
+    if metrics_port(args, config):
+        options['enabled'] = True
+    configure_metrics(**options)
+
+def metrics_port(args, config):
+    """daemon / watch 提供 Prometheus 指标的端口（命令行参数优先），未设置时返回 None"""
+    if args.command not in ('daemon', 'watch'):
+        return None
+    return args.metrics_port or config.get('metrics_port')
+
+def format_metrics(stats):
+    """每个阶段一行：次数、累计耗时、字节数与吞吐量"""
+    return [f'  {name:<9}{item["count"]:>6} 次{item["seconds"]:>9.2f} 秒{item["bytes"]:>14} bytes'
+            f'{item["throughput"] / 1e6:>9.1f} MB/s' + (f'，重试 {item["retries"]} 次' if item['retries'] else '')
+            for name, item in stats.items()]
+
+def serve_metrics(args, config):
+    port = metrics_port(args, config)
+    if port:
+        start_metrics_server(port, config.get('metrics_host', '127.0.0.1'))
+
+def reload_on_sighup(args):
+    """SIGHUP 时重新读取 config.json 并应用新的限速，不中断正在进行的传输"""
+    if not hasattr(signal, 'SIGHUP'):
+        return
+
+    def handle_signal(signum, frame):
+        logging.info('收到 SIGHUP，重新读取带宽配置')
+        try:
+            apply_bandwidth(args, load_config())
+        except ValueError as e:
+            logging.warning('带宽配置无效，保持原来的限速：%s', e)
+    signal.signal(signal.SIGHUP, handle_signal)
+
+# 子命令
+
+def connect(interactive=False, local_drive=None):
+    """连接 Google Drive；指定 local_drive 时改用该目录中的本地模拟存储（测试与基准测试用，不需要授权）"""
+    from mcgoogledrive.drive_sync import GoogleDriveSync
+    drive_sync = GoogleDriveSync()
+    if local_drive:
+        from mcgoogledrive.storage import LocalDriveBackend
+        drive_sync.use_backend(LocalDriveBackend(local_drive))
+        return drive_sync
+    drive_sync.bind_google_drive(interactive=interactive)
+    return drive_sync
+
+def sync_job(args, config, direction):
+    """返回 (任务名, 目标, 函数, 参数)：上传 / 下载存档或 MOD"""
+    from mcgoogledrive.file_operations import upload_saves, download_saves, upload_mod, download_mod, parse_world_patterns
+    options = upload_options(config) if direction == 'upload' else download_options(config)
+    if args.force:
+        options['force'] = True
+    if args.what == 'mods':
+        fn = upload_mod if direction == 'upload' else download_mod
+        return f'{direction} mods', 'mods', partial(fn, **options), (args.save_path,)
+    patterns = parse_world_patterns(args.world)
+    if direction == 'upload':
+        fn = partial(upload_saves, **batch_options(config), **options, **incremental_options(config))
+    else:
+        fn = partial(download_saves, **batch_options(config), **options)
+    return f'{direction} saves', f'saves:{",".join(patterns)}', fn, (args.save_path, patterns)
+
+def cmd_sync(args, config, drive_sync):
+    scheduler = JobScheduler(1)
+    name, target, fn, fn_args = sync_job(args, config, args.command)
+    result = run_job(scheduler, name, target, fn, drive_sync.service, drive_sync.folder_id, *fn_args)
+    text = f'{name}: {result["status"]}（{result["seconds"]} 秒）'
+    if metrics_enabled():
+        result['metrics'] = metrics_snapshot()
+        text = '\n'.join([text, *format_metrics(result['metrics'])])
+    output(args, result, text)
+    return exit_code(result)
+
+def cmd_list(args, config, drive_sync):
+    files = drive_sync.list_files()
+    lines = [f'{file["name"]}\t{file.get("size", "-")}\t{file.get("modifiedTime", "-")}' for file in files]
+    output(args, {'ok': True, 'files': files}, '\n'.join(lines))
+    return EXIT_OK
+
+def cmd_compare(args, config, drive_sync):
+    from mcgoogledrive.file_operations import compare_versions
+    result = compare_versions(drive_sync.service, drive_sync.folder_id, args.world, args.save_path,
+                              incremental=config.get('incremental_sync', True),
+                              max_age=config.get('scan_cache_seconds', DEFAULT_MAX_AGE))
+    lines = []
+    for item, sides in result.items():
+        for side, info in sides.items():
+            if info:
+                lines.append(f'{item}\t{side}\t{info["modified_time"].strftime("%Y-%m-%d %H:%M:%S")}\t{info["size"]} bytes')
+            else:
+                lines.append(f'{item}\t{side}\t未找到')
+    ok = all(info for sides in result.values() for info in sides.values())
+    output(args, {'ok': ok, **result}, '\n'.join(lines))
+    return EXIT_OK if ok else EXIT_FAILED
+
+def cmd_daemon(args, config, drive_sync):
+    """常驻运行：每隔 interval 秒执行一次同步，SIGTERM / SIGINT 时取消当前任务并退出"""
+    scheduler = JobScheduler(config.get('max_concurrent_jobs', DEFAULT_MAX_WORKERS))
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logging.info('收到退出信号，停止守护进程')
+        stop.set()
+        scheduler.cancel()
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    reload_on_sighup(args)
+    serve_metrics(args, config)
+
+    interval = args.interval or config.get('daemon_interval', DEFAULT_DAEMON_INTERVAL)
+    logging.info('守护进程已启动，每 %s 秒%s一次', interval, '上传' if args.direction == 'upload' else '下载')
+    failures = 0
+    while not stop.is_set():
+        name, target, fn, fn_args = sync_job(args, config, args.direction)
+        result = run_job(scheduler, name, target, fn, drive_sync.service, drive_sync.folder_id, *fn_args)
+        failures = 0 if result['ok'] else failures + 1
+        output(args, result, f'{datetime.now():%Y-%m-%d %H:%M:%S} {name}: {result["status"]}')
+        stop.wait(interval)
+    scheduler.shutdown()
+    return EXIT_OK if failures == 0 else EXIT_FAILED
+
+def cmd_snapshots(args, config, drive_sync):
+    """列出、恢复、按保留策略清理存档快照，或回收未被引用的数据块"""
+    from mcgoogledrive.content_store import ContentStore
+    from mcgoogledrive.snapshots import SnapshotStore
+    from mcgoogledrive.file_operations import restore_snapshot
+    snapshots = SnapshotStore(ContentStore(drive_sync.service, drive_sync.folder_id))
+    if args.action == 'list':
+        items = snapshots.list(args.world if args.world != '*' else None)
+        result = [{'target': target, 'time': when, 'size': int(file.get('size', 0))} for target, when, file in items]
+        lines = [f'{item["target"]}\t{item["time"].astimezone():%Y-%m-%d %H:%M:%S}' for item in result]
+        output(args, {'ok': True, 'snapshots': result}, '\n'.join(lines))
+        return EXIT_OK
+    if args.action == 'restore':
+        when = datetime.fromisoformat(args.at).astimezone() if args.at else None
+        scheduler = JobScheduler(1)
+        result = run_job(scheduler, 'restore snapshot', f'saves:{args.world}', restore_snapshot,
+                         drive_sync.service, drive_sync.folder_id, args.world, args.save_path, when)
+        output(args, result, f'restore snapshot: {result["status"]}')
+        return exit_code(result)
+    if args.action == 'prune':
+        deleted = snapshots.prune(args.world, incremental_options(config)['retention'] or {})
+        output(args, {'ok': True, 'deleted': deleted}, f'删除了 {deleted} 个旧快照')
+        return EXIT_OK
+    deleted = snapshots.collect_garbage()
+    output(args, {'ok': True, 'deleted': deleted}, f'回收了 {deleted} 个数据块')
+    return EXIT_OK
+
+def cmd_watch(args, config, drive_sync):
+    """监视存档文件夹，存档静止后自动增量上传变动的文件，直到收到 SIGTERM / SIGINT"""
+    from mcgoogledrive.auto_sync import AutoSync, DEFAULT_DEBOUNCE, DEFAULT_QUIESCENCE
+    from mcgoogledrive.file_operations import parse_world_patterns
+    scheduler = JobScheduler(config.get('max_concurrent_jobs', DEFAULT_MAX_WORKERS))
+    auto_sync = AutoSync(drive_sync.service, drive_sync.folder_id, args.save_path, parse_world_patterns(args.world),
+                         include_mods=args.mods, scheduler=scheduler, upload_options=upload_options(config),
+                         incremental_options=incremental_options(config),
+                         debounce=args.debounce or config.get('auto_upload_debounce', DEFAULT_DEBOUNCE),
+                         quiescence=args.quiescence or config.get('auto_upload_quiescence', DEFAULT_QUIESCENCE))
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        stop.set()
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    reload_on_sighup(args)
+    serve_metrics(args, config)
+
+    auto_sync.start()
+    stop.wait()
+    auto_sync.stop()
+    scheduler.cancel()
+    scheduler.shutdown()
+    return EXIT_OK
+
+def cmd_gui(args, config):
+    # 只有图形界面才导入 Tk，命令行和守护进程在无显示器的服务器上也能运行
+    import tkinter as tk
+    from mcgoogledrive.ui import GoogleDriveSyncApp
+    logging.info('启动应用程序')
+    root = tk.Tk()
+    GoogleDriveSyncApp(root)
+    root.mainloop()
+    return EXIT_OK
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m mcgoogledrive', description='Minecraft 存档与 MOD 的 Google Drive 同步工具')
+    parser.add_argument('-C', dest='workdir', help='先切换到该目录（config/ 所在目录）再运行')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果（每个结果一行）')
+    parser.add_argument('-q', '--quiet', action='store_true', help='只输出警告和错误日志')
+    parser.add_argument('--local-drive', metavar='DIR', help='使用该目录中的本地模拟存储代替 Google Drive（测试用，默认取配置中的 local_drive）')
+    parser.add_argument('--upload-limit', type=parse_rate, help='上传限速，每秒字节数，可写作 2M、512K，0 表示不限速（默认取配置中的 upload_rate_limit）')
+    parser.add_argument('--download-limit', type=parse_rate, help='下载限速（默认取配置中的 download_rate_limit）')
+    parser.add_argument('--trace', metavar='FILE', help='统计各阶段耗时，并把每次操作以 JSON Lines 追加写入该文件')
+    commands = parser.add_subparsers(dest='command')
+
+    def add_target_arguments(sub):
+        sub.add_argument('what', nargs='?', choices=['saves', 'mods'], default='saves')
+        sub.add_argument('-w', '--world', help='存档名，可用逗号分隔多个或使用通配符（默认取配置中的 save_folder）')
+        sub.add_argument('-p', '--save-path', help='游戏文件夹（默认取配置中的 save_path）')
+        sub.add_argument('-f', '--force', action='store_true', help='即使没有变化也执行同步')
+
+    commands.add_parser('gui', help='启动图形界面（默认）')
+    commands.add_parser('bind', help='在浏览器中授权并绑定 Google Drive')
+    commands.add_parser('list', help='列出专属文件夹中的文件')
+    add_target_arguments(commands.add_parser('upload', help='上传存档或 MOD'))
+    add_target_arguments(commands.add_parser('download', help='下载存档或 MOD'))
+    compare = commands.add_parser('compare', help='比较本地与 Google Drive 的版本')
+    compare.add_argument('-w', '--world', help='存档名（默认取配置中的 save_folder）')
+    compare.add_argument('-p', '--save-path', help='游戏文件夹（默认取配置中的 save_path）')
+    daemon = commands.add_parser('daemon', help='常驻运行，定时同步')
+    daemon.add_argument('direction', choices=['upload', 'download'])
+    add_target_arguments(daemon)
+    daemon.add_argument('-i', '--interval', type=float, help=f'同步间隔秒数（默认取配置中的 daemon_interval 或 {DEFAULT_DAEMON_INTERVAL}）')
+    daemon.add_argument('--metrics-port', type=int, help='在该端口提供 Prometheus 文本格式的 /metrics（默认取配置中的 metrics_port）')
+    snapshots = commands.add_parser('snapshots', help='管理存档的历史快照')
+    snapshots.add_argument('action', choices=['list', 'restore', 'prune', 'gc'])
+    snapshots.add_argument('-w', '--world', help='存档名（默认取配置中的 save_folder；list 时可用 * 列出全部）')
+    snapshots.add_argument('-p', '--save-path', help='游戏文件夹（默认取配置中的 save_path）')
+    snapshots.add_argument('--at', help='恢复该时间或之前最近的快照，例如 "2026-10-13 20:00"（默认最新）')
+    watch = commands.add_parser('watch', help='监视存档，静止后自动上传变动的文件')
+    watch.add_argument('-w', '--world', help='存档名，可用逗号分隔多个或使用通配符（默认取配置中的 save_folder）')
+    watch.add_argument('-p', '--save-path', help='游戏文件夹（默认取配置中的 save_path）')
+    watch.add_argument('--mods', action='store_true', help='同时监视 mods 文件夹')
+    watch.add_argument('--debounce', type=float, help='合并连续写入的时间窗口（秒）')
+    watch.add_argument('--quiescence', type=float, help='游戏运行时需要多久没有写入才上传（秒）')
+    watch.add_argument('--metrics-port', type=int, help='在该端口提供 Prometheus 文本格式的 /metrics（默认取配置中的 metrics_port）')
+    return parser
+
+COMMANDS = {
+    'upload': cmd_sync,
+    'download': cmd_sync,
+    'list': cmd_list,
+    'compare': cmd_compare,
+    'daemon': cmd_daemon,
+    'watch': cmd_watch,
+    'snapshots': cmd_snapshots,
+}
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.workdir:
+        os.chdir(args.workdir)
+    setup_logging()
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+    config = load_config()
+    if args.command in (None, 'gui'):
+        return cmd_gui(args, config)
+    try:
+        apply_bandwidth(args, config)
+    except ValueError as e:
+        logging.error('带宽配置无效：%s', e)
+        return EXIT_USAGE
+    apply_metrics(args, config)
+
+    if hasattr(args, 'world'):
+        args.world = args.world or config.get('save_folder')
+        args.save_path = args.save_path or config.get('save_path')
+        if not args.save_path or (not args.world and getattr(args, 'what', 'saves') == 'saves'):
+            logging.error('缺少游戏文件夹或存档名，请通过参数指定或先在图形界面中保存配置')
+            return EXIT_USAGE
+
+    try:
+        drive_sync = connect(interactive=args.command == 'bind', local_drive=args.local_drive or config.get('local_drive'))
+    except Exception as e:
+        output(args, {'ok': False, 'status': 'unauthorized', 'errors': [str(e)]})
+        return EXIT_AUTH
+    if args.command == 'bind':
+        output(args, {'ok': True, 'folder_id': drive_sync.folder_id}, f'已绑定，文件夹 ID: {drive_sync.folder_id}')
+        return EXIT_OK
+    try:
+        return COMMANDS[args.command](args, config, drive_sync)
+    except Exception as e:
+        logging.error('执行 %s 时出错：%s', args.command, e)
+        output(args, {'ok': False, 'status': FAILED, 'errors': [str(e)]})
+        return EXIT_FAILED
@@ -0,0 +1,161 @@
+import os
+import zlib
+import zipfile
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from mcgoogledrive.scheduler import check_cancelled
+
+DEFAULT_COMPRESS_LEVEL = 6
+# 本身已经压缩过的格式：区域文件 (zlib)、NBT (gzip)、jar/zip、图片与音频
+STORE_EXTENSIONS = {
+    '.mca', '.mcc', '.mcr', '.dat', '.dat_old', '.nbt', '.jar', '.zip', '.gz', '.xz', '.7z',
+    '.png', '.jpg', '.jpeg', '.ogg', '.mp3',
+}
+# 文本类文件压缩收益高，使用最高压缩级别
+TEXT_EXTENSIONS = {'.json', '.json5', '.txt', '.toml', '.cfg', '.conf', '.properties', '.mcmeta', '.log', '.yml', '.yaml'}
+ENTROPY_SAMPLE_SIZE = 64 * 1024
+# 采样压缩后体积仍高于原始体积的该比例时，视为不可压缩
+INCOMPRESSIBLE_RATIO = 0.9
+# 超过该大小的文件不在内存中整体压缩，而是交给 zipfile 顺序流式写入
+MAX_PARALLEL_FILE_SIZE = 64 * 1024 * 1024
+# 已读入内存、等待写入 ZIP 的数据总量上限（单个条目超过上限时仍允许在途）
+MAX_INFLIGHT_BYTES = 128 * 1024 * 1024
+READ_BLOCK_SIZE = 1024 * 1024
+
+def default_workers():
+    """默认压缩线程数：CPU 核心数"""
+    return os.cpu_count() or 1
+
+class CompressionPolicy:
+    """为每个文件选择压缩方式：先按扩展名判断，未知扩展名则对文件开头采样试压缩
+
+    overrides 为 扩展名 -> 'store' / 'deflate' / 'deflate:<级别>' 的映射（对应 config.json 的 compression_policy），
+    选择结果体现在 ZIP 条目的压缩方式字段中，解压时无需额外信息。
+    """
+
+    def __init__(self, overrides=None, level=DEFAULT_COMPRESS_LEVEL, sample=True):
+        self.level = level
+        self.sample = sample
+        self.overrides = {ext.lower(): parse_policy(rule) for ext, rule in (overrides or {}).items()}
+
+    def choose(self, file_path):
+        """返回 (压缩方式, 压缩级别)"""
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext in self.overrides:
+            return self.overrides[ext]
+        if ext in STORE_EXTENSIONS:
+            return zipfile.ZIP_STORED, None
+        if ext in TEXT_EXTENSIONS:
+            return zipfile.ZIP_DEFLATED, 9
+        if self.sample and is_incompressible(file_path):
+            return zipfile.ZIP_STORED, None
+        return zipfile.ZIP_DEFLATED, self.level
+
+def parse_policy(rule):
+    """解析 'store' / 'deflate' / 'deflate:<级别>' 形式的规则"""
+    name, _, level = rule.partition(':')
+    if name == 'store':
+        return zipfile.ZIP_STORED, None
+    if name == 'deflate':
+        return zipfile.ZIP_DEFLATED, int(level) if level else DEFAULT_COMPRESS_LEVEL
+    raise ValueError(f'未知的压缩规则：{rule}')
+
+def is_incompressible(file_path):
+    """对文件开头采样，用最快级别试压缩判断是否值得压缩"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(ENTROPY_SAMPLE_SIZE)
+    if len(sample) < 512:
+        return False
+    return len(zlib.compress(sample, 1)) > len(sample) * INCOMPRESSIBLE_RATIO
+
+def compress_entry(file_path, compress_type=zipfile.ZIP_DEFLATED, level=DEFAULT_COMPRESS_LEVEL):
+    """读取并压缩单个文件，返回 (压缩后数据, CRC32, 原始大小)
+
+    zlib 在压缩和计算 CRC 时会释放 GIL，因此多个线程可以真正并行。
+    """
+    crc = 0
+    size = 0
+    parts = []
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if compress_type == zipfile.ZIP_DEFLATED else None
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            parts.append(compressor.compress(block) if compressor else block)
+    if compressor:
+        parts.append(compressor.flush())
+    return b''.join(parts), crc, size
+
+# 写入预先压缩好的条目要用到的 ZipFile 内部属性，CPython 3.6 起一直如此；缺少任何一个时退回 ZipFile.write
+_RAW_WRITE_ATTRS = ('_lock', '_writecheck', '_didModify', '_writing', 'fp', 'filelist', 'NameToInfo', 'start_dir')
+
+def supports_raw_write(zip_ref):
+    """当前 Python 的 ZipFile 是否提供 write_compressed_entry 依赖的内部属性"""
+    return all(hasattr(zip_ref, name) for name in _RAW_WRITE_ATTRS) and hasattr(zipfile.ZipInfo, 'FileHeader')
+
+def write_compressed_entry(zip_ref, zinfo, data, crc, size):
+    """把已压缩好的数据作为一个条目写入 ZipFile
+
+    CRC 和大小在写入本地文件头之前已知，因此即使输出流不可 seek 也不需要数据描述符。
+    zipfile 没有公开写入预压缩数据的接口，这里直接使用其内部属性，调用前需用 supports_raw_write 检查。
+    """
+    zinfo.CRC = crc
+    zinfo.file_size = size
+    zinfo.compress_size = len(data)
+    zinfo.flag_bits &= ~0x08
+    with zip_ref._lock:
+        if zip_ref._writing:
+            raise ValueError('ZipFile 中还有未关闭的写入句柄')
+        zip_ref._writecheck(zinfo)
+        zip_ref._didModify = True
+        zinfo.header_offset = zip_ref.fp.tell()
+        zip_ref.fp.write(zinfo.FileHeader())
+        zip_ref.fp.write(data)
+        zip_ref.filelist.append(zinfo)
+        zip_ref.NameToInfo[zinfo.filename] = zinfo
+        zip_ref.start_dir = zip_ref.fp.tell()
+
+def write_entries_parallel(zip_ref, entries, workers=None, max_inflight=MAX_INFLIGHT_BYTES):
+    """在线程池中并行压缩 entries [(文件路径, 条目名, 压缩方式, 压缩级别)]，并按原顺序写入 ZipFile
+
+    已读入内存、尚未写入的数据总量不超过 max_inflight 字节，在途任务数不超过线程数的两倍，内存占用与文件总数无关。
+    超过 MAX_PARALLEL_FILE_SIZE 的文件由 ZipFile.write 顺序流式写入，不占用内存预算。
+    ZipFile 缺少所需的内部属性时全部退回 ZipFile.write，结果相同，只是不再并行。
+    """
+    workers = workers or default_workers()
+    parallel = supports_raw_write(zip_ref)
+    if not parallel:
+        logging.warning('当前 Python 的 zipfile 不支持写入预压缩的条目，改为单线程压缩')
+    pending = deque()
+    inflight = 0
+
+    def flush_one():
+        nonlocal inflight
+        check_cancelled()
+        file_path, zinfo, level, future = pending.popleft()
+        if future is None:
+            zip_ref.write(file_path, zinfo.filename, compress_type=zinfo.compress_type, compresslevel=level)
+        else:
+            inflight -= zinfo.file_size
+            write_compressed_entry(zip_ref, zinfo, *future.result())
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file_path, arcname, compress_type, level in entries:
+            zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+            zinfo.compress_type = compress_type
+            level = level or DEFAULT_COMPRESS_LEVEL
+            if not parallel or zinfo.file_size > MAX_PARALLEL_FILE_SIZE:
+                pending.append((file_path, zinfo, level, None))
+            else:
+                # 先写出排在前面的条目，直到放得下这个文件
+                while pending and inflight + zinfo.file_size > max_inflight:
+                    flush_one()
+                inflight += zinfo.file_size
+                pending.append((file_path, zinfo, level, executor.submit(compress_entry, file_path, compress_type, level)))
+            while len(pending) > workers * 2:
+                flush_one()
+        while pending:
+            flush_one()
+    if parallel:
+        logging.info('并行压缩完成，使用 %d 个线程', workers)
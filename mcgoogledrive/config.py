@@ -23,3 +23,63 @@ def save_config(config):
     
     with open(CONFIG_FILE, 'w') as f:
         json.dump(config, f)
+
+# 同步选项（图形界面与命令行共用）
+# 默认值在用到时才从各模块导入，读取配置不会加载 googleapiclient 与整个同步模块
+
+def force_sync(config):
+    # skip_unchanged 关闭时总是执行完整同步
+    return not config.get('skip_unchanged', True)
+
+def upload_options(config):
+    from mcgoogledrive.compression import CompressionPolicy
+    from mcgoogledrive.resumable import DEFAULT_UPLOAD_CHUNK_SIZE
+    return {
+        'streaming': config.get('streaming_upload', True),
+        'chunk_size': config.get('upload_chunk_size', DEFAULT_UPLOAD_CHUNK_SIZE),
+        'compress_workers': config.get('compress_workers'),
+        'compression_policy': CompressionPolicy(config.get('compression_policy')),
+        'force': force_sync(config),
+    }
+
+def download_options(config):
+    from mcgoogledrive.parallel_download import DEFAULT_DOWNLOAD_CONCURRENCY
+    return {
+        'streaming': config.get('streaming_download', True),
+        'concurrency': config.get('download_concurrency', DEFAULT_DOWNLOAD_CONCURRENCY),
+        'force': force_sync(config),
+    }
+
+def batch_options(config):
+    from mcgoogledrive.file_operations import DEFAULT_BATCH_PARALLEL
+    return {
+        'max_parallel': config.get('batch_parallel', DEFAULT_BATCH_PARALLEL),
+        'incremental': config.get('incremental_sync', True),
+    }
+
+def incremental_options(config):
+    from mcgoogledrive.snapshots import DEFAULT_RETENTION
+    from mcgoogledrive.chunking import DEFAULT_CHUNKING
+    return {
+        # 增量上传时保存的历史快照数量，设为 null 关闭快照
+        'retention': config.get('snapshot_retention', DEFAULT_RETENTION),
+        # 大文件按内容切块的参数，设为 null 时整文件上传
+        'chunking': config.get('chunking', DEFAULT_CHUNKING),
+    }
+
+def bandwidth_options(config):
+    return {
+        # 每秒字节数，也可写作 "2M"、"512K"；0 或 null 表示不限速
+        'upload_limit': config.get('upload_rate_limit', 0),
+        'download_limit': config.get('download_rate_limit', 0),
+        # 按实测吞吐量自动调整每个请求的大小
+        'adaptive': config.get('adaptive_chunk_size', True),
+    }
+
+def metrics_options(config):
+    return {
+        # 统计扫描、哈希、切块、压缩、上传、下载、校验、解压各阶段的耗时与字节数
+        'enabled': config.get('metrics_enabled', False),
+        # 每次操作追加一行 JSON 的追踪文件，设为 null 时不写
+        'trace_path': config.get('metrics_trace'),
+    }
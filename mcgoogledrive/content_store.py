@@ -0,0 +1,426 @@
+import os
+import io
+import json
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload, MediaIoBaseDownload
+from mcgoogledrive.metadata_cache import get_cache, FILE_FIELDS
+from mcgoogledrive.bandwidth import next_download_chunk
+from mcgoogledrive.resumable import execute_resumable, execute_simple, error_status, DEFAULT_UPLOAD_CHUNK_SIZE
+from mcgoogledrive.file_index import get_index, hash_file
+from mcgoogledrive.chunking import chunk_data
+from mcgoogledrive.parallel_download import fetch_range
+from mcgoogledrive.metrics import stage, SCAN, VERIFY
+from mcgoogledrive.batch import DriveBatch
+
+BLOB_FOLDER_NAME = 'blobs'
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# 新的块攒够该大小后作为一个包文件上传，避免每个小块一次请求
+DEFAULT_PACK_SIZE = 16 * 1024 * 1024
+
+# 并行同步多个存档时，查找与创建子文件夹必须串行，否则会重复创建同名文件夹
+_folders_lock = threading.Lock()
+
+def _ends_with_cr(file_path):
+    with open(file_path, 'rb') as f:
+        if not f.seek(0, os.SEEK_END):
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\r'
+
+class _UploadGate:
+    """进行中的上传（可以同时有多个）与数据块回收（独占）互斥，回收在等待时新的上传先等回收完成
+
+    上传可能复用一个尚未被任何远端清单引用的旧数据块，清单保存之前回收会把它删掉，
+    因此回收只在没有上传进行时执行。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._uploads = 0
+        self._collectors = 0
+        self._collecting = False
+
+    @contextmanager
+    def upload(self):
+        with self._cond:
+            while self._collecting or self._collectors:
+                self._cond.wait()
+            self._uploads += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._uploads -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def collect(self):
+        with self._cond:
+            self._collectors += 1
+            while self._collecting or self._uploads:
+                self._cond.wait()
+            self._collectors -= 1
+            self._collecting = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._collecting = False
+                self._cond.notify_all()
+
+_gate = _UploadGate()
+
+def uploading():
+    """包住从上传数据块到保存清单的整个过程，期间不会回收数据块"""
+    return _gate.upload()
+
+def collecting():
+    """回收数据块时持有，等待进行中的上传保存完清单"""
+    return _gate.collect()
+
+# 辅助函数
+
+def manifest_name(target_name):
+    """返回目标（存档名）在 Google Drive 中对应的清单文件名"""
+    return f'{target_name}{MANIFEST_SUFFIX}'
+
+def manifest_entry(file_path):
+    """单个文件的清单条目（哈希来自本地文件索引，内容未变时不重新读取）"""
+    digest = get_index().hash(file_path)
+    stat = os.stat(file_path)
+    return {'hash': digest, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def build_manifest(folder_path, exclude_files=None):
+    """扫描文件夹，生成 相对路径 -> 哈希/大小/修改时间 的清单，只重新哈希 stat 变化的文件"""
+    logging.info('生成文件清单 "%s"', folder_path)
+    with stage(SCAN) as span:
+        files = get_index().scan(folder_path, exclude_files)
+        span.add(sum(entry['size'] for entry in files.values()))
+    logging.info('清单生成完成，共 %d 个文件', len(files))
+    return {'version': MANIFEST_VERSION, 'files': files}
+
+def update_manifest(manifest, folder_path, paths, exclude_files=None):
+    """只根据变动过的路径更新清单：重新哈希仍存在的文件，删除已不存在的条目
+
+    paths 可以是文件或目录（目录被创建、移动或删除时）。返回新增、修改或删除的相对路径列表。
+    """
+    files = manifest['files']
+    changed = []
+    for path in paths:
+        arcname = os.path.relpath(path, folder_path).replace(os.sep, '/')
+        if arcname == '.' or arcname.startswith('../'):
+            continue
+        if os.path.isdir(path):
+            targets = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+        elif os.path.isfile(path):
+            targets = [path]
+        else:
+            removed = [name for name in files if name == arcname or name.startswith(f'{arcname}/')]
+            for name in removed:
+                del files[name]
+            changed.extend(removed)
+            continue
+        for file_path in targets:
+            if exclude_files and os.path.basename(file_path) in exclude_files:
+                continue
+            name = os.path.relpath(file_path, folder_path).replace(os.sep, '/')
+            try:
+                entry = manifest_entry(file_path)
+            except FileNotFoundError:
+                if files.pop(name, None):
+                    changed.append(name)
+                continue
+            current = files.get(name)
+            if current and current['hash'] == entry['hash']:
+                # 内容未变时保留原条目中的切块信息
+                current.update(entry)
+            else:
+                changed.append(name)
+                files[name] = entry
+    return changed
+
+def manifest_blobs(manifest):
+    """返回清单引用的所有数据块名（整文件数据块的哈希，以及切块所在的包文件）"""
+    blobs = set()
+    for entry in manifest.get('files', {}).values():
+        if 'chunks' in entry:
+            blobs.update(pack for _, pack, _, _ in entry['chunks'])
+        else:
+            blobs.add(entry['hash'])
+    return blobs
+
+class PackWriter:
+    """把新的块依次写入临时包文件，攒够 max_size 后作为一个数据块上传
+
+    add 返回块的位置 [块哈希, 包名, 偏移, 长度]，写入清单；退出 with 时上传剩余的块。
+    """
+
+    def __init__(self, store, max_size=DEFAULT_PACK_SIZE):
+        self.store = store
+        self.max_size = max_size
+        self.uploaded_bytes = 0
+        self._file = None
+        self._name = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        elif self._file:
+            self._file.close()
+            os.remove(self._file.name)
+
+    def add(self, chunk_hash, data):
+        if self._file is None:
+            self._file = tempfile.NamedTemporaryFile(suffix='.pack', delete=False)
+            self._name = f'pack-{uuid.uuid4().hex}'
+        offset = self._file.tell()
+        self._file.write(data)
+        location = [chunk_hash, self._name, offset, len(data)]
+        if self._file.tell() >= self.max_size:
+            self.flush()
+        return location
+
+    def flush(self):
+        if self._file is None:
+            return
+        self._file.close()
+        try:
+            self.store.upload_blob(self._name, self._file.name)
+            self.uploaded_bytes += os.path.getsize(self._file.name)
+        finally:
+            os.remove(self._file.name)
+            self._file = None
+
+class ContentStore:
+    """Google Drive 专属文件夹中的内容寻址存储：每个目标一份清单，文件内容按哈希存放在 blobs 子文件夹
+
+    可以在多个线程中共用（批量同步时所有存档共用一个实例和一份数据块列表）。
+    """
+
+    def __init__(self, service, folder_id):
+        self.service = service
+        self.folder_id = folder_id
+        self.metadata = get_cache(service, folder_id)
+        self.blob_folder_id = None
+        self._blob_ids = None
+        self._lock = threading.Lock()
+        # 正在上传的数据块：哈希 -> 上传结束时置位的 Event
+        self._uploading = {}
+
+    def ensure_folder(self, name):
+        """查找或创建专属文件夹下的子文件夹，返回文件夹 ID"""
+        with _folders_lock:
+            folder = self.metadata.get(name)
+            if folder and folder.get('mimeType') == FOLDER_MIME_TYPE:
+                return folder['id']
+            file_metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [self.folder_id]}
+            folder = self.service.files().create(body=file_metadata, fields=FILE_FIELDS).execute()
+            self.metadata.put(folder)
+        logging.info('创建子文件夹 "%s"，文件夹 ID: %s', name, folder.get('id'))
+        return folder.get('id')
+
+    def ensure_blob_folder(self):
+        """查找或创建 blobs 子文件夹"""
+        if not self.blob_folder_id:
+            self.blob_folder_id = self.ensure_folder(BLOB_FOLDER_NAME)
+        return self.blob_folder_id
+
+    def list_blob_files(self):
+        """分页列出 blobs 子文件夹中的全部数据块文件"""
+        blob_folder_id = self.ensure_blob_folder()
+        files = []
+        page_token = None
+        while True:
+            results = self.service.files().list(
+                q=f'"{blob_folder_id}" in parents and trashed=false',
+                spaces='drive',
+                fields='nextPageToken, files(id, name, createdTime)',
+                pageSize=1000,
+                pageToken=page_token
+            ).execute()
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        return files
+
+    def list_blobs(self, refresh=False):
+        """列出远端已有的数据块，返回 哈希 -> 文件ID"""
+        with self._lock:
+            if self._blob_ids is not None and not refresh:
+                return self._blob_ids
+            self._blob_ids = {item['name']: item['id'] for item in self.list_blob_files()}
+            logging.info('远端共有 %d 个数据块', len(self._blob_ids))
+            return self._blob_ids
+
+    def has_blob(self, blob_hash):
+        return blob_hash in self.list_blobs()
+
+    def upload_blob(self, blob_hash, file_path):
+        """上传单个数据块（文件内容），已存在则跳过
+
+        同一个数据块同时只由一个线程上传，其他线程等它完成后再检查，避免远端出现同名的重复数据块。
+        """
+        self.list_blobs()
+        while True:
+            with self._lock:
+                if blob_hash in self._blob_ids:
+                    return False
+                pending = self._uploading.get(blob_hash)
+                if pending is None:
+                    pending = self._uploading[blob_hash] = threading.Event()
+                    break
+            pending.wait()
+        try:
+            file_metadata = {'name': blob_hash, 'parents': [self.ensure_blob_folder()]}
+            size = os.path.getsize(file_path)
+            if size < DEFAULT_UPLOAD_CHUNK_SIZE and not _ends_with_cr(file_path):
+                # 不足一个分块的小数据块一次请求上传，省去建立可恢复上传会话的往返。
+                # multipart 请求体中内容后紧跟换行和分隔线，内容以 \r 结尾时会被当成分隔线前的 CRLF 截掉，这种数据块仍走可恢复上传
+                media = MediaFileUpload(file_path, mimetype='application/octet-stream', resumable=False)
+                blob = execute_simple(self.service.files().create(body=file_metadata, media_body=media, fields='id'), size)
+            else:
+                media = MediaFileUpload(file_path, mimetype='application/octet-stream', chunksize=DEFAULT_UPLOAD_CHUNK_SIZE, resumable=True)
+                blob = execute_resumable(self.service.files().create(body=file_metadata, media_body=media, fields='id'))
+            with self._lock:
+                self._blob_ids[blob_hash] = blob.get('id')
+        finally:
+            with self._lock:
+                del self._uploading[blob_hash]
+            pending.set()
+        return True
+
+    def delete_blob(self, blob_hash):
+        return self.delete_blobs([blob_hash])
+
+    def delete_blobs(self, blob_hashes):
+        """以批量请求删除多个数据块，返回删除的数量（远端已不存在的也算作已删除）"""
+        blob_ids = self.list_blobs()
+        batch = DriveBatch(self.service)
+        deleted = []
+        for blob_hash in blob_hashes:
+            if blob_hash in blob_ids:
+                batch.add(self.service.files().delete(fileId=blob_ids[blob_hash]))
+                deleted.append(blob_hash)
+        count = 0
+        for blob_hash, (_, error) in zip(deleted, batch.execute()):
+            if error is not None and error_status(error) != 404:
+                logging.warning('删除数据块 %s 失败：%s', blob_hash, error)
+                continue
+            del blob_ids[blob_hash]
+            count += 1
+        return count
+
+    def download_blob(self, blob_hash, destination_path):
+        """下载单个数据块并校验哈希，校验通过后原子替换目标文件"""
+        blob_id = self.list_blobs().get(blob_hash)
+        if not blob_id:
+            raise FileNotFoundError(f'远端缺少数据块 {blob_hash}')
+        temp_path = f'{destination_path}.part'
+        request = self.service.files().get_media(fileId=blob_id)
+        with open(temp_path, 'wb') as f:
+            downloader = MediaIoBaseDownload(f, request)
+            done = False
+            while not done:
+                _, done = next_download_chunk(downloader)
+        with stage(VERIFY) as span:
+            span.add(os.path.getsize(temp_path))
+            if hash_file(temp_path) != blob_hash:
+                os.remove(temp_path)
+                raise ValueError(f'数据块 {blob_hash} 校验失败')
+        os.replace(temp_path, destination_path)
+
+    def download_chunked(self, entry, destination_path, params, source_path=None):
+        """按切块信息还原文件：本地旧文件中已有的块直接复用，其余块按区间从包文件中读取（相邻的块合并为一次请求）
+
+        source_path 为本地旧文件的位置，默认就是 destination_path。
+        """
+        local = {}
+        source_path = source_path or destination_path
+        if os.path.exists(source_path):
+            with open(source_path, 'rb') as f:
+                old_data = f.read()
+            for chunk_hash, start, end in chunk_data(old_data, params, entry.get('layout')):
+                local[chunk_hash] = memoryview(old_data)[start:end]
+        blob_ids = self.list_blobs()
+        pieces = [local.get(chunk_hash) for chunk_hash, _, _, _ in entry['chunks']]
+        runs = []
+        for index, (_, pack, offset, length) in enumerate(entry['chunks']):
+            if pieces[index] is not None:
+                continue
+            if runs and runs[-1][0] == pack and runs[-1][1] + runs[-1][2] == offset:
+                runs[-1][2] += length
+                runs[-1][3].append(index)
+            else:
+                runs.append([pack, offset, length, [index]])
+        fetched = 0
+        for pack, offset, length, indexes in runs:
+            if pack not in blob_ids:
+                raise FileNotFoundError(f'远端缺少包文件 {pack}')
+            data = fetch_range(self.service, blob_ids[pack], offset, offset + length - 1)
+            fetched += length
+            position = 0
+            for index in indexes:
+                chunk_length = entry['chunks'][index][3]
+                pieces[index] = data[position:position + chunk_length]
+                position += chunk_length
+        temp_path = f'{destination_path}.part'
+        digest = hashlib.sha256()
+        # 写入还原的文件时同时计算哈希，校验阶段包括写盘
+        with stage(VERIFY) as span:
+            with open(temp_path, 'wb') as f:
+                for piece in pieces:
+                    f.write(piece)
+                    digest.update(piece)
+            span.add(entry['size'])
+            if digest.hexdigest() != entry['hash']:
+                os.remove(temp_path)
+                raise ValueError(f'文件 "{destination_path}" 还原后校验失败')
+        os.replace(temp_path, destination_path)
+        return fetched
+
+    def find_manifest(self, target_name):
+        """查找目标的清单文件，返回 Google Drive 文件信息"""
+        return self.metadata.get(manifest_name(target_name))
+
+    def load_manifest(self, target_name):
+        """读取远端清单，不存在时返回 None"""
+        file = self.find_manifest(target_name)
+        if not file:
+            return None
+        return self.read_json(file['id'])
+
+    def read_json(self, file_id):
+        buffer = io.BytesIO()
+        downloader = MediaIoBaseDownload(buffer, self.service.files().get_media(fileId=file_id))
+        done = False
+        while not done:
+            _, done = next_download_chunk(downloader)
+        return json.loads(buffer.getvalue().decode('utf-8'))
+
+    def write_json(self, data, name, parent_id, existing_id=None):
+        """上传 JSON 文件；existing_id 不为空时覆盖该文件"""
+        body = json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        media = MediaIoBaseUpload(io.BytesIO(body), mimetype='application/json')
+        if existing_id:
+            return self.service.files().update(fileId=existing_id, media_body=media, fields=FILE_FIELDS).execute()
+        file_metadata = {'name': name, 'parents': [parent_id]}
+        return self.service.files().create(body=file_metadata, media_body=media, fields=FILE_FIELDS).execute()
+
+    def save_manifest(self, target_name, manifest):
+        """上传清单，已存在则覆盖"""
+        existing = self.find_manifest(target_name)
+        file = self.write_json(manifest, manifest_name(target_name), self.folder_id, existing['id'] if existing else None)
+        self.metadata.put(file)
+        logging.info('清单 "%s" 已上传', manifest_name(target_name))
+        return file
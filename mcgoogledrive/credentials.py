@@ -0,0 +1,100 @@
+import os
+import pickle
+import logging
+import threading
+from datetime import datetime, timezone
+
+# 距离过期不到该时间时提前刷新令牌
+REFRESH_MARGIN = 5 * 60
+# 后台刷新失败后的重试间隔
+RETRY_INTERVAL = 30
+
+# 辅助函数
+
+def load_credentials(token_file):
+    """读取保存的凭据，不存在时返回 None"""
+    if not os.path.exists(token_file):
+        return None
+    with open(token_file, 'rb') as token:
+        return pickle.load(token)
+
+def save_credentials(credentials, token_file):
+    os.makedirs(os.path.dirname(token_file) or '.', exist_ok=True)
+    temp_path = f'{token_file}.tmp'
+    with open(temp_path, 'wb') as token:
+        pickle.dump(credentials, token)
+    os.replace(temp_path, token_file)
+
+class CredentialManager:
+    """持有 OAuth 凭据，在令牌过期前由后台线程提前刷新并保存
+
+    所有线程的 HTTP 客户端共用同一个凭据对象，刷新后立即使用新的令牌；
+    传输进行中不会因为令牌过期而在某个请求里同步等待刷新，多个线程也不会同时刷新。
+    """
+
+    def __init__(self, credentials, token_file=None, margin=REFRESH_MARGIN):
+        self.credentials = credentials
+        self.token_file = token_file
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def expires_in(self):
+        """距离令牌过期的秒数，没有过期时间时返回 None"""
+        expiry = getattr(self.credentials, 'expiry', None)
+        if expiry is None:
+            return None
+        # google-auth 的 expiry 是不带时区的 UTC 时间
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=timezone.utc)
+        return (expiry - datetime.now(timezone.utc)).total_seconds()
+
+    def needs_refresh(self):
+        remaining = self.expires_in()
+        return not self.credentials.token or (remaining is not None and remaining <= self.margin)
+
+    def refresh(self):
+        """立即刷新令牌并保存；其他线程正在刷新时等待其完成，不重复刷新"""
+        from google.auth.transport.requests import Request
+        with self._lock:
+            if self.credentials.valid and not self.needs_refresh():
+                return
+            self.credentials.refresh(Request())
+            if self.token_file:
+                save_credentials(self.credentials, self.token_file)
+            logging.info('访问令牌已刷新，有效期至 %s', self.credentials.expiry)
+
+    def ensure_valid(self):
+        """令牌无效或即将过期时同步刷新"""
+        if not self.credentials.valid or self.needs_refresh():
+            self.refresh()
+
+    def start(self):
+        """启动后台刷新线程（重复调用无效果）"""
+        if self._thread is not None or not getattr(self.credentials, 'refresh_token', None):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='token-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            remaining = self.expires_in()
+            delay = RETRY_INTERVAL if remaining is None else max(0, remaining - self.margin)
+            if self._stop.wait(delay):
+                return
+            if remaining is None:
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                # 令牌过期前还有机会重试；真正过期后各请求会由 AuthorizedHttp 自行刷新
+                logging.warning('后台刷新访问令牌失败，%d 秒后重试：%s', RETRY_INTERVAL, e)
+                self._stop.wait(RETRY_INTERVAL)
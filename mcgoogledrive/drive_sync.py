@@ -1,9 +1,8 @@
 import os
-import pickle
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
 import logging
+from mcgoogledrive.metadata_cache import get_cache
+from mcgoogledrive.storage import GoogleDriveBackend
+from mcgoogledrive.credentials import CredentialManager, load_credentials, save_credentials
 
 CONFIG_FILE = 'config/config.json'
 TOKEN_FILE = 'config/token.pickle'
@@ -14,42 +13,57 @@ class GoogleDriveSync:
     def __init__(self):
         self.service = None
         self.folder_id = None
+        self.metadata = None
+        self.credentials = None
 
-    def bind_google_drive(self):
+    def bind_google_drive(self, interactive=True):
+        """绑定 Google Drive；interactive 为 False 时（命令行 / 无显示器）不打开浏览器授权，凭据无效直接报错"""
         logging.info('开始绑定 Google Drive')
         try:
-            creds = None
             # 尝试加载现有的凭据
-            if os.path.exists(TOKEN_FILE):
-                with open(TOKEN_FILE, 'rb') as token:
-                    creds = pickle.load(token)
-            # 检查凭据有效性，如果无效则重新授权
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    try:
-                        creds.refresh(Request())
-                    except Exception as refresh_error:
-                        # 如果刷新失败，则处理 invalid_grant 错误
-                        logging.warning('刷新令牌失败，尝试重新授权')
-                        if os.path.exists(TOKEN_FILE):
-                            os.remove(TOKEN_FILE)  # 删除失效的 token 文件
-                        creds = self.perform_authentication()  # 重新认证
-                else:
-                    creds = self.perform_authentication()  # 第一次授权或无效凭据时重新认证
+            creds = load_credentials(TOKEN_FILE)
+            manager = CredentialManager(creds, TOKEN_FILE) if creds else None
+            # 检查凭据有效性（即将过期的也提前刷新），如果无效则重新授权
+            if manager and creds.refresh_token:
+                try:
+                    manager.ensure_valid()
+                except Exception as refresh_error:
+                    if not interactive:
+                        # 无法重新授权时保留 token 文件，可能只是暂时的网络错误
+                        raise
+                    # 如果刷新失败，则处理 invalid_grant 错误
+                    logging.warning('刷新令牌失败，尝试重新授权')
+                    if os.path.exists(TOKEN_FILE):
+                        os.remove(TOKEN_FILE)  # 删除失效的 token 文件
+                    manager = CredentialManager(self.perform_authentication(interactive), TOKEN_FILE)  # 重新认证
+            elif not creds or not creds.valid:
+                manager = CredentialManager(self.perform_authentication(interactive), TOKEN_FILE)  # 第一次授权或无效凭据时重新认证
+            # 重新绑定时停止旧凭据的后台刷新，之后由后台线程在令牌过期前刷新
+            if self.credentials:
+                self.credentials.stop()
+            self.credentials = manager
+            manager.start()
             # 构建 Google Drive API 服务
-            self.service = build('drive', 'v3', credentials=creds)
-            self.create_app_folder()
+            self.use_backend(GoogleDriveBackend(manager.credentials))
             logging.info('Google Drive 绑定成功')
         except Exception as e:
             logging.error('绑定 Google Drive 时出错: %s', e)
             raise
 
-    def perform_authentication(self):
+    def use_backend(self, backend):
+        """通过指定的存储后端连接，并找到（或创建）专属文件夹"""
+        self.service = backend.build_service()
+        self.create_app_folder()
+        self.metadata = get_cache(self.service, self.folder_id)
+
+    def perform_authentication(self, interactive=True):
         """执行 OAuth 认证流程，生成新的凭据并保存"""
+        if not interactive:
+            raise PermissionError('没有有效的 Google Drive 授权，请先运行 "python -m mcgoogledrive bind" 或在图形界面中绑定')
+        from google_auth_oauthlib.flow import InstalledAppFlow
         flow = InstalledAppFlow.from_client_secrets_file('config/credentials.json', SCOPES)
         creds = flow.run_local_server(port=0)
-        with open(TOKEN_FILE, 'wb') as token:
-            pickle.dump(creds, token)
+        save_credentials(creds, TOKEN_FILE)
         return creds
     
     def create_app_folder(self):
@@ -77,13 +91,9 @@ class GoogleDriveSync:
         try:
             if not self.folder_id:
                 raise ValueError('未找到专属文件夹 ID')
-            results = self.service.files().list(
-                q=f'"{self.folder_id}" in parents and trashed=false', 
-                spaces='drive', 
-                fields='files(id, name, modifiedTime, size)'
-            ).execute()
-            items = results.get('files', [])
-            return items
+            # 强制完整刷新元数据缓存，同时作为绑定是否有效的检查
+            self.metadata.refresh(full=True)
+            return self.metadata.files()
         except Exception as e:
             logging.error('列出文件时出错: %s', e)
             raise
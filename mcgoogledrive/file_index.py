@@ -0,0 +1,111 @@
+import os
+import time
+import sqlite3
+import logging
+import hashlib
+import threading
+from mcgoogledrive.metrics import stage, HASH
+
+FILE_INDEX_FILE = 'config/file_index.db'
+HASH_BLOCK_SIZE = 1024 * 1024
+# 与记录时间相差不到该值的修改时间不可信（文件可能在同一时间粒度内再次被写入），需重新哈希
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+_index = None
+_index_lock = threading.Lock()
+
+def hash_file(file_path):
+    """计算文件的 SHA-256 哈希值"""
+    digest = hashlib.sha256()
+    with stage(HASH) as span, open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+            span.add(len(block))
+    return digest.hexdigest()
+
+def get_index():
+    """返回全局共用的本地文件索引"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FileIndex(FILE_INDEX_FILE)
+        return _index
+
+class FileIndex:
+    """本地文件索引：路径 -> 大小 / 修改时间 / inode / SHA-256
+
+    保存在 config/ 下的 SQLite 数据库中。扫描时只比较 stat 结果，
+    只有新增或 stat 发生变化的文件才重新读取内容计算哈希。
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    indexed_ns INTEGER NOT NULL
+                )
+            ''')
+
+    @staticmethod
+    def _fresh(row, stat):
+        size, mtime_ns, inode, _, indexed_ns = row
+        return size == stat.st_size and mtime_ns == stat.st_mtime_ns and inode == stat.st_ino \
+            and mtime_ns < indexed_ns - RACY_WINDOW_NS
+
+    def hash(self, file_path):
+        """返回单个文件的哈希，stat 未变化时直接使用索引中的值"""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute('SELECT size, mtime_ns, inode, hash, indexed_ns FROM files WHERE path = ?', (path,)).fetchone()
+        if row and self._fresh(row, stat):
+            return row[3]
+        digest = hash_file(path)
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                               (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, digest, time.time_ns()))
+        return digest
+
+    def scan(self, folder_path, exclude_files=None):
+        """扫描文件夹，返回 相对路径 -> 哈希/大小/修改时间；同时更新索引并删除已不存在的文件"""
+        folder_path = os.path.abspath(folder_path)
+        prefix = folder_path.rstrip(os.sep) + os.sep
+        with self._lock:
+            known = {row[0]: row[1:] for row in self._conn.execute(
+                'SELECT path, size, mtime_ns, inode, hash, indexed_ns FROM files WHERE substr(path, 1, ?) = ?',
+                (len(prefix), prefix))}
+        files = {}
+        updates = []
+        stack = [folder_path]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file() or (exclude_files and entry.name in exclude_files):
+                        continue
+                    stat = entry.stat()
+                    row = known.pop(entry.path, None)
+                    if row and self._fresh(row, stat):
+                        digest = row[3]
+                    else:
+                        digest = hash_file(entry.path)
+                        updates.append((entry.path, stat.st_size, stat.st_mtime_ns, stat.st_ino, digest, time.time_ns()))
+                    arcname = os.path.relpath(entry.path, folder_path).replace(os.sep, '/')
+                    files[arcname] = {'hash': digest, 'size': stat.st_size, 'mtime': stat.st_mtime}
+        # 排除的文件不在结果中，但也不是已删除的文件
+        stale = [(path,) for path in known if not (exclude_files and os.path.basename(path) in exclude_files)]
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', updates)
+            self._conn.executemany('DELETE FROM files WHERE path = ?', stale)
+        logging.info('扫描 "%s"：共 %d 个文件，重新哈希 %d 个', folder_path, len(files), len(updates))
+        return files
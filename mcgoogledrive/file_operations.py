@@ -1,79 +1,329 @@
 import os
+import glob
+import hashlib
+import fnmatch
 import zipfile
 import logging
+from functools import partial
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from mcgoogledrive.scheduler import check_cancelled, propagate, JobCancelled
+from mcgoogledrive.metadata_cache import get_cache, FILE_FIELDS
+from mcgoogledrive.chunking import chunk_file, chunk_params, DEFAULT_CHUNKING, DEFAULT_CHUNK_THRESHOLD
+from mcgoogledrive.content_store import ContentStore, PackWriter, build_manifest, update_manifest, manifest_name, uploading, \
+    MANIFEST_SUFFIX
+from mcgoogledrive.file_index import get_index
+from mcgoogledrive.snapshots import SnapshotStore, take_snapshot, DEFAULT_RETENTION
+from mcgoogledrive.folder_scan import scan_folder, invalidate as invalidate_scan, DEFAULT_MAX_AGE
+from mcgoogledrive.sync_state import is_unchanged, record_sync, tree_fingerprint
+from mcgoogledrive.compression import CompressionPolicy, write_entries_parallel
+from mcgoogledrive.bandwidth import next_download_chunk
+from mcgoogledrive.metrics import stage, COMPRESS, EXTRACT
+from mcgoogledrive.resumable import UploadCheckpoint, align_chunk_size, execute_resumable, DEFAULT_UPLOAD_CHUNK_SIZE, MAX_RETRIES
+from mcgoogledrive.parallel_download import download_file_parallel, iter_ranges_in_order, get_file_size, \
+    DEFAULT_DOWNLOAD_CONCURRENCY, DEFAULT_RANGE_SIZE, MIN_PARALLEL_SIZE
+from mcgoogledrive.streaming import BoundedPipe, PipeUpload, start_producer, extract_stream, DEFAULT_CHUNK_SIZE, DEFAULT_BUFFER_SIZE
+from mcgoogledrive.staging import StagedFolder, link_unchanged, link_or_copy, STAGING_FOLDER
+
+# MOD 打包时排除临时 ZIP 自身
+MODS_EXCLUDE = ['mods.zip']
 
 # 辅助函数
 
 def find_file(service, folder_id, file_name):
-    """在指定的 Google Drive 文件夹中查找文件"""
-    query = f'name = "{file_name}" and "{folder_id}" in parents and trashed=false'
-    results = service.files().list(
-        q=query,
-        spaces='drive',
-        fields='files(id, name, mimeType, size)'
-    ).execute()
-    items = results.get('files', [])
-    if not items:
+    """在指定的 Google Drive 文件夹中查找文件（通过元数据缓存，不必每次请求 files().list）"""
+    file = get_cache(service, folder_id).get(file_name)
+    if not file:
         logging.error('未找到文件 "%s"', file_name)
         return None
-    return items[0]
+    return file
+
+def download_file(service, file_id, destination_path, size=None, concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+                  range_size=DEFAULT_RANGE_SIZE, use_mmap=False):
+    """从 Google Drive 下载文件，大文件按字节区间并发下载"""
+    if size is None:
+        size = get_file_size(service, file_id)
+    size = int(size)
+    if concurrency > 1 and size >= MIN_PARALLEL_SIZE:
+        download_file_parallel(service, file_id, destination_path, size, concurrency=concurrency,
+                               range_size=range_size, use_mmap=use_mmap)
+    else:
+        request = service.files().get_media(fileId=file_id)
+        with open(destination_path, 'wb') as f:
+            downloader = MediaIoBaseDownload(f, request)
+            done = False
+            while not done:
+                check_cancelled()
+                status, done = next_download_chunk(downloader)
+                if status:
+                    progress = int(status.progress() * 100)
+                    logging.info('下载进度：%d%%', progress)
+    logging.info('下载完成，文件大小：%s bytes', os.path.getsize(destination_path))
 
-def download_file(service, file_id, destination_path):
-    """从 Google Drive 下载文件"""
-    request = service.files().get_media(fileId=file_id)
-    with open(destination_path, 'wb') as f:
-        downloader = MediaIoBaseDownload(f, request)
+def download_and_extract(service, file_id, extract_to, size=None, chunk_size=DEFAULT_CHUNK_SIZE, buffer_size=DEFAULT_BUFFER_SIZE,
+                         concurrency=DEFAULT_DOWNLOAD_CONCURRENCY, link_from=None):
+    """边下载边解压：下载线程写入有界内存缓冲，当前线程按条目解压并校验 CRC，ZIP 不落地；link_from 见 extract_stream"""
+    pipe = BoundedPipe(max(buffer_size, chunk_size))
+    if size is None:
+        size = get_file_size(service, file_id)
+    size = int(size)
+
+    def produce(out):
+        if concurrency > 1 and size >= MIN_PARALLEL_SIZE:
+            # 并发预取后续区间，按顺序写入管道
+            for data in iter_ranges_in_order(service, file_id, size, concurrency=concurrency):
+                out.write(data)
+            return
+        request = service.files().get_media(fileId=file_id)
+        downloader = MediaIoBaseDownload(out, request, chunksize=chunk_size)
         done = False
         while not done:
-            status, done = downloader.next_chunk()
+            status, done = next_download_chunk(downloader)
             if status:
                 progress = int(status.progress() * 100)
                 logging.info('下载进度：%d%%', progress)
-    logging.info('下载完成，文件大小：%s bytes', os.path.getsize(destination_path))
 
-def upload_file(service, folder_id, file_path, file_name):
-    """将文件上传到 Google Drive"""
+    start_producer(pipe, produce, label='流式下载')
+    try:
+        extract_stream(pipe, extract_to, link_from=link_from)
+        # 读完中央目录等剩余数据，让下载线程正常结束
+        while pipe.read(chunk_size):
+            pass
+    finally:
+        # 解压失败时让下载线程退出，而不是阻塞在写入上
+        pipe.close()
+
+def upload_file(service, folder_id, file_path, file_name, chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE, max_retries=MAX_RETRIES,
+                source=None):
+    """将文件分块可恢复上传到 Google Drive，中断后（包括程序重启后）从断点继续
+
+    source 为生成该文件的内容来源指纹，记录在断点中，见 reusable_zip。
+    """
     file_metadata = {'name': file_name, 'parents': [folder_id]}
-    media = MediaFileUpload(file_path, mimetype='application/zip')
-    existing_file = find_file(service, folder_id, file_name)
+    media = MediaFileUpload(file_path, mimetype='application/zip', chunksize=align_chunk_size(chunk_size), resumable=True)
+    checkpoint = UploadCheckpoint(f'{folder_id}/{file_name}', file_path, source)
+    existing_file = get_cache(service, folder_id).get(file_name)
     if existing_file:
         file_id = existing_file['id']
         logging.info('更新已有文件，文件ID：%s', file_id)
-        service.files().update(fileId=file_id, media_body=media).execute()
+        request = service.files().update(fileId=file_id, media_body=media, fields=FILE_FIELDS)
     else:
         logging.info('上传新文件')
-        service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+        request = service.files().create(body=file_metadata, media_body=media, fields=FILE_FIELDS)
+    checkpoint.restore(request)
+    file = execute_resumable(request, checkpoint, max_retries=max_retries)
+    get_cache(service, folder_id).put(file)
+    logging.info('文件 "%s" 已成功上传到 Google Drive', file_name)
+    return file
+
+def reusable_zip(folder_id, file_name, zip_path, source):
+    """上次上传中断时保留下来的 ZIP 能否直接续传：生成它的文件夹内容（source）与 ZIP 本身都未变化，不必重新压缩"""
+    return os.path.exists(zip_path) and UploadCheckpoint(f'{folder_id}/{file_name}', zip_path, source).available()
+
+class _HashingWriter:
+    """写入时同时计算 MD5 的文件对象包装"""
+
+    def __init__(self, out, digest):
+        self._out = out
+        self._digest = digest
+
+    def write(self, data):
+        self._digest.update(data)
+        return self._out.write(data)
+
+    def flush(self):
+        self._out.flush()
+
+def upload_folder_streaming(service, folder_id, folder_path, file_name, exclude_files=None,
+                            chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE, buffer_size=DEFAULT_BUFFER_SIZE, compress_workers=None,
+                            compression_policy=None, max_retries=MAX_RETRIES, source=None):
+    """边压缩边上传文件夹：压缩输出经有界内存缓冲直接送入可恢复上传，不生成临时 ZIP 文件
+
+    指定 source（文件夹的 tree_fingerprint）时记录断点：程序重启后文件夹未变化，则重新压缩并跳过服务端已收到的字节继续上传，
+    完成后用 MD5 确认重新压缩的内容与上次一致，不一致时完整重新上传。
+    """
+    chunk_size = align_chunk_size(chunk_size)
+    pipe = BoundedPipe(max(buffer_size, chunk_size))
+    media = PipeUpload(pipe, mimetype='application/zip', chunksize=chunk_size)
+    existing_file = get_cache(service, folder_id).get(file_name)
+    if existing_file:
+        logging.info('流式更新已有文件，文件ID：%s', existing_file['id'])
+        request = service.files().update(fileId=existing_file['id'], media_body=media, fields=FILE_FIELDS)
+    else:
+        logging.info('流式上传新文件')
+        file_metadata = {'name': file_name, 'parents': [folder_id]}
+        request = service.files().create(body=file_metadata, media_body=media, fields=FILE_FIELDS)
+    checkpoint = UploadCheckpoint(f'{folder_id}/{file_name}', source=source) if source is not None else None
+    resumed = checkpoint is not None and checkpoint.restore(request)
+    digest = hashlib.md5()
+    start_producer(pipe, lambda out: compress_folder(folder_path, _HashingWriter(out, digest) if resumed else out, exclude_files,
+                                                     workers=compress_workers, policy=compression_policy))
+    try:
+        # 管道会保留尚未确认的字节，因此会话内的重试可以从服务端确认的位置继续
+        file = execute_resumable(request, checkpoint, max_retries=max_retries)
+    finally:
+        # 上传失败时让压缩线程退出，而不是阻塞在写入上
+        pipe.close()
+    if resumed and file.get('md5Checksum') and file['md5Checksum'] != digest.hexdigest():
+        logging.warning('续传的文件 "%s" 与重新压缩的内容不一致，完整重新上传', file_name)
+        get_cache(service, folder_id).put(file)
+        return upload_folder_streaming(service, folder_id, folder_path, file_name, exclude_files, chunk_size=chunk_size,
+                                       buffer_size=buffer_size, compress_workers=compress_workers,
+                                       compression_policy=compression_policy, max_retries=max_retries)
+    get_cache(service, folder_id).put(file)
     logging.info('文件 "%s" 已成功上传到 Google Drive', file_name)
+    return file
+
+def upload_manifest_files(store, manifest, folder_path, arcnames, previous=None, chunking=DEFAULT_CHUNKING):
+    """上传清单中指定文件的内容，返回 (上传的文件数, 上传字节数)
+
+    小文件整体作为数据块上传；不小于 chunking['threshold'] 的文件按内容切块（区域文件按区块布局切分），
+    只有之前的清单中没有的块才写入包文件上传。chunking 为 None 时不切块。
+    """
+    previous_files = previous['files'] if previous else {}
+    # 内容未变（哈希相同，包括被移动）的文件直接沿用之前的切块信息
+    chunked_by_hash = {entry['hash']: entry for entry in previous_files.values() if 'chunks' in entry}
+    known_chunks = {chunk[0]: chunk for entry in previous_files.values() for chunk in entry.get('chunks', [])}
+    params = chunk_params(chunking) if chunking is not None else None
+    uploaded = 0
+    uploaded_bytes = 0
+    with PackWriter(store) as packs:
+        for arcname in arcnames:
+            check_cancelled()
+            entry = manifest['files'][arcname]
+            file_path = os.path.join(folder_path, *arcname.split('/'))
+            if params is None or entry['size'] < chunking.get('threshold', DEFAULT_CHUNK_THRESHOLD):
+                if store.upload_blob(entry['hash'], file_path):
+                    uploaded += 1
+                    uploaded_bytes += entry['size']
+                continue
+            entry.pop('layout', None)
+            if entry['hash'] in chunked_by_hash:
+                previous_entry = chunked_by_hash[entry['hash']]
+                entry['chunks'] = previous_entry['chunks']
+                if 'layout' in previous_entry:
+                    entry['layout'] = previous_entry['layout']
+                continue
+            data, chunks, layout = chunk_file(file_path, params, region=chunking.get('region', True))
+            # 生成清单后文件又被改写时，以实际上传的内容为准
+            entry.update(hash=hashlib.sha256(data).hexdigest(), size=len(data))
+            if layout:
+                entry['layout'] = layout
+            entry['chunks'] = []
+            new_chunks = 0
+            for chunk_hash, start, end in chunks:
+                if chunk_hash not in known_chunks:
+                    known_chunks[chunk_hash] = packs.add(chunk_hash, data[start:end])
+                    new_chunks += 1
+                entry['chunks'].append(known_chunks[chunk_hash])
+            if new_chunks:
+                uploaded += 1
+            logging.debug('"%s" 共 %d 块，新增 %d 块', arcname, len(chunks), new_chunks)
+    if params is not None:
+        manifest['chunking'] = params._asdict()
+    return uploaded, uploaded_bytes + packs.uploaded_bytes
+
+def _local_files(folder_path):
+    """文件夹中全部文件的相对路径（/ 分隔）"""
+    names = set()
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            names.add(os.path.relpath(os.path.join(root, file), folder_path).replace(os.sep, '/'))
+    return names
+
+def apply_manifest(store, manifest, folder_path, staging_root=None):
+    """让本地文件夹与清单完全一致，返回下载的文件数
+
+    只下载本地缺失或内容不同的文件；有变化时在暂存目录中组装完整的新版本（未变的文件硬链接过来），
+    再整体替换原文件夹，因此清单中没有的文件会被移除，中途失败时原文件夹保持不变。
+    """
+    index = get_index()
+    changed = []
+    for arcname, entry in manifest['files'].items():
+        check_cancelled()
+        local_path = os.path.join(folder_path, *arcname.split('/'))
+        if not (os.path.exists(local_path) and os.path.getsize(local_path) == entry['size'] and index.hash(local_path) == entry['hash']):
+            changed.append(arcname)
+    stale = _local_files(folder_path) - set(manifest['files'])
+    if not changed and not stale:
+        logging.info('共 %d 个文件，本地已与清单一致', len(manifest['files']))
+        return 0
 
-def compress_folder(folder_path, zip_path, exclude_files=None):
-    """压缩文件夹为 ZIP 文件"""
+    changed = set(changed)
+    params = chunk_params(manifest.get('chunking'))
+    with StagedFolder(folder_path, staging_root) as staged:
+        for arcname, entry in manifest['files'].items():
+            check_cancelled()
+            parts = arcname.split('/')
+            local_path = os.path.join(folder_path, *parts)
+            staged_path = os.path.join(staged.path, *parts)
+            if arcname not in changed:
+                link_or_copy(local_path, staged_path)
+                continue
+            os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+            if 'chunks' in entry:
+                store.download_chunked(entry, staged_path, params, source_path=local_path)
+            else:
+                store.download_blob(entry['hash'], staged_path)
+    invalidate_scan(folder_path)
+    logging.info('共 %d 个文件，下载 %d 个变化文件，删除 %d 个清单中没有的文件', len(manifest['files']), len(changed), len(stale))
+    return len(changed)
+
+def compress_folder(folder_path, zip_path, exclude_files=None, workers=None, policy=None):
+    """压缩文件夹为 ZIP 文件（zip_path 也可以是可写的文件对象），各文件按压缩策略在线程池中并行压缩"""
     logging.info('压缩文件夹 "%s"', folder_path)
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if exclude_files and file in exclude_files:
-                    continue
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, folder_path)
-                zip_ref.write(file_path, arcname)
-    logging.info('压缩完成，ZIP 文件路径：%s', zip_path)
+    policy = policy or CompressionPolicy()
+    entries = []
+    stored = 0
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            if exclude_files and file in exclude_files:
+                continue
+            file_path = os.path.join(root, file)
+            arcname = os.path.relpath(file_path, folder_path)
+            compress_type, level = policy.choose(file_path)
+            if compress_type == zipfile.ZIP_STORED:
+                stored += 1
+            entries.append((file_path, arcname, compress_type, level))
+    logging.info('共 %d 个文件，其中 %d 个已压缩格式直接存储', len(entries), stored)
+    with stage(COMPRESS) as span, zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        write_entries_parallel(zip_ref, entries, workers=workers)
+        span.add(sum(info.file_size for info in zip_ref.filelist))
+    if isinstance(zip_path, str):
+        logging.info('压缩完成，ZIP 文件路径：%s', zip_path)
+    else:
+        logging.info('压缩完成')
+
+def extract_zip(zip_path, extract_to, link_from=None):
+    """解压 ZIP 文件到指定目录，解压时逐条目校验 CRC，不再单独执行 testzip()
 
-def extract_zip(zip_path, extract_to):
-    """解压 ZIP 文件到指定目录"""
+    指定 link_from 时，与其中对应文件大小和 CRC 都相同的条目直接硬链接过来，不再解压写入。
+    """
     logging.info('解压文件 "%s" 到 "%s"', zip_path, extract_to)
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        bad_file = zip_ref.testzip()
-        if bad_file:
-            logging.error('ZIP 文件损坏：%s', bad_file)
-            return False
-        zip_ref.extractall(extract_to)
-    logging.info('解压完成')
+    linked = 0
+    try:
+        with stage(EXTRACT) as span, zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                check_cancelled()
+                if link_from and not info.is_dir() and link_unchanged(info.filename, info.file_size, info.CRC, link_from, extract_to):
+                    linked += 1
+                    continue
+                zip_ref.extract(info, extract_to)
+            span.add(sum(info.file_size for info in zip_ref.infolist()))
+    except zipfile.BadZipFile as e:
+        logging.error('ZIP 文件损坏：%s', e)
+        return False
+    if linked:
+        logging.info('解压完成，%d 个未变化的文件直接复用', linked)
+    else:
+        logging.info('解压完成')
     return True
 
 # 主函数
 
-def download_save(service, folder_id, save_folder_name, save_path):
+def download_save(service, folder_id, save_folder_name, save_path, streaming=False, concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+                  force=False):
     logging.info('开始下载存档 "%s"', save_folder_name)
     try:
         file_name = f'{save_folder_name}.zip'
@@ -86,40 +336,162 @@ def download_save(service, folder_id, save_folder_name, save_path):
             return
 
         zip_folder = os.path.join(save_path, 'saves', save_folder_name)
-        zip_path = os.path.join(zip_folder, file_name)
-        os.makedirs(zip_folder, exist_ok=True)
-
-        download_file(service, file['id'], zip_path)
-
-        if extract_zip(zip_path, zip_folder):
-            logging.info('存档 "%s" 下载并解压成功', save_folder_name)
-        else:
-            logging.error('解压存档 "%s" 失败', save_folder_name)
+        if not force and os.path.isdir(zip_folder) and \
+                is_unchanged(folder_id, file_name, zip_folder, file, tree_fingerprint(zip_folder)):
+            logging.info('存档 "%s" 与 Google Drive 一致，跳过下载', save_folder_name)
             return
 
-        os.remove(zip_path)
-        logging.info('删除临时文件 "%s"', zip_path)
+        # 解压到暂存目录，完成后整体替换存档文件夹：中途失败不会留下一半新一半旧的存档，远端已删除的文件也随之移除
+        with StagedFolder(zip_folder, os.path.join(save_path, STAGING_FOLDER)) as staged:
+            if streaming:
+                download_and_extract(service, file['id'], staged.path, size=file.get('size'), concurrency=concurrency,
+                                     link_from=zip_folder)
+            else:
+                zip_path = os.path.join(staged.root, file_name)
+                try:
+                    download_file(service, file['id'], zip_path, size=file.get('size'), concurrency=concurrency)
+                    if not extract_zip(zip_path, staged.path, link_from=zip_folder):
+                        raise zipfile.BadZipFile(f'解压存档 "{save_folder_name}" 失败')
+                finally:
+                    if os.path.exists(zip_path):
+                        os.remove(zip_path)
+                        logging.info('删除临时文件 "%s"', zip_path)
+        logging.info('存档 "%s" 下载并解压成功', save_folder_name)
+        invalidate_scan(zip_folder)
+        record_sync(folder_id, file_name, zip_folder, file, tree_fingerprint(zip_folder))
         logging.info('下载存档成功')
+    except JobCancelled:
+        raise
     except Exception as e:
         logging.error('下载存档 "%s" 时出错：%s', save_folder_name, e)
 
-def upload_save(service, folder_id, save_folder_name, save_path):
+def upload_save(service, folder_id, save_folder_name, save_path, streaming=False, compress_workers=None, compression_policy=None,
+                chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE, force=False):
     logging.info('开始上传存档 "%s"', save_folder_name)
     try:
+        file_name = f'{save_folder_name}.zip'
         save_folder_path = os.path.join(save_path, 'saves', save_folder_name)
-        zip_path = os.path.join(save_path, 'saves', f'{save_folder_name}.zip')
+        # 先记录指纹，压缩期间发生的修改会在下次上传时被发现
+        fingerprint = tree_fingerprint(save_folder_path)
+        if not force and is_unchanged(folder_id, file_name, save_folder_path, get_cache(service, folder_id).get(file_name), fingerprint):
+            logging.info('存档 "%s" 与 Google Drive 一致，跳过上传', save_folder_name)
+            return
 
-        compress_folder(save_folder_path, zip_path)
+        if streaming:
+            remote_file = upload_folder_streaming(service, folder_id, save_folder_path, file_name,
+                                                  chunk_size=chunk_size, compress_workers=compress_workers,
+                                                  compression_policy=compression_policy, source=fingerprint)
+        else:
+            zip_path = os.path.join(save_path, 'saves', file_name)
 
-        upload_file(service, folder_id, zip_path, f'{save_folder_name}.zip')
+            # 上传失败时保留 ZIP，存档未变化时下次直接从断点续传
+            if reusable_zip(folder_id, file_name, zip_path, fingerprint):
+                logging.info('使用上次中断时保留的 ZIP 继续上传')
+            else:
+                compress_folder(save_folder_path, zip_path, workers=compress_workers, policy=compression_policy)
 
-        os.remove(zip_path)
-        logging.info('删除临时文件 "%s"', zip_path)
+            remote_file = upload_file(service, folder_id, zip_path, file_name, chunk_size=chunk_size, source=fingerprint)
+
+            os.remove(zip_path)
+            logging.info('删除临时文件 "%s"', zip_path)
+        record_sync(folder_id, file_name, save_folder_path, remote_file, fingerprint)
         logging.info('上传存档成功')
+    except JobCancelled:
+        raise
     except Exception as e:
         logging.error('上传存档 "%s" 时出错：%s', save_folder_name, e)
 
-def download_mod(service, folder_id, save_path):
+def upload_save_incremental(service, folder_id, save_folder_name, save_path, force=False, retention=DEFAULT_RETENTION,
+                            chunking=DEFAULT_CHUNKING, store=None):
+    """增量上传存档：只上传发生变化的文件（大文件只上传变化的块），并更新远端清单；retention 不为空时同时保存一个快照
+
+    批量同步时通过 store 传入共用的 ContentStore，各存档不必各自列出一遍数据块。
+    """
+    logging.info('开始增量上传存档 "%s"', save_folder_name)
+    try:
+        save_folder_path = os.path.join(save_path, 'saves', save_folder_name)
+        store = store or ContentStore(service, folder_id)
+        file_name = manifest_name(save_folder_name)
+        fingerprint = tree_fingerprint(save_folder_path)
+        if not force and is_unchanged(folder_id, file_name, save_folder_path, store.find_manifest(save_folder_name), fingerprint):
+            logging.info('存档 "%s" 与 Google Drive 一致，跳过上传', save_folder_name)
+            return
+        manifest = build_manifest(save_folder_path)
+
+        # 清单保存之前不回收数据块，见 content_store.uploading
+        with uploading():
+            uploaded, uploaded_bytes = upload_manifest_files(store, manifest, save_folder_path, list(manifest['files']),
+                                                             previous=store.load_manifest(save_folder_name), chunking=chunking)
+            logging.info('共 %d 个文件，上传 %d 个变化文件（%s bytes）', len(manifest['files']), uploaded, uploaded_bytes)
+            remote_file = store.save_manifest(save_folder_name, manifest)
+        record_sync(folder_id, file_name, save_folder_path, remote_file, fingerprint)
+        if retention:
+            take_snapshot(store, save_folder_name, manifest, retention)
+        logging.info('增量上传存档成功')
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logging.error('增量上传存档 "%s" 时出错：%s', save_folder_name, e)
+
+def upload_save_paths(service, folder_id, save_folder_name, save_path, paths, retention=DEFAULT_RETENTION, chunking=DEFAULT_CHUNKING):
+    """只上传存档中变动过的路径（由文件监视提供），在远端清单基础上更新，不重新扫描整个存档"""
+    logging.info('开始上传存档 "%s" 中 %d 个变动路径', save_folder_name, len(paths))
+    try:
+        save_folder_path = os.path.join(save_path, 'saves', save_folder_name)
+        store = ContentStore(service, folder_id)
+        manifest = store.load_manifest(save_folder_name)
+        if manifest is None:
+            logging.info('未找到存档清单，改为完整增量上传')
+            upload_save_incremental(service, folder_id, save_folder_name, save_path, force=True, retention=retention,
+                                    chunking=chunking)
+            return
+
+        previous = {'files': dict(manifest['files'])}
+        changed = update_manifest(manifest, save_folder_path, paths)
+        if not changed:
+            logging.info('存档 "%s" 内容没有变化，跳过上传', save_folder_name)
+            return
+        with uploading():
+            uploaded, uploaded_bytes = upload_manifest_files(store, manifest, save_folder_path,
+                                                             [arcname for arcname in changed if arcname in manifest['files']],
+                                                             previous=previous, chunking=chunking)
+            # 未记录同步状态：远端清单的 md5 已变化，下次手动同步会重新比较
+            store.save_manifest(save_folder_name, manifest)
+        if retention:
+            take_snapshot(store, save_folder_name, manifest, retention)
+        logging.info('存档 "%s" 共 %d 个文件变化，上传 %d 个文件（%s bytes）', save_folder_name, len(changed), uploaded, uploaded_bytes)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logging.error('上传存档 "%s" 变动路径时出错：%s', save_folder_name, e)
+
+def download_save_incremental(service, folder_id, save_folder_name, save_path, force=False, store=None):
+    """增量下载存档：只下载本地缺失或内容不同的文件，并删除远端清单中没有的文件；远端无清单时回退到 ZIP 下载"""
+    logging.info('开始增量下载存档 "%s"', save_folder_name)
+    try:
+        store = store or ContentStore(service, folder_id)
+        file_name = manifest_name(save_folder_name)
+        save_folder_path = os.path.join(save_path, 'saves', save_folder_name)
+        remote_file = store.find_manifest(save_folder_name)
+        if not force and os.path.isdir(save_folder_path) and \
+                is_unchanged(folder_id, file_name, save_folder_path, remote_file, tree_fingerprint(save_folder_path)):
+            logging.info('存档 "%s" 与 Google Drive 一致，跳过下载', save_folder_name)
+            return
+        manifest = store.load_manifest(save_folder_name)
+        if manifest is None:
+            logging.info('未找到存档清单，回退到 ZIP 下载')
+            download_save(service, folder_id, save_folder_name, save_path, streaming=True, force=force)
+            return
+
+        apply_manifest(store, manifest, save_folder_path, os.path.join(save_path, STAGING_FOLDER))
+        record_sync(folder_id, file_name, save_folder_path, remote_file, tree_fingerprint(save_folder_path))
+        logging.info('增量下载存档成功')
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logging.error('增量下载存档 "%s" 时出错：%s', save_folder_name, e)
+
+def download_mod(service, folder_id, save_path, streaming=False, concurrency=DEFAULT_DOWNLOAD_CONCURRENCY, force=False):
     logging.info('开始下载 MOD')
     try:
         file_name = 'mods.zip'
@@ -133,34 +505,243 @@ def download_mod(service, folder_id, save_path):
 
         mods_folder = os.path.join(save_path, 'mods')
         zip_path = os.path.join(mods_folder, file_name)
+        if not force and os.path.isdir(mods_folder) and \
+                is_unchanged(folder_id, file_name, mods_folder, file, tree_fingerprint(mods_folder, MODS_EXCLUDE)):
+            logging.info('MOD 与 Google Drive 一致，跳过下载')
+            return
         os.makedirs(mods_folder, exist_ok=True)
 
-        download_file(service, file['id'], zip_path)
-
-        if extract_zip(zip_path, mods_folder):
-            logging.info('MOD 下载并解压成功')
+        if streaming:
+            download_and_extract(service, file['id'], mods_folder, size=file.get('size'), concurrency=concurrency)
         else:
-            logging.error('解压 MOD 失败')
-            return
+            download_file(service, file['id'], zip_path, size=file.get('size'), concurrency=concurrency)
 
-        os.remove(zip_path)
-        logging.info('删除临时文件 "%s"', zip_path)
+            if extract_zip(zip_path, mods_folder):
+                logging.info('MOD 下载并解压成功')
+            else:
+                logging.error('解压 MOD 失败')
+                return
+
+            os.remove(zip_path)
+            logging.info('删除临时文件 "%s"', zip_path)
+        invalidate_scan(mods_folder)
+        record_sync(folder_id, file_name, mods_folder, file, tree_fingerprint(mods_folder, MODS_EXCLUDE))
         logging.info('下载 MOD 成功')
+    except JobCancelled:
+        raise
     except Exception as e:
         logging.error('下载 MOD 时出错：%s', e)
 
-def upload_mod(service, folder_id, save_path):
+def upload_mod(service, folder_id, save_path, streaming=False, compress_workers=None, compression_policy=None,
+               chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE, force=False):
     logging.info('开始上传 MOD')
     try:
         mods_folder = os.path.join(save_path, 'mods')
-        zip_path = os.path.join(mods_folder, 'mods.zip')
+        fingerprint = tree_fingerprint(mods_folder, MODS_EXCLUDE)
+        if not force and is_unchanged(folder_id, 'mods.zip', mods_folder, get_cache(service, folder_id).get('mods.zip'), fingerprint):
+            logging.info('MOD 与 Google Drive 一致，跳过上传')
+            return
 
-        compress_folder(mods_folder, zip_path, exclude_files=['mods.zip'])
+        if streaming:
+            remote_file = upload_folder_streaming(service, folder_id, mods_folder, 'mods.zip', exclude_files=MODS_EXCLUDE,
+                                                  chunk_size=chunk_size, compress_workers=compress_workers,
+                                                  compression_policy=compression_policy, source=fingerprint)
+        else:
+            zip_path = os.path.join(mods_folder, 'mods.zip')
 
-        upload_file(service, folder_id, zip_path, 'mods.zip')
+            if reusable_zip(folder_id, 'mods.zip', zip_path, fingerprint):
+                logging.info('使用上次中断时保留的 ZIP 继续上传')
+            else:
+                compress_folder(mods_folder, zip_path, exclude_files=MODS_EXCLUDE, workers=compress_workers, policy=compression_policy)
 
-        os.remove(zip_path)
-        logging.info('删除临时文件 "%s"', zip_path)
+            remote_file = upload_file(service, folder_id, zip_path, 'mods.zip', chunk_size=chunk_size, source=fingerprint)
+
+            os.remove(zip_path)
+            logging.info('删除临时文件 "%s"', zip_path)
+        record_sync(folder_id, 'mods.zip', mods_folder, remote_file, fingerprint)
         logging.info('上传 MOD 成功')
+    except JobCancelled:
+        raise
     except Exception as e:
         logging.error('上传 MOD 时出错：%s', e)
+
+# 批量同步
+
+DEFAULT_BATCH_PARALLEL = 2
+
+def parse_world_patterns(text):
+    """把 "world1, world2" / "world*" 形式的输入拆分为存档名或通配符列表"""
+    if isinstance(text, (list, tuple)):
+        return [str(item).strip() for item in text if str(item).strip()]
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+def is_batch(patterns):
+    """多个存档或包含通配符时视为批量同步"""
+    return len(patterns) > 1 or any(glob.has_magic(pattern) for pattern in patterns)
+
+def match_local_worlds(save_path, patterns):
+    """在 saves/ 下按名称或通配符匹配本地存档文件夹"""
+    saves_folder = os.path.join(save_path, 'saves')
+    if not os.path.isdir(saves_folder):
+        return []
+    names = sorted(entry.name for entry in os.scandir(saves_folder) if entry.is_dir())
+    return [name for name in names if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+
+def match_remote_worlds(service, folder_id, patterns):
+    """按名称或通配符匹配 Google Drive 上的存档（ZIP 或清单），只使用一次元数据列表"""
+    names = set()
+    for file in get_cache(service, folder_id).files():
+        name = file['name']
+        if name.endswith(MANIFEST_SUFFIX):
+            names.add(name[:-len(MANIFEST_SUFFIX)])
+        elif name.endswith('.zip') and name != 'mods.zip':
+            names.add(name[:-len('.zip')])
+    return sorted(name for name in names if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns))
+
+def upload_saves_batch(service, folder_id, save_path, patterns, max_parallel=DEFAULT_BATCH_PARALLEL, incremental=True,
+                       retention=DEFAULT_RETENTION, chunking=DEFAULT_CHUNKING, streaming=False, compress_workers=None, compression_policy=None,
+                       chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE, force=False):
+    """批量上传多个存档，最多 max_parallel 个传输同时进行
+
+    非流式 ZIP 模式下拆成两级流水线：单独的压缩线程依次生成 ZIP，上传线程池并行上传，
+    因此第 N+1 个存档的压缩与第 N 个存档的上传重叠进行。
+    """
+    worlds = match_local_worlds(save_path, patterns)
+    logging.info('开始批量上传 %d 个存档：%s', len(worlds), ', '.join(worlds))
+    if incremental or streaming:
+        if incremental:
+            # blobs 子文件夹在并行上传之前创建好，所有存档共用一份数据块列表
+            store = ContentStore(service, folder_id)
+            store.ensure_blob_folder()
+            upload = partial(upload_save_incremental, force=force, retention=retention, chunking=chunking, store=store)
+        else:
+            upload = partial(upload_save, streaming=True, compress_workers=compress_workers,
+                             compression_policy=compression_policy, chunk_size=chunk_size, force=force)
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            for future in [executor.submit(propagate(upload), service, folder_id, world, save_path) for world in worlds]:
+                future.result()
+    else:
+        with ThreadPoolExecutor(max_workers=1) as compressor, ThreadPoolExecutor(max_workers=max_parallel) as uploader:
+            futures = []
+            for world in worlds:
+                check_cancelled()
+                file_name = f'{world}.zip'
+                folder_path = os.path.join(save_path, 'saves', world)
+                zip_path = os.path.join(save_path, 'saves', file_name)
+                fingerprint = tree_fingerprint(folder_path)
+                if not force and is_unchanged(folder_id, file_name, folder_path, get_cache(service, folder_id).get(file_name), fingerprint):
+                    logging.info('存档 "%s" 与 Google Drive 一致，跳过上传', world)
+                    continue
+                if reusable_zip(folder_id, file_name, zip_path, fingerprint):
+                    logging.info('存档 "%s" 使用上次中断时保留的 ZIP 继续上传', world)
+                    compressed = None
+                else:
+                    compressed = compressor.submit(propagate(compress_folder), folder_path, zip_path,
+                                                   workers=compress_workers, policy=compression_policy)
+                futures.append(uploader.submit(propagate(_upload_compressed_world), service, folder_id, world,
+                                               folder_path, zip_path, compressed, fingerprint, chunk_size))
+            for future in futures:
+                future.result()
+    logging.info('批量上传完成，共 %d 个存档', len(worlds))
+
+def _upload_compressed_world(service, folder_id, world, folder_path, zip_path, compressed, fingerprint, chunk_size):
+    """批量上传流水线的上传阶段：等待该存档压缩完成后上传，成功后清理临时 ZIP（失败时保留以便续传）"""
+    try:
+        if compressed:
+            compressed.result()
+        remote_file = upload_file(service, folder_id, zip_path, f'{world}.zip', chunk_size=chunk_size, source=fingerprint)
+        os.remove(zip_path)
+        record_sync(folder_id, f'{world}.zip', folder_path, remote_file, fingerprint)
+        logging.info('存档 "%s" 上传成功', world)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logging.error('上传存档 "%s" 时出错：%s', world, e)
+
+def download_saves_batch(service, folder_id, save_path, patterns, max_parallel=DEFAULT_BATCH_PARALLEL, incremental=True,
+                         streaming=False, concurrency=DEFAULT_DOWNLOAD_CONCURRENCY, force=False):
+    """批量下载 Google Drive 上匹配的存档，最多 max_parallel 个同时进行"""
+    worlds = match_remote_worlds(service, folder_id, patterns)
+    logging.info('开始批量下载 %d 个存档：%s', len(worlds), ', '.join(worlds))
+    if incremental:
+        download = partial(download_save_incremental, force=force, store=ContentStore(service, folder_id))
+    else:
+        download = partial(download_save, streaming=streaming, concurrency=concurrency, force=force)
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        for future in [executor.submit(propagate(download), service, folder_id, world, save_path) for world in worlds]:
+            future.result()
+    logging.info('批量下载完成，共 %d 个存档', len(worlds))
+
+def upload_saves(service, folder_id, save_path, patterns, max_parallel=DEFAULT_BATCH_PARALLEL, incremental=True,
+                 retention=DEFAULT_RETENTION, chunking=DEFAULT_CHUNKING, **options):
+    """上传一个或多个存档：多个存档或通配符走批量同步，否则按增量 / ZIP 方式上传单个存档"""
+    if is_batch(patterns):
+        upload_saves_batch(service, folder_id, save_path, patterns, max_parallel=max_parallel, incremental=incremental,
+                           retention=retention, chunking=chunking, **options)
+    elif incremental:
+        upload_save_incremental(service, folder_id, patterns[0], save_path, force=options.get('force', False),
+                                retention=retention, chunking=chunking)
+    else:
+        upload_save(service, folder_id, patterns[0], save_path, **options)
+
+def download_saves(service, folder_id, save_path, patterns, max_parallel=DEFAULT_BATCH_PARALLEL, incremental=True, **options):
+    """下载一个或多个存档，规则同 upload_saves"""
+    if is_batch(patterns):
+        download_saves_batch(service, folder_id, save_path, patterns, max_parallel=max_parallel, incremental=incremental, **options)
+    elif incremental:
+        download_save_incremental(service, folder_id, patterns[0], save_path, force=options.get('force', False))
+    else:
+        download_save(service, folder_id, patterns[0], save_path, **options)
+
+def restore_snapshot(service, folder_id, save_folder_name, save_path, when=None):
+    """把存档恢复到指定时间（或之前最近）的快照；when 为空时恢复最新快照
+
+    恢复后的存档与快照完全一致：快照之后新建的文件会被删除，新版本在暂存目录中组装完成后整体替换存档文件夹。
+    """
+    logging.info('开始恢复存档 "%s" 的快照', save_folder_name)
+    try:
+        store = ContentStore(service, folder_id)
+        snapshot_time, manifest = SnapshotStore(store).load(save_folder_name, when)
+        if manifest is None:
+            logging.error('未找到存档 "%s" 的快照', save_folder_name)
+            return
+        logging.info('使用 %s 的快照', snapshot_time.astimezone().strftime('%Y-%m-%d %H:%M:%S'))
+        apply_manifest(store, manifest, os.path.join(save_path, 'saves', save_folder_name), os.path.join(save_path, STAGING_FOLDER))
+        logging.info('恢复快照成功')
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logging.error('恢复存档 "%s" 的快照时出错：%s', save_folder_name, e)
+
+# 版本比较
+
+def drive_file_info(file):
+    """Google Drive 文件的修改时间（本地时区）与大小"""
+    modified = datetime.strptime(file['modifiedTime'], '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc).astimezone()
+    return {'name': file['name'], 'modified_time': modified, 'size': int(file.get('size', 0))}
+
+def local_folder_info(folder_path, max_age=DEFAULT_MAX_AGE):
+    """本地文件夹的最新修改时间与总大小（通过带缓存的单次扫描）"""
+    stats = scan_folder(folder_path, max_age=max_age)
+    modified = datetime.fromtimestamp(stats.latest_mtime or os.path.getmtime(folder_path)).astimezone()
+    return {'path': folder_path, 'modified_time': modified, 'size': stats.size, 'file_count': stats.file_count}
+
+def compare_versions(service, folder_id, save_folder_name, save_path, incremental=True, max_age=DEFAULT_MAX_AGE):
+    """收集存档与 MOD 在 Google Drive 和本地的修改时间、大小；找不到的一侧为 None"""
+    metadata = get_cache(service, folder_id)
+    # 增量同步时优先使用存档清单
+    drive_save = metadata.get(manifest_name(save_folder_name)) if incremental else None
+    drive_save = drive_save or metadata.get(f'{save_folder_name}.zip')
+    drive_mods = metadata.get('mods.zip')
+    local_save_path = os.path.join(save_path, 'saves', save_folder_name)
+    local_mods_path = os.path.join(save_path, 'mods')
+    return {
+        'save': {
+            'drive': drive_file_info(drive_save) if drive_save else None,
+            'local': local_folder_info(local_save_path, max_age) if os.path.isdir(local_save_path) else None,
+        },
+        'mods': {
+            'drive': drive_file_info(drive_mods) if drive_mods else None,
+            'local': local_folder_info(local_mods_path, max_age) if os.path.isdir(local_mods_path) else None,
+        },
+    }
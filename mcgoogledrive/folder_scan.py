@@ -0,0 +1,77 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from mcgoogledrive.metrics import stage, SCAN
+
+FolderStats = namedtuple('FolderStats', ['size', 'latest_mtime', 'file_count'])
+
+# Minecraft 原地改写区域文件时不会更新目录的修改时间，因此缓存另有时效上限
+DEFAULT_MAX_AGE = 10
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _scan(folder_path):
+    """一次遍历同时统计总大小、最新修改时间和文件数，记录每个文件的 (相对路径, 大小, 修改时间) 和每个目录的修改时间"""
+    size = 0
+    latest = None
+    count = 0
+    files = []
+    dir_mtimes = {folder_path: os.stat(folder_path).st_mtime_ns}
+    stack = [folder_path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    dir_mtimes[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+                elif entry.is_file():
+                    stat = entry.stat()
+                    size += stat.st_size
+                    count += 1
+                    if latest is None or stat.st_mtime > latest:
+                        latest = stat.st_mtime
+                    arcname = os.path.relpath(entry.path, folder_path).replace(os.sep, '/')
+                    files.append((arcname, stat.st_size, stat.st_mtime_ns))
+    return FolderStats(size, latest, count), files, dir_mtimes
+
+def _dirs_unchanged(dir_mtimes):
+    try:
+        return all(os.stat(path).st_mtime_ns == mtime for path, mtime in dir_mtimes.items())
+    except OSError:
+        return False
+
+def _cached_scan(folder_path, max_age):
+    key = os.path.abspath(folder_path)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached and max_age > 0:
+        stats, files, dir_mtimes, scanned_at = cached
+        if time.monotonic() - scanned_at <= max_age and _dirs_unchanged(dir_mtimes):
+            return stats, files
+    with stage(SCAN):
+        stats, files, dir_mtimes = _scan(key)
+    with _cache_lock:
+        _cache[key] = (stats, files, dir_mtimes, time.monotonic())
+    return stats, files
+
+def scan_folder(folder_path, max_age=DEFAULT_MAX_AGE):
+    """返回文件夹统计信息；所有目录的修改时间未变且缓存未过期时直接返回缓存结果"""
+    return _cached_scan(folder_path, max_age)[0]
+
+def scan_files(folder_path, max_age=0):
+    """返回文件夹中每个文件的 (相对路径, 大小, 修改时间纳秒)，与 scan_folder 共用同一次遍历和缓存
+
+    默认总是重新遍历（结果仍写入缓存供 scan_folder 使用）：就地改写的文件不会改变目录的修改时间，
+    用来判断是否需要同步时不能接受过期的结果。
+    """
+    return _cached_scan(folder_path, max_age)[1]
+
+def invalidate(folder_path=None):
+    """丢弃指定文件夹（或全部）的缓存，例如在本程序写入文件之后"""
+    with _cache_lock:
+        if folder_path is None:
+            _cache.clear()
+        else:
+            _cache.pop(os.path.abspath(folder_path), None)
@@ -0,0 +1,443 @@
+import os
+import re
+import json
+import time
+import uuid
+import email
+import atexit
+import hashlib
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from mcgoogledrive.bandwidth import TokenBucket
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+UPLOAD_SESSION_PATH = '/upload/session/'
+BATCH_PATH = '/batch/drive/v3'
+# 与 Google Drive 相同：每个批量请求最多 100 个子请求
+MAX_BATCH_SIZE = 100
+METADATA_FILE = 'files.json'
+CONTENT_FOLDER = 'content'
+UPLOADS_FOLDER = 'uploads'
+DEFAULT_PAGE_SIZE = 100
+
+# 辅助函数
+
+def now_rfc3339():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+def _read_body(body):
+    """请求体可能是 bytes、str 或 googleapiclient 分块上传时的流对象"""
+    if body is None:
+        return b''
+    if hasattr(body, 'read'):
+        return body.read()
+    return body.encode('utf-8') if isinstance(body, str) else bytes(body)
+
+def parse_fields(fields):
+    """把 "nextPageToken, files(id, name)" 解析为 {字段: 子字段}，子字段为 None 表示全部返回"""
+    spec = {}
+    name = ''
+    depth = 0
+    inner = ''
+    for char in (fields or '') + ',':
+        if depth:
+            if char == ')' and depth == 1:
+                depth = 0
+                continue
+            depth += {'(': 1, ')': -1}.get(char, 0)
+            inner += char
+        elif char == '(':
+            depth = 1
+        elif char == ',':
+            if name.strip():
+                spec[name.strip()] = parse_fields(inner) if inner else None
+            name, inner = '', ''
+        else:
+            name += char
+    return spec
+
+def select_fields(value, spec):
+    """按 fields 参数裁剪响应，与 Google Drive 一样只返回请求的字段"""
+    if not spec:
+        return value
+    if isinstance(value, list):
+        return [select_fields(item, spec) for item in value]
+    if isinstance(value, dict):
+        return {key: select_fields(value[key], sub) for key, sub in spec.items() if key in value}
+    return value
+
+def _parse_query(q):
+    """解析本程序用到的 files().list 查询条件，返回判断函数"""
+    tests = []
+    for clause in re.split(r'\s+and\s+', q.strip()) if q else []:
+        match = re.fullmatch(r'''['"](.+)['"]\s+in\s+parents''', clause)
+        if match:
+            tests.append(lambda file, parent=match.group(1): parent in file.get('parents', []))
+            continue
+        match = re.fullmatch(r'''(name|mimeType)\s*(=|!=)\s*['"](.*)['"]''', clause)
+        if match:
+            key, op, value = match.groups()
+            tests.append(lambda file, key=key, op=op, value=value: (file.get(key) == value) == (op == '='))
+            continue
+        match = re.fullmatch(r'trashed\s*=\s*(true|false)', clause)
+        if match:
+            tests.append(lambda file, trashed=match.group(1) == 'true': file.get('trashed', False) == trashed)
+            continue
+        raise ValueError(f'不支持的查询条件：{clause}')
+    return lambda file: all(test(file) for test in tests)
+
+class LocalDrive:
+    """在本机模拟 Google Drive v3 的文件存储，供基准测试和无账号的回归测试使用
+
+    root 为空时全部保存在内存中；否则元数据写入 root/files.json，文件内容保存在 root/content/。
+    latency 为每个请求附加的往返延迟（秒），upload_bandwidth / download_bandwidth 为所有连接
+    共用的上下行带宽（字节/秒，0 表示不限）。
+    """
+
+    def __init__(self, root=None, latency=0, upload_bandwidth=0, download_bandwidth=0):
+        self.root = root
+        self.latency = latency
+        self.uplink = TokenBucket(upload_bandwidth)
+        self.downlink = TokenBucket(download_bandwidth)
+        self.files = {}
+        self.changes = []
+        self._contents = {}
+        self._sessions = {}
+        self._dirty = False
+        self._lock = threading.RLock()
+        if root:
+            # 每次修改都重写元数据文件太慢，改为退出时（或调用 flush 时）保存
+            atexit.register(self.flush)
+            os.makedirs(os.path.join(root, CONTENT_FOLDER), exist_ok=True)
+            os.makedirs(os.path.join(root, UPLOADS_FOLDER), exist_ok=True)
+            metadata_path = os.path.join(root, METADATA_FILE)
+            if os.path.exists(metadata_path):
+                with open(metadata_path, 'r') as f:
+                    state = json.load(f)
+                self.files = state['files']
+                self.changes = state['changes']
+
+    # 内容存储
+
+    def _content_path(self, file_id):
+        return os.path.join(self.root, CONTENT_FOLDER, file_id)
+
+    def read(self, file_id, start=0, end=None):
+        """读取 [start, end] 闭区间的内容，end 为空时读到末尾"""
+        size = int(self.files[file_id].get('size', 0))
+        end = size - 1 if end is None else min(end, size - 1)
+        if end < start:
+            return b''
+        if not self.root:
+            return bytes(self._contents[file_id][start:end + 1])
+        with open(self._content_path(file_id), 'rb') as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def _store(self, file_id, data=None, session_id=None):
+        """保存文件内容（直接给出数据，或提交一个上传会话），返回 (大小, MD5)"""
+        if not self.root:
+            content = data if session_id is None else self._sessions[session_id]['data']
+            self._contents[file_id] = bytes(content)
+            return len(content), hashlib.md5(content).hexdigest()
+        path = self._content_path(file_id)
+        if session_id is None:
+            with open(path, 'wb') as f:
+                f.write(data)
+        else:
+            os.replace(os.path.join(self.root, UPLOADS_FOLDER, session_id), path)
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return os.path.getsize(path), digest.hexdigest()
+
+    def flush(self):
+        """把元数据写入 root/files.json"""
+        with self._lock:
+            # 目录已被删除（例如基准测试的临时目录）时没有可保存的地方
+            if not self.root or not self._dirty or not os.path.isdir(self.root):
+                return
+            self._dirty = False
+            temp_path = os.path.join(self.root, f'{METADATA_FILE}.tmp')
+            with open(temp_path, 'w') as f:
+                json.dump({'files': self.files, 'changes': self.changes}, f)
+            os.replace(temp_path, os.path.join(self.root, METADATA_FILE))
+
+    # 文件操作
+
+    def _record_change(self, file_id):
+        self.changes.append(file_id)
+        self._dirty = True
+
+    def create(self, metadata, data=None, session_id=None):
+        with self._lock:
+            file_id = uuid.uuid4().hex
+            stamp = now_rfc3339()
+            file = {'id': file_id, 'name': metadata.get('name', 'Untitled'),
+                    'mimeType': metadata.get('mimeType', 'application/octet-stream'),
+                    'parents': metadata.get('parents', []), 'createdTime': stamp, 'modifiedTime': stamp, 'trashed': False}
+            if file['mimeType'] != FOLDER_MIME_TYPE:
+                size, md5 = self._store(file_id, data or b'', session_id)
+                file.update(size=str(size), md5Checksum=md5)
+            self.files[file_id] = file
+            self._record_change(file_id)
+            return dict(file)
+
+    def update(self, file_id, metadata=None, data=None, session_id=None):
+        with self._lock:
+            file = self._get(file_id)
+            file.update({key: value for key, value in (metadata or {}).items() if key in ('name', 'mimeType', 'trashed')})
+            if data is not None or session_id is not None:
+                size, md5 = self._store(file_id, data, session_id)
+                file.update(size=str(size), md5Checksum=md5)
+            file['modifiedTime'] = now_rfc3339()
+            self._record_change(file_id)
+            return dict(file)
+
+    def delete(self, file_id):
+        with self._lock:
+            self._get(file_id)
+            del self.files[file_id]
+            self._contents.pop(file_id, None)
+            if self.root and os.path.exists(self._content_path(file_id)):
+                os.remove(self._content_path(file_id))
+            self._record_change(file_id)
+
+    def _get(self, file_id):
+        file = self.files.get(file_id)
+        if file is None:
+            raise KeyError(file_id)
+        return file
+
+    def get(self, file_id):
+        with self._lock:
+            return dict(self._get(file_id))
+
+    def list(self, q=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        with self._lock:
+            matches = [dict(file) for file in self.files.values() if _parse_query(q)(file)]
+        offset = int(page_token or 0)
+        result = {'files': matches[offset:offset + page_size]}
+        if offset + page_size < len(matches):
+            result['nextPageToken'] = str(offset + page_size)
+        return result
+
+    def list_changes(self, page_token, page_size=DEFAULT_PAGE_SIZE):
+        with self._lock:
+            offset = int(page_token)
+            changes = []
+            for file_id in self.changes[offset:offset + page_size]:
+                file = self.files.get(file_id)
+                change = {'fileId': file_id, 'removed': file is None}
+                if file:
+                    change['file'] = dict(file)
+                changes.append(change)
+            result = {'changes': changes}
+            if offset + page_size < len(self.changes):
+                result['nextPageToken'] = str(offset + page_size)
+            else:
+                result['newStartPageToken'] = str(len(self.changes))
+            return result
+
+    # 可恢复上传会话
+
+    def start_session(self, metadata, file_id=None, total=None):
+        with self._lock:
+            session_id = uuid.uuid4().hex
+            self._sessions[session_id] = {'metadata': metadata, 'file_id': file_id, 'total': total, 'received': 0,
+                                          'data': bytearray()}
+            if self.root:
+                open(os.path.join(self.root, UPLOADS_FOLDER, session_id), 'wb').close()
+            return session_id
+
+    def append(self, session_id, start, data, total):
+        """写入一个分块，返回 (已接收字节数, 完成时的文件元数据)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise KeyError(session_id)
+            if start != session['received']:
+                # 与服务端已确认的进度不一致，客户端需要先查询进度
+                return session['received'], None
+            if self.root:
+                with open(os.path.join(self.root, UPLOADS_FOLDER, session_id), 'ab') as f:
+                    f.write(data)
+            else:
+                session['data'] += data
+            session['received'] += len(data)
+            if total is not None:
+                session['total'] = total
+            if session['total'] is None or session['received'] < session['total']:
+                return session['received'], None
+            if session['file_id']:
+                file = self.update(session['file_id'], session['metadata'], session_id=session_id)
+            else:
+                file = self.create(session['metadata'], session_id=session_id)
+            del self._sessions[session_id]
+            return session['received'], file
+
+    def session_progress(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return None if session is None else session['received']
+
+class LocalDriveHttp:
+    """httplib2.Http 的替代品：把 googleapiclient 发出的 Drive v3 REST 请求交给 LocalDrive 处理
+
+    googleapiclient 的请求构造、分块上传、断点查询、Range 下载等逻辑都照常执行，
+    因此用它构建的 service 与真实的 Google Drive service 走的是同一套代码路径。
+    """
+
+    def __init__(self, drive):
+        self.drive = drive
+        # googleapiclient 会读取这些属性
+        self.timeout = None
+        self.redirect_codes = set()
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        import httplib2
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        body = _read_body(body)
+        self.drive.uplink.consume(len(body))
+        if self.drive.latency:
+            time.sleep(self.drive.latency)
+        if urlsplit(uri).path == BATCH_PATH:
+            status, response_headers, content = self._batch(body, headers)
+        else:
+            status, response_headers, content = self._respond(uri, method, body, headers)
+        self.drive.downlink.consume(len(content))
+        response = httplib2.Response(dict(response_headers, status=str(status)))
+        response.status = status
+        return response, content
+
+    def _respond(self, uri, method, body, headers):
+        """处理单个请求，返回 (状态码, 响应头, 响应体 bytes)"""
+        fields = parse_qs(urlsplit(uri).query).get('fields', [None])[-1]
+        try:
+            status, response_headers, content = self._dispatch(uri, method, body, headers)
+        except KeyError as e:
+            status, response_headers, content = 404, {}, self._error(404, f'File not found: {e}')
+        except ValueError as e:
+            status, response_headers, content = 400, {}, self._error(400, str(e))
+        if status >= 400:
+            fields = None
+        if isinstance(content, (dict, list)):
+            content = json.dumps(select_fields(content, parse_fields(fields))).encode('utf-8')
+            response_headers.setdefault('content-type', 'application/json; charset=UTF-8')
+        return status, response_headers, content
+
+    def _batch(self, body, headers):
+        """批量请求：multipart/mixed 中每个部分是一个 application/http 请求，按顺序处理后同样以 multipart/mixed 返回"""
+        message = email.message_from_bytes(b'Content-Type: ' + headers['content-type'].encode('utf-8') + b'\r\n\r\n' + body)
+        parts = message.get_payload()
+        if len(parts) > MAX_BATCH_SIZE:
+            return 400, {}, json.dumps(self._error(400, f'批量请求最多包含 {MAX_BATCH_SIZE} 个子请求')).encode('utf-8')
+        boundary = f'batch_{uuid.uuid4().hex}'
+        lines = []
+        for part in parts:
+            request_line, _, rest = part.get_payload().partition('\n')
+            method, path, _ = request_line.split(' ', 2)
+            inner = email.message_from_string(rest)
+            inner_headers = {key.lower(): value for key, value in inner.items()}
+            inner_body = inner.get_payload().encode('utf-8')
+            status, response_headers, content = self._respond(f'https://www.googleapis.com{path}', method, inner_body, inner_headers)
+            lines += [f'--{boundary}', 'Content-Type: application/http', f'Content-ID: <response-{part["Content-ID"][1:]}', '',
+                      f'HTTP/1.1 {status} {"OK" if status < 300 else "Error"}']
+            response_headers.setdefault('content-length', str(len(content)))
+            lines += [f'{key}: {value}' for key, value in response_headers.items()]
+            lines += ['', content.decode('utf-8')]
+        lines.append(f'--{boundary}--')
+        return 200, {'content-type': f'multipart/mixed; boundary={boundary}'}, '\r\n'.join(lines).encode('utf-8')
+
+    @staticmethod
+    def _error(code, message):
+        return {'error': {'code': code, 'message': message, 'errors': [{'message': message, 'reason': 'notFound' if code == 404 else 'invalid'}]}}
+
+    def _dispatch(self, uri, method, body, headers):
+        parts = urlsplit(uri)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        path = parts.path
+        if path.startswith(UPLOAD_SESSION_PATH):
+            return self._upload_chunk(path[len(UPLOAD_SESSION_PATH):], body, headers)
+        if path.startswith('/upload/drive/v3/files'):
+            return self._upload(path[len('/upload/drive/v3/files'):].strip('/'), method, query, body, headers)
+        if path == '/drive/v3/changes/startPageToken':
+            return 200, {}, {'startPageToken': str(len(self.drive.changes))}
+        if path == '/drive/v3/changes':
+            return 200, {}, self.drive.list_changes(query['pageToken'], int(query.get('pageSize', DEFAULT_PAGE_SIZE)))
+        if path == '/drive/v3/files':
+            if method == 'GET':
+                return 200, {}, self.drive.list(query.get('q'), int(query.get('pageSize', DEFAULT_PAGE_SIZE)), query.get('pageToken'))
+            return 200, {}, self.drive.create(json.loads(body or b'{}'))
+        if path.startswith('/drive/v3/files/'):
+            file_id = path[len('/drive/v3/files/'):]
+            if method == 'DELETE':
+                self.drive.delete(file_id)
+                return 204, {}, b''
+            if method == 'PATCH':
+                return 200, {}, self.drive.update(file_id, json.loads(body or b'{}'))
+            if query.get('alt') == 'media':
+                return self._download(file_id, headers)
+            return 200, {}, self.drive.get(file_id)
+        raise ValueError(f'不支持的请求：{method} {path}')
+
+    def _download(self, file_id, headers):
+        size = int(self.drive.get(file_id).get('size', 0))
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', headers.get('range', ''))
+        if not match:
+            return 200, {'content-length': str(size)}, self.drive.read(file_id)
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+        if start >= size:
+            return 416, {'content-range': f'bytes */{size}'}, b''
+        return 206, {'content-range': f'bytes {start}-{end}/{size}'}, self.drive.read(file_id, start, end)
+
+    def _upload(self, file_id, method, query, body, headers):
+        upload_type = query.get('uploadType')
+        if upload_type == 'resumable':
+            metadata = json.loads(body) if body else {}
+            if 'x-upload-content-type' in headers and not file_id:
+                metadata.setdefault('mimeType', headers['x-upload-content-type'])
+            total = headers.get('x-upload-content-length')
+            if file_id:
+                self.drive.get(file_id)
+            session_id = self.drive.start_session(metadata, file_id or None, int(total) if total else None)
+            return 200, {'location': f'https://www.googleapis.com{UPLOAD_SESSION_PATH}{session_id}'}, b''
+        if upload_type == 'multipart':
+            message = email.message_from_bytes(b'Content-Type: ' + headers['content-type'].encode('utf-8') + b'\r\n\r\n' + body)
+            metadata_part, media_part = message.get_payload()
+            metadata = json.loads(metadata_part.get_payload(decode=True))
+            metadata.setdefault('mimeType', media_part.get_content_type())
+            data = media_part.get_payload(decode=True)
+        elif upload_type == 'media':
+            metadata, data = {}, body
+        else:
+            raise ValueError(f'不支持的上传方式：{upload_type}')
+        if file_id:
+            return 200, {}, self.drive.update(file_id, metadata, data=data)
+        return 200, {}, self.drive.create(metadata, data=data)
+
+    def _upload_chunk(self, session_id, body, headers):
+        content_range = headers.get('content-range', '')
+        match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+        query = re.fullmatch(r'bytes \*/(\d+|\*)', content_range)
+        if match:
+            start, _, total = match.groups()
+            received, file = self.drive.append(session_id, int(start), body, None if total == '*' else int(total))
+        elif query or not content_range:
+            # 查询进度（或空文件的最后一个分块）
+            total = query.group(1) if query else '0'
+            received = self.drive.session_progress(session_id)
+            if received is None:
+                raise KeyError(session_id)
+            file = None
+            if total != '*' and received == int(total):
+                received, file = self.drive.append(session_id, received, b'', int(total))
+        else:
+            raise ValueError(f'无效的 Content-Range：{content_range}')
+        if file:
+            return 200, {}, file
+        headers = {'range': f'bytes=0-{received - 1}'} if received else {}
+        return 308, headers, b''
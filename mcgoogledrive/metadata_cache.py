@@ -0,0 +1,142 @@
+import time
+import logging
+import threading
+from mcgoogledrive.batch import execute_batch
+
+FILE_FIELDS = 'id, name, mimeType, size, modifiedTime, md5Checksum, parents'
+DEFAULT_TTL = 300
+PAGE_SIZE = 1000
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(service, folder_id):
+    """返回专属文件夹的元数据缓存，同一 service 与文件夹共用一个实例"""
+    with _caches_lock:
+        cache = _caches.get(folder_id)
+        if cache is None or cache.service is not service:
+            cache = _caches[folder_id] = MetadataCache(service, folder_id)
+        return cache
+
+class MetadataCache:
+    """专属文件夹的 文件名 -> (id, size, modifiedTime, md5Checksum) 索引
+
+    首次访问时用分页 files().list 拉取全部子文件（第一页与变更记录游标合并为一次批量请求）；过期（TTL）后通过 Drive 变更记录增量刷新，
+    本程序自己的写入通过 put/remove 直接更新索引，因此一次典型同步只需一次元数据请求。
+    """
+
+    def __init__(self, service, folder_id, ttl=DEFAULT_TTL):
+        self.service = service
+        self.folder_id = folder_id
+        self.ttl = ttl
+        self._by_name = {}
+        self._names_by_id = {}
+        self._page_token = None
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def _expired(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _index(self, file):
+        current = self._by_name.get(file['name'])
+        if current and current['id'] != file['id'] and current.get('modifiedTime', '') > file.get('modifiedTime', ''):
+            return
+        self._by_name[file['name']] = file
+        self._names_by_id[file['id']] = file['name']
+
+    def _drop_id(self, file_id):
+        name = self._names_by_id.pop(file_id, None)
+        if name and self._by_name.get(name, {}).get('id') == file_id:
+            del self._by_name[name]
+
+    def refresh(self, full=False):
+        """刷新索引：已有变更记录游标时增量刷新，否则完整列出文件夹"""
+        with self._lock:
+            if not full and self._page_token:
+                try:
+                    self._apply_changes()
+                    self._loaded_at = time.monotonic()
+                    return
+                except Exception as e:
+                    logging.warning('增量刷新元数据失败，改为完整列出：%s', e)
+            self._list_all()
+
+    def _list_request(self, page_token):
+        return self.service.files().list(
+            q=f'"{self.folder_id}" in parents and trashed=false',
+            spaces='drive',
+            fields=f'nextPageToken, files({FILE_FIELDS})',
+            pageSize=PAGE_SIZE,
+            pageToken=page_token
+        )
+
+    def _list_all(self):
+        # 变更记录游标与第一页文件列表在同一个批量请求中获取
+        start, results = execute_batch(self.service, [self.service.changes().getStartPageToken(), self._list_request(None)])
+        self._page_token = start.get('startPageToken')
+        self._by_name = {}
+        self._names_by_id = {}
+        while True:
+            for file in results.get('files', []):
+                self._index(file)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+            results = self._list_request(page_token).execute()
+        self._loaded_at = time.monotonic()
+        logging.info('已缓存专属文件夹元数据，共 %d 个文件', len(self._by_name))
+
+    def _apply_changes(self):
+        page_token = self._page_token
+        while page_token:
+            results = self.service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                fields=f'nextPageToken, newStartPageToken, changes(fileId, removed, file(trashed, {FILE_FIELDS}))',
+                pageSize=PAGE_SIZE
+            ).execute()
+            for change in results.get('changes', []):
+                file = change.get('file')
+                self._drop_id(change['fileId'])
+                if change.get('removed') or not file or file.get('trashed'):
+                    continue
+                if self.folder_id in file.get('parents', []):
+                    file.pop('trashed', None)
+                    self._index(file)
+            if 'newStartPageToken' in results:
+                self._page_token = results['newStartPageToken']
+            page_token = results.get('nextPageToken')
+
+    def get(self, name):
+        """按文件名返回缓存的文件信息，不存在时返回 None"""
+        with self._lock:
+            if self._expired():
+                self.refresh()
+            file = self._by_name.get(name)
+            return dict(file) if file else None
+
+    def files(self):
+        with self._lock:
+            if self._expired():
+                self.refresh()
+            return [dict(file) for file in self._by_name.values()]
+
+    def put(self, file):
+        """记录本程序写入的文件（create/update 返回的元数据）"""
+        with self._lock:
+            if 'name' not in file:
+                self.invalidate()
+                return
+            self._drop_id(file['id'])
+            self._by_name[file['name']] = dict(file)
+            self._names_by_id[file['id']] = file['name']
+
+    def remove(self, file_id):
+        with self._lock:
+            self._drop_id(file_id)
+
+    def invalidate(self):
+        """下次访问时重新刷新"""
+        with self._lock:
+            self._loaded_at = None
@@ -0,0 +1,175 @@
+import json
+import time
+import logging
+import threading
+
+# 阶段名；UPLOAD / DOWNLOAD 与 bandwidth 中的传输方向同名同值
+SCAN = 'scan'
+HASH = 'hash'
+# 大文件按内容（或区域文件布局）切块
+CHUNK = 'chunk'
+COMPRESS = 'compress'
+UPLOAD = 'upload'
+DOWNLOAD = 'download'
+VERIFY = 'verify'
+EXTRACT = 'extract'
+STAGES = (SCAN, HASH, CHUNK, COMPRESS, UPLOAD, DOWNLOAD, VERIFY, EXTRACT)
+METRIC_PREFIX = 'mcgds'
+
+_enabled = False
+_trace = None
+_stats = {}
+_lock = threading.Lock()
+
+# 辅助函数
+
+def configure_metrics(enabled=True, trace_path=None):
+    """开启或关闭各阶段的统计；trace_path 不为空时把每次操作追加写入该 JSON Lines 文件"""
+    global _enabled, _trace
+    with _lock:
+        if _trace is not None:
+            _trace.close()
+            _trace = None
+        if enabled and trace_path:
+            _trace = open(trace_path, 'a', buffering=1, encoding='utf-8')
+        _enabled = bool(enabled)
+
+def is_enabled():
+    return _enabled
+
+def stage(name, **labels):
+    """统计一次操作的耗时与字节数：with stage(UPLOAD) as span: ... span.add(n)
+
+    关闭统计时返回共用的空操作对象，调用方不需要判断是否开启。
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+def retry(name):
+    """记录一次重试"""
+    if not _enabled:
+        return
+    with _lock:
+        _stage_stats(name)['retries'] += 1
+        _write_trace({'type': 'retry', 'stage': name, 'time': time.time()})
+
+def _stage_stats(name):
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = {'count': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0, 'bytes': 0}
+    return stats
+
+def _write_trace(record):
+    if _trace is not None:
+        _trace.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+def snapshot():
+    """返回 {阶段: {count, errors, retries, seconds, bytes, throughput}}
+
+    seconds 是所有线程的累计耗时，并发传输时可能大于实际经过的时间；throughput 为 bytes / seconds。
+    阶段之间可以嵌套（例如 scan 包含其中的 hash），各阶段分别统计。
+    """
+    with _lock:
+        result = {}
+        # 按处理流程的顺序排列阶段
+        for name in sorted(_stats, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+            stats = _stats[name]
+            item = dict(stats, seconds=round(stats['seconds'], 3))
+            item['throughput'] = round(stats['bytes'] / stats['seconds']) if stats['seconds'] else 0
+            result[name] = item
+        return result
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def prometheus_text():
+    """以 Prometheus 文本格式输出各阶段的累计值"""
+    metrics = [
+        ('operations_total', 'count', '各阶段完成的操作数'),
+        ('errors_total', 'errors', '各阶段失败的操作数'),
+        ('retries_total', 'retries', '各阶段的重试次数'),
+        ('seconds_total', 'seconds', '各阶段的累计耗时（秒）'),
+        ('bytes_total', 'bytes', '各阶段处理的字节数'),
+    ]
+    stats = snapshot()
+    lines = []
+    for suffix, key, description in metrics:
+        name = f'{METRIC_PREFIX}_stage_{suffix}'
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for stage_name in stats:
+            lines.append(f'{name}{{stage="{stage_name}"}} {stats[stage_name][key]}')
+    return '\n'.join(lines) + '\n'
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """在后台线程中提供 http://host:port/metrics，返回服务器对象（调用 shutdown() 停止）"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug('指标请求：%s', format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info('指标服务已启动：http://%s:%d/metrics', host, server.server_address[1])
+    return server
+
+class _Span:
+    """一次操作：退出 with 时把耗时、字节数和是否出错计入所属阶段"""
+
+    __slots__ = ('name', 'labels', 'bytes', '_started', '_wall')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.bytes = 0
+
+    def __enter__(self):
+        self._wall = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._started
+        with _lock:
+            stats = _stage_stats(self.name)
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['bytes'] += self.bytes
+            if exc_type is not None:
+                stats['errors'] += 1
+            _write_trace({'type': 'span', 'stage': self.name, 'time': self._wall, 'seconds': round(seconds, 6),
+                          'bytes': self.bytes, 'ok': exc_type is None, 'thread': threading.current_thread().name,
+                          **self.labels})
+        return False
+
+    def add(self, count):
+        self.bytes += count
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add(self, count):
+        pass
+
+_NULL_SPAN = _NullSpan()
@@ -0,0 +1,150 @@
+import mmap
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from mcgoogledrive.scheduler import check_cancelled, propagate
+from mcgoogledrive.resumable import is_transient, backoff_delay, MAX_RETRIES
+from mcgoogledrive.bandwidth import get_limiter, get_chunk_sizer, DOWNLOAD
+from mcgoogledrive.metrics import stage, retry as record_retry
+
+DEFAULT_DOWNLOAD_CONCURRENCY = 4
+DEFAULT_RANGE_SIZE = 16 * 1024 * 1024
+# 小于该大小的文件直接顺序下载，并发分段没有收益
+MIN_PARALLEL_SIZE = 2 * DEFAULT_RANGE_SIZE
+
+# 辅助函数
+
+class _RangeCursor:
+    """依次分出下一个要下载的字节区间；开启自适应分块时每段的大小按实测吞吐量和限速调整"""
+
+    def __init__(self, size, range_size=DEFAULT_RANGE_SIZE):
+        self.size = size
+        self.range_size = range_size
+        self.position = 0
+        self.limiter = get_limiter(DOWNLOAD)
+        self.sizer = get_chunk_sizer(DOWNLOAD, range_size)
+        self._lock = threading.Lock()
+
+    def next(self):
+        """返回下一个 (起始, 结束) 闭区间，全部分完时返回 None"""
+        with self._lock:
+            if self.position >= self.size:
+                return None
+            length = self.sizer.size_for(self.limiter) if self.sizer else self.range_size
+            start = self.position
+            self.position = min(start + length, self.size)
+            return start, self.position - 1
+
+    def fetch(self, service, file_id, start, end):
+        started = time.monotonic()
+        try:
+            data = fetch_range(service, file_id, start, end)
+        except Exception:
+            if self.sizer:
+                self.sizer.failed()
+            raise
+        if self.sizer:
+            self.sizer.record(len(data), time.monotonic() - started)
+        return data
+
+def get_file_size(service, file_id):
+    return int(service.files().get(fileId=file_id, fields='size').execute().get('size', 0))
+
+def fetch_range(service, file_id, start, end, max_retries=MAX_RETRIES):
+    """下载文件的一个字节区间，瞬时错误按指数退避重试，并经过共用的下载限速器"""
+    attempt = 0
+    while True:
+        check_cancelled()
+        request = service.files().get_media(fileId=file_id)
+        request.headers['Range'] = f'bytes={start}-{end}'
+        try:
+            with stage(DOWNLOAD) as span:
+                # service 的 HTTP 客户端按线程区分，多个线程可以同时请求
+                data = request.execute()
+                span.add(len(data))
+        except Exception as e:
+            if not is_transient(e) or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            record_retry(DOWNLOAD)
+            logging.warning('下载区间 %d-%d 出错（%s），%.1f 秒后第 %d 次重试', start, end, e, delay, attempt)
+            time.sleep(delay)
+            continue
+        if len(data) != end - start + 1:
+            raise IOError(f'区间 {start}-{end} 长度不符：{len(data)} bytes')
+        # 与其他下载共用限速器：收到数据后按字节数扣除令牌
+        get_limiter(DOWNLOAD).consume(len(data))
+        return data
+
+class _Progress:
+    """汇总多个线程的下载进度，进度百分比变化时写日志"""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.percent = -1
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.done += count
+            percent = int(self.done * 100 / self.total) if self.total else 100
+            if percent != self.percent:
+                self.percent = percent
+                logging.info('下载进度：%d%%', percent)
+
+def download_file_parallel(service, file_id, destination_path, size, concurrency=DEFAULT_DOWNLOAD_CONCURRENCY,
+                           range_size=DEFAULT_RANGE_SIZE, use_mmap=False):
+    """并发下载同一文件的多个字节区间，直接写入预分配好大小的目标文件"""
+    cursor = _RangeCursor(size, range_size)
+    logging.info('并发分段下载，共 %d bytes，并发数 %d', size, concurrency)
+    with open(destination_path, 'wb') as f:
+        f.truncate(size)
+    progress = _Progress(size)
+    with open(destination_path, 'r+b') as f:
+        mapped = mmap.mmap(f.fileno(), size) if use_mmap and size else None
+        write_lock = threading.Lock()
+
+        def fetch():
+            # 每个线程不断领取下一个区间，区间大小随吞吐量变化，不预先切分
+            while True:
+                byte_range = cursor.next()
+                if byte_range is None:
+                    return
+                start, end = byte_range
+                data = cursor.fetch(service, file_id, start, end)
+                if mapped is not None:
+                    mapped[start:end + 1] = data
+                else:
+                    with write_lock:
+                        f.seek(start)
+                        f.write(data)
+                progress.add(len(data))
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for future in [executor.submit(propagate(fetch)) for _ in range(concurrency)]:
+                    future.result()
+        finally:
+            if mapped is not None:
+                mapped.flush()
+                mapped.close()
+
+def iter_ranges_in_order(service, file_id, size, concurrency=DEFAULT_DOWNLOAD_CONCURRENCY, range_size=DEFAULT_RANGE_SIZE):
+    """并发预取后续区间，但按文件顺序逐段产出数据，供流式解压使用"""
+    cursor = _RangeCursor(size, range_size)
+    progress = _Progress(size)
+    pending = deque()
+    fetch = propagate(cursor.fetch)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        byte_range = cursor.next()
+        while byte_range or pending:
+            while byte_range and len(pending) < concurrency:
+                pending.append(executor.submit(fetch, service, file_id, *byte_range))
+                byte_range = cursor.next()
+            data = pending.popleft().result()
+            progress.add(len(data))
+            yield data
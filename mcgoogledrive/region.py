@@ -0,0 +1,67 @@
+import struct
+
+# 区域文件（.mca）布局：前 4KiB 为 1024 个区块的位置表（起始扇区 3 字节 + 扇区数 1 字节），
+# 接下来 4KiB 为各区块的最后保存时间，之后每个区块的压缩数据占用若干个连续的 4KiB 扇区
+SECTOR_SIZE = 4096
+HEADER_SIZE = 2 * SECTOR_SIZE
+CHUNKS_PER_REGION = 1024
+REGION_SUFFIXES = ('.mca', '.mcr')
+# 清单条目中 layout 的取值，表示该文件按区块布局切分
+REGION_LAYOUT = 'region'
+
+def is_region_file(name):
+    return name.endswith(REGION_SUFFIXES)
+
+def read_header(data):
+    """解析区域文件头部，返回 [(区块序号, 起始扇区, 扇区数, 时间戳)]，只包含已生成的区块"""
+    entries = []
+    for index in range(CHUNKS_PER_REGION):
+        location, = struct.unpack_from('>I', data, index * 4)
+        if not location:
+            continue
+        timestamp, = struct.unpack_from('>I', data, SECTOR_SIZE + index * 4)
+        entries.append((index, location >> 8, location & 0xFF, timestamp))
+    return entries
+
+def region_runs(data):
+    """返回各区块占用的字节区间 [(起始, 结束)]，按位置排列；头部损坏或区块相互重叠时返回 None"""
+    size = len(data)
+    if size < HEADER_SIZE:
+        return None
+    runs = []
+    for _, offset, count, _ in read_header(data):
+        start = offset * SECTOR_SIZE
+        if offset < 2 or not count or start >= size:
+            return None
+        runs.append((start, min(start + count * SECTOR_SIZE, size)))
+    runs.sort()
+    for (_, previous_end), (start, _) in zip(runs, runs[1:]):
+        if start < previous_end:
+            return None
+    return runs
+
+def region_boundaries(data, params):
+    """按区块布局切分区域文件，返回覆盖整个文件的 [(起始, 结束)]；不是合法的区域文件时返回 None
+
+    位置表和时间戳表各为一段，其余切点只取在区块（或空闲扇区）的边界上，并按 min_size 对齐的窗口合并：
+    同一窗口内开始的相邻区块合为一段。游戏改写区块时原地覆盖，放不下才追加到文件末尾，
+    所以其余段的位置和内容不变，只有被改写的区块所在的段需要上传。
+    """
+    runs = region_runs(data)
+    if runs is None:
+        return None
+    size = len(data)
+    cuts = sorted({HEADER_SIZE, size}.union(*runs))
+    window = max(params.min_size, SECTOR_SIZE)
+    boundaries = [(0, SECTOR_SIZE), (SECTOR_SIZE, HEADER_SIZE)]
+    start = HEADER_SIZE
+    for cut in cuts:
+        if cut <= start or (cut < size and cut // window == start // window):
+            continue
+        # 超大区块或大段空闲扇区按 max_size 拆开
+        while cut - start > params.max_size:
+            boundaries.append((start, start + params.max_size))
+            start += params.max_size
+        boundaries.append((start, cut))
+        start = cut
+    return boundaries
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from googleapiclient.errors import HttpError
+from mcgoogledrive.scheduler import check_cancelled
+from mcgoogledrive.bandwidth import get_limiter, get_chunk_sizer, UPLOAD
+from mcgoogledrive.metrics import stage, retry as record_retry
+
+UPLOAD_SESSIONS_FILE = 'config/upload_sessions.json'
+# Google Drive 的可恢复上传会话有效期约一周，留出余量
+SESSION_MAX_AGE = 6 * 24 * 3600
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_RETRIES = 8
+MAX_BACKOFF = 64
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+EXPIRED_STATUS = {404, 410}
+
+_sessions_lock = threading.Lock()
+
+# 辅助函数
+
+def align_chunk_size(chunk_size):
+    """可恢复上传的分块大小必须是 256 KiB 的整数倍"""
+    return max(1, int(chunk_size) // CHUNK_ALIGNMENT) * CHUNK_ALIGNMENT
+
+def error_status(error):
+    if isinstance(error, HttpError):
+        return getattr(error.resp, 'status', None)
+    return None
+
+def is_transient(error):
+    """网络错误与限流/服务端错误可以重试"""
+    if isinstance(error, HttpError):
+        return error_status(error) in TRANSIENT_STATUS
+    return isinstance(error, (OSError, ConnectionError, TimeoutError))
+
+def backoff_delay(attempt):
+    """指数退避加随机抖动"""
+    return min(2 ** attempt, MAX_BACKOFF) + random.random()
+
+def load_sessions():
+    if not os.path.exists(UPLOAD_SESSIONS_FILE):
+        return {}
+    try:
+        with open(UPLOAD_SESSIONS_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logging.warning('上传断点文件损坏，已忽略')
+        return {}
+
+def save_sessions(sessions):
+    os.makedirs(os.path.dirname(UPLOAD_SESSIONS_FILE), exist_ok=True)
+    temp_path = f'{UPLOAD_SESSIONS_FILE}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(sessions, f)
+    os.replace(temp_path, UPLOAD_SESSIONS_FILE)
+
+def query_progress(request):
+    """向服务端查询可恢复上传会话已接收的字节数；会话已失效或上传其实已经完成时返回 None（从头上传）"""
+    size = request.resumable.size()
+    headers = {'Content-Range': f'bytes */{"*" if size is None else size}', 'Content-Length': '0'}
+    response, content = request.http.request(request.resumable_uri, method='PUT', headers=headers)
+    if response.status == 308:
+        received = response.get('range')
+        return int(received.rsplit('-', 1)[1]) + 1 if received else 0
+    if response.status in EXPIRED_STATUS or response.status in (200, 201):
+        return None
+    raise HttpError(response, content, uri=request.resumable_uri)
+
+class UploadCheckpoint:
+    """把可恢复上传的会话地址和已确认字节数保存到 config/，程序重启后可以从断点继续
+
+    file_path 为上传的本地文件，source 为生成上传内容的来源指纹（如存档文件夹的 tree_fingerprint）；
+    只有两者都未变化时才会复用断点。流式上传没有本地文件，只按 source 判断。
+    """
+
+    def __init__(self, key, file_path=None, source=None):
+        self.key = key
+        self.fingerprint = {}
+        if file_path:
+            stat = os.stat(file_path)
+            self.fingerprint = {'path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+        if source is not None:
+            self.fingerprint['source'] = source
+
+    def _session(self):
+        with _sessions_lock:
+            session = load_sessions().get(self.key)
+        if not session:
+            return None
+        if session.get('file') != self.fingerprint or time.time() - session.get('created', 0) > SESSION_MAX_AGE:
+            self.clear()
+            return None
+        return session
+
+    def available(self):
+        """是否存在可以继续的断点"""
+        return self._session() is not None
+
+    def restore(self, request):
+        """若存在有效断点，向服务端查询实际已接收的字节数并设置到请求上，返回是否恢复"""
+        session = self._session()
+        if not session:
+            return False
+        request.resumable_uri = session['uri']
+        try:
+            progress = query_progress(request)
+        except Exception as e:
+            logging.warning('查询上传断点失败，从头开始上传：%s', e)
+            progress = None
+        if progress is None:
+            self.clear()
+            reset_session(request)
+            return False
+        request.resumable_progress = progress
+        logging.info('从断点继续上传，已确认 %s bytes', progress)
+        return True
+
+    def save(self, request):
+        if not request.resumable_uri:
+            return
+        with _sessions_lock:
+            sessions = load_sessions()
+            session = sessions.get(self.key)
+            if not session or session.get('uri') != request.resumable_uri:
+                session = {'uri': request.resumable_uri, 'file': self.fingerprint, 'created': time.time()}
+            session['progress'] = request.resumable_progress
+            sessions[self.key] = session
+            save_sessions(sessions)
+
+    def clear(self):
+        with _sessions_lock:
+            sessions = load_sessions()
+            if sessions.pop(self.key, None) is not None:
+                save_sessions(sessions)
+
+def reset_session(request):
+    """放弃当前会话，下次调用 next_chunk 时重新发起上传"""
+    request.resumable_uri = None
+    request.resumable_progress = 0
+
+def _sent_bytes(request, status, progress, chunk_size):
+    """本次 next_chunk 发送的字节数；上传完成时没有 status，按总大小（未知时按分块大小）估算"""
+    if status:
+        return status.resumable_progress - progress
+    size = request.resumable.size()
+    return size - progress if size is not None else chunk_size
+
+def execute_resumable(request, checkpoint=None, max_retries=MAX_RETRIES):
+    """分块执行可恢复上传，瞬时错误按指数退避重试，每个分块确认后更新断点
+
+    每个分块发送后按实际字节数经过共用的上传限速器；开启自适应分块时，按实测吞吐量调整下一个分块的大小。
+    """
+    limiter = get_limiter(UPLOAD)
+    sizer = get_chunk_sizer(UPLOAD, request.resumable.chunksize())
+    attempt = 0
+    response = None
+    while response is None:
+        check_cancelled()
+        if sizer:
+            # MediaFileUpload / PipeUpload 每次请求都从 chunksize() 读取分块大小
+            request.resumable._chunksize = sizer.size_for(limiter)
+        chunk_size = request.resumable.chunksize()
+        progress = request.resumable_progress
+        started = time.monotonic()
+        try:
+            with stage(UPLOAD) as span:
+                status, response = request.next_chunk()
+                sent = _sent_bytes(request, status, progress, chunk_size)
+                span.add(sent)
+        except Exception as e:
+            if sizer:
+                sizer.failed()
+            if error_status(e) in EXPIRED_STATUS and request.resumable_uri:
+                logging.warning('上传会话已失效，从头开始上传')
+                if checkpoint:
+                    checkpoint.clear()
+                reset_session(request)
+                continue
+            if not is_transient(e) or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            record_retry(UPLOAD)
+            logging.warning('上传出错（%s），%.1f 秒后第 %d 次重试', e, delay, attempt)
+            time.sleep(delay)
+            continue
+        attempt = 0
+        limiter.consume(sent)
+        if sizer and sent >= chunk_size:
+            sizer.record(sent, time.monotonic() - started)
+        if status:
+            if status.total_size:
+                logging.info('上传进度：%d%%', int(status.progress() * 100))
+            else:
+                logging.info('已上传 %s bytes', status.resumable_progress)
+            if checkpoint:
+                checkpoint.save(request)
+    if checkpoint:
+        checkpoint.clear()
+    return response
+
+def execute_simple(request, size, max_retries=MAX_RETRIES):
+    """执行一次性上传（multipart）的请求，瞬时错误按指数退避重试
+
+    小文件不值得先建立可恢复上传会话再发送数据，一次请求即可完成；请求体已在内存中，重试时原样重发。
+    """
+    attempt = 0
+    while True:
+        check_cancelled()
+        try:
+            with stage(UPLOAD) as span:
+                response = request.execute()
+                span.add(size)
+        except Exception as e:
+            if not is_transient(e) or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            record_retry(UPLOAD)
+            logging.warning('上传出错（%s），%.1f 秒后第 %d 次重试', e, delay, attempt)
+            time.sleep(delay)
+            continue
+        get_limiter(UPLOAD).consume(size)
+        return response
@@ -0,0 +1,176 @@
+import time
+import logging
+import itertools
+import threading
+
+DEFAULT_MAX_WORKERS = 2
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+_current = threading.local()
+
+class JobCancelled(Exception):
+    """任务被取消时，由正在执行的同步代码在检查点抛出"""
+
+def check_cancelled():
+    """在长时间运行的循环中调用：当前线程的任务被取消时抛出 JobCancelled"""
+    job = getattr(_current, 'job', None)
+    if job is not None and job.cancel_event.is_set():
+        raise JobCancelled(f'任务 "{job.name}" 已取消')
+
+def propagate(fn):
+    """包装 fn，使其在其他线程（线程池、生产者线程）中执行时仍能响应当前任务的取消"""
+    job = getattr(_current, 'job', None)
+
+    def run(*args, **kwargs):
+        _current.job = job
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.job = None
+    return run
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, name, target, fn, args, kwargs):
+        self.id = next(self._ids)
+        self.name = name
+        self.target = target
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = PENDING
+        self.error = None
+        self.created = time.time()
+        self.cancel_event = threading.Event()
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'target': self.target, 'status': self.status, 'error': self.error}
+
+class JobScheduler:
+    """同步任务调度器
+
+    - 固定数量的工作线程，限制同时进行的同步任务数
+    - 同一目标（某个存档 / MOD）同一时间只运行一个任务
+    - 与等待中的任务名称和目标都相同的新任务会被合并
+    - 等待中的任务可直接取消，运行中的任务在下一个检查点（check_cancelled）停止
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max(1, int(max_workers))
+        self._jobs = []
+        self._running_targets = set()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._stopped = False
+
+    def submit(self, name, target, fn, *args, **kwargs):
+        """提交任务，返回 Job；已有相同的等待中任务时直接返回该任务"""
+        with self._cond:
+            for job in self._jobs:
+                if job.status == PENDING and job.name == name and job.target == target:
+                    logging.info('任务 "%s" 已在队列中，忽略重复提交', name)
+                    return job
+            job = Job(name, target, fn, args, kwargs)
+            self._jobs.append(job)
+            self._ensure_workers()
+            self._cond.notify_all()
+        logging.info('任务 "%s" 已加入队列（#%d）', name, job.id)
+        return job
+
+    def cancel(self, job_id=None):
+        """取消指定任务；job_id 为空时取消全部等待中和运行中的任务"""
+        cancelled = 0
+        with self._cond:
+            for job in self._jobs:
+                if job_id is not None and job.id != job_id:
+                    continue
+                if job.status == PENDING:
+                    job.status = CANCELLED
+                    cancelled += 1
+                elif job.status == RUNNING and not job.cancel_event.is_set():
+                    job.cancel_event.set()
+                    cancelled += 1
+            self._cond.notify_all()
+        return cancelled
+
+    def status(self):
+        """返回未结束任务和最近结束任务的状态列表"""
+        with self._cond:
+            self._prune()
+            return [job.to_dict() for job in self._jobs]
+
+    def counts(self):
+        with self._cond:
+            running = sum(1 for job in self._jobs if job.status == RUNNING)
+            pending = sum(1 for job in self._jobs if job.status == PENDING)
+        return running, pending
+
+    def wait(self, job, timeout=None):
+        """等待任务结束，返回任务状态"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while job.status in (PENDING, RUNNING):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return job.status
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _prune(self, keep_finished=20):
+        finished = [job for job in self._jobs if job.status not in (PENDING, RUNNING)]
+        for job in finished[:-keep_finished]:
+            self._jobs.remove(job)
+
+    def _ensure_workers(self):
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _next_job(self):
+        for job in self._jobs:
+            if job.status == PENDING and job.target not in self._running_targets:
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None and not self._stopped:
+                    self._cond.wait()
+                    job = self._next_job()
+                if self._stopped:
+                    return
+                job.status = RUNNING
+                self._running_targets.add(job.target)
+            _current.job = job
+            try:
+                job.fn(*job.args, **job.kwargs)
+                status = CANCELLED if job.cancel_event.is_set() else DONE
+            except JobCancelled:
+                status = CANCELLED
+            except Exception as e:
+                logging.error('任务 "%s" 出错：%s', job.name, e)
+                job.error = str(e)
+                status = FAILED
+            finally:
+                _current.job = None
+            with self._cond:
+                job.status = status
+                self._running_targets.discard(job.target)
+                self._prune()
+                self._cond.notify_all()
+            logging.info('任务 "%s" 结束：%s', job.name, status)
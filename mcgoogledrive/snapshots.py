@@ -0,0 +1,158 @@
+import logging
+from datetime import datetime, timezone, timedelta
+from mcgoogledrive.metadata_cache import get_cache
+from mcgoogledrive.content_store import manifest_blobs, collecting, MANIFEST_SUFFIX
+from mcgoogledrive.batch import DriveBatch
+from mcgoogledrive.resumable import error_status
+from mcgoogledrive.scheduler import JobCancelled
+
+SNAPSHOT_FOLDER_NAME = 'snapshots'
+# 精确到微秒，同一秒内的多次上传各自保留快照，不会相互覆盖
+SNAPSHOT_TIME_FORMAT = '%Y%m%dT%H%M%S.%fZ'
+# 早期版本创建的快照只精确到秒
+LEGACY_SNAPSHOT_TIME_FORMAT = '%Y%m%dT%H%M%SZ'
+# 每个时间粒度保留最近多少个时间段（每段保留最新的一个快照）
+DEFAULT_RETENTION = {'hourly': 24, 'daily': 7, 'weekly': 4}
+RETENTION_PERIODS = {'hourly': 3600, 'daily': 86400, 'weekly': 7 * 86400}
+# 刚上传、清单还没来得及引用的数据块不回收
+GC_GRACE_SECONDS = 3600
+
+# 辅助函数
+
+def snapshot_name(target_name, when):
+    return f'{target_name}@{when.strftime(SNAPSHOT_TIME_FORMAT)}{MANIFEST_SUFFIX}'
+
+def parse_snapshot_name(name):
+    """解析快照文件名，返回 (目标名, UTC 时间)，不是快照时返回 None"""
+    if not name.endswith(MANIFEST_SUFFIX) or '@' not in name:
+        return None
+    target_name, _, stamp = name[:-len(MANIFEST_SUFFIX)].rpartition('@')
+    for time_format in (SNAPSHOT_TIME_FORMAT, LEGACY_SNAPSHOT_TIME_FORMAT):
+        try:
+            return target_name, datetime.strptime(stamp, time_format).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+def select_snapshots(times, retention):
+    """按保留策略选出要保留的快照时间：每个粒度取最近 N 个时间段各自最新的快照，最新快照总是保留"""
+    if not times:
+        return set()
+    newest_first = sorted(times, reverse=True)
+    keep = {newest_first[0]}
+    for period, count in retention.items():
+        seconds = RETENTION_PERIODS[period]
+        buckets = []
+        for when in newest_first:
+            bucket = int(when.timestamp() // seconds)
+            if not buckets or buckets[-1][0] != bucket:
+                buckets.append((bucket, when))
+        keep.update(when for _, when in buckets[:count])
+    return keep
+
+class SnapshotStore:
+    """存档的历史版本：每个快照是一份清单的副本，与当前清单共用 blobs 中的数据块
+
+    快照保存在专属文件夹的 snapshots 子文件夹中，文件名为 <存档名>@<UTC 时间>.manifest.json。
+    """
+
+    def __init__(self, content_store):
+        self.store = content_store
+        self.service = content_store.service
+        self._folder_id = None
+
+    @property
+    def folder_id(self):
+        if not self._folder_id:
+            self._folder_id = self.store.ensure_folder(SNAPSHOT_FOLDER_NAME)
+        return self._folder_id
+
+    @property
+    def metadata(self):
+        return get_cache(self.service, self.folder_id)
+
+    def list(self, target_name=None):
+        """返回 [(目标名, 时间, 文件信息)]，按时间从新到旧排列"""
+        snapshots = []
+        for file in self.metadata.files():
+            parsed = parse_snapshot_name(file['name'])
+            if parsed and (target_name is None or parsed[0] == target_name):
+                snapshots.append((parsed[0], parsed[1], file))
+        return sorted(snapshots, key=lambda item: item[1], reverse=True)
+
+    def create(self, target_name, manifest, when=None):
+        """把当前清单保存为一个快照；只上传清单本身，数据块与当前版本共用"""
+        when = when or datetime.now(timezone.utc)
+        name = snapshot_name(target_name, when)
+        existing = self.metadata.get(name)
+        file = self.store.write_json(dict(manifest, created=when.isoformat()), name, self.folder_id,
+                                     existing['id'] if existing else None)
+        self.metadata.put(file)
+        logging.info('已创建快照 "%s"', name)
+        return file
+
+    def load(self, target_name, when=None):
+        """读取指定时间（或之前最近）的快照清单；when 为空时读取最新快照"""
+        if when is not None and not when.microsecond:
+            # 列表只显示到秒，按秒指定的时间包含这一秒内创建的快照
+            when += timedelta(seconds=1) - timedelta(microseconds=1)
+        for _, snapshot_time, file in self.list(target_name):
+            if when is None or snapshot_time <= when:
+                return snapshot_time, self.store.read_json(file['id'])
+        return None, None
+
+    def prune(self, target_name, retention=DEFAULT_RETENTION):
+        """按保留策略删除旧快照，返回删除的数量"""
+        snapshots = self.list(target_name)
+        keep = select_snapshots([when for _, when, _ in snapshots], retention)
+        expired = [file for _, when, file in snapshots if when not in keep]
+        batch = DriveBatch(self.service)
+        for file in expired:
+            batch.add(self.service.files().delete(fileId=file['id']))
+        deleted = 0
+        for file, (_, error) in zip(expired, batch.execute()):
+            if error is not None and error_status(error) != 404:
+                logging.warning('删除快照 "%s" 失败：%s', file['name'], error)
+                continue
+            self.metadata.remove(file['id'])
+            deleted += 1
+        if deleted:
+            logging.info('按保留策略删除 "%s" 的 %d 个旧快照', target_name, deleted)
+        return deleted
+
+    def collect_garbage(self, grace_seconds=GC_GRACE_SECONDS):
+        """删除没有被任何当前清单或快照引用的数据块，返回删除的数量
+
+        本进程中有上传正在进行时等它们保存完清单再回收：上传可能复用了尚未被任何清单引用的旧数据块。
+        """
+        with collecting():
+            referenced = set()
+            manifests = [file for file in self.store.metadata.files() if file['name'].endswith(MANIFEST_SUFFIX)]
+            manifests += [file for _, _, file in self.list()]
+            for file in manifests:
+                referenced |= manifest_blobs(self.store.read_json(file['id']))
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+            unreferenced = []
+            for blob in self.store.list_blob_files():
+                if blob['name'] in referenced:
+                    continue
+                created = blob.get('createdTime')
+                if created and datetime.strptime(created, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc) > cutoff:
+                    continue
+                unreferenced.append(blob['name'])
+            deleted = self.store.delete_blobs(unreferenced)
+        logging.info('回收了 %d 个未被引用的数据块（共引用 %d 个）', deleted, len(referenced))
+        return deleted
+
+def take_snapshot(content_store, target_name, manifest, retention=DEFAULT_RETENTION):
+    """上传新版本后创建快照，按保留策略清理旧快照，有快照被删除时回收数据块"""
+    try:
+        snapshots = SnapshotStore(content_store)
+        snapshots.create(target_name, manifest)
+        if snapshots.prune(target_name, retention):
+            snapshots.collect_garbage()
+    except JobCancelled:
+        raise
+    except Exception as e:
+        # 快照只是附加的历史版本，失败不影响本次上传
+        logging.warning('创建 "%s" 的快照时出错：%s', target_name, e)
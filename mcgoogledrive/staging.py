@@ -0,0 +1,238 @@
+import os
+import sys
+import errno
+import zlib
+import shutil
+import logging
+
+# 暂存目录放在 .minecraft 下，不放进 saves/，以免游戏把暂存的存档当作世界列出
+STAGING_FOLDER = '.mcgoogledrive'
+_READ_SIZE = 1024 * 1024
+# Linux 的 FICLONE ioctl：在 Btrfs、XFS 等文件系统上克隆文件
+_FICLONE = 0x40049409
+# 已确认不支持克隆的设备，不再逐个文件尝试
+_no_clone = set()
+_clonefile = None
+
+# 辅助函数
+
+def _fsync_path(path, directory=False):
+    flags = os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError:
+        # Windows 不能以这种方式打开目录，重命名本身已经由文件系统保证原子性
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def fsync_tree(folder_path):
+    """把文件夹中所有文件的内容和目录项刷到磁盘"""
+    for root, _, files in os.walk(folder_path, topdown=False):
+        for file in files:
+            _fsync_path(os.path.join(root, file))
+        _fsync_path(root, directory=True)
+
+def file_crc32(file_path):
+    crc = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(_READ_SIZE)
+            if not data:
+                return crc
+            crc = zlib.crc32(data, crc)
+
+def _entry_parts(name):
+    """ZIP 内路径拆分为各级名称，越界或无法安全映射时返回 None"""
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or '..' in parts or ':' in parts[0]:
+        return None
+    return parts
+
+def _macos_clonefile():
+    global _clonefile
+    if _clonefile is None:
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            _clonefile = libc.clonefile
+            _clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32]
+        except (OSError, AttributeError):
+            _clonefile = False
+    return _clonefile
+
+def clone_file(source, target):
+    """在支持写时复制的文件系统上（APFS、Btrfs、XFS 等）克隆文件，返回是否成功
+
+    克隆不复制数据，但与硬链接不同，之后修改其中一个文件不会影响另一个。
+    """
+    try:
+        device = os.stat(source).st_dev
+    except OSError:
+        return False
+    if device in _no_clone:
+        return False
+    if sys.platform == 'darwin':
+        clonefile = _macos_clonefile()
+        if not clonefile:
+            _no_clone.add(device)
+            return False
+        if clonefile(os.fsencode(source), os.fsencode(target), 0) == 0:
+            return True
+        import ctypes
+        if ctypes.get_errno() in (errno.ENOTSUP, errno.EXDEV):
+            _no_clone.add(device)
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        # Windows 上没有可用的克隆接口
+        _no_clone.add(device)
+        return False
+    try:
+        with open(source, 'rb') as src, open(target, 'xb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            except OSError:
+                cloned = False
+            else:
+                cloned = True
+    except OSError:
+        return False
+    if not cloned:
+        _no_clone.add(device)
+        os.remove(target)
+        return False
+    shutil.copystat(source, target)
+    return True
+
+def shares_files(folder_path):
+    """文件夹中是否有文件还有其他硬链接"""
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            if os.stat(os.path.join(root, file)).st_nlink > 1:
+                return True
+    return False
+
+def link_unchanged(name, size, crc, source_dir, dest_dir):
+    """ZIP 条目与 source_dir 中对应文件的大小和 CRC 都相同时，把该文件克隆或硬链接到 dest_dir 的对应位置，返回是否已复用
+
+    只读取现有文件计算 CRC，不解压也不写入数据；文件系统既不支持克隆也不支持硬链接时返回 False，由调用方照常解压。
+    """
+    parts = _entry_parts(name)
+    if parts is None:
+        return False
+    source = os.path.join(source_dir, *parts)
+    try:
+        if not os.path.isfile(source) or os.path.getsize(source) != size or file_crc32(source) != crc:
+            return False
+        target = os.path.join(dest_dir, *parts)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not clone_file(source, target):
+            os.link(source, target)
+    except OSError:
+        return False
+    return True
+
+def link_or_copy(source, target):
+    """把 source 克隆或硬链接到 target，都不支持时复制"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if clone_file(source, target):
+        return
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+def _same_device(path, other):
+    try:
+        return os.stat(path).st_dev == os.stat(other).st_dev
+    except OSError:
+        return False
+
+class StagedFolder:
+    """先把文件夹的新内容写入同一文件系统上的暂存目录，完成后原子地替换目标文件夹
+
+    用法：with StagedFolder(target, staging_root) as staged: 把完整的新内容写入 staged.path。
+    正常退出时先 fsync 全部文件，再用两次重命名交换：目标 → 上一版本，暂存目录 → 目标；
+    出错（包括取消）时删除暂存目录，目标保持原样。交换失败时用上一版本回滚。
+    暂存目录完成后先改名为 .ready，进程在两次重命名之间崩溃时，下次恢复前会完成这次交换。
+
+    新内容中的文件都是新写入或克隆的时，上一版本是独立的副本，保留到下一次恢复；
+    有文件是从目标硬链接过来的时，上一版本与新版本共用这些文件的数据，游戏就地修改时会一起变化，
+    这样的上一版本不能用来找回旧存档，交换完成后即删除。
+    """
+
+    def __init__(self, target, staging_root=None):
+        self.target = os.path.abspath(target)
+        parent = os.path.dirname(self.target)
+        root = os.path.abspath(staging_root) if staging_root else parent
+        os.makedirs(parent, exist_ok=True)
+        os.makedirs(root, exist_ok=True)
+        if not _same_device(root, parent):
+            # 不在同一文件系统时无法原子重命名，改为暂存在目标旁边
+            root = parent
+        name = os.path.basename(self.target)
+        self.root = root
+        self.path = os.path.join(root, f'{name}.staging')
+        self.ready = os.path.join(root, f'{name}.ready')
+        self.previous = os.path.join(root, f'{name}.previous')
+
+    def recover(self):
+        """处理上次中断留下的暂存目录：已完成但未换入的补完交换，未完成的直接删除"""
+        if os.path.isdir(self.ready):
+            if os.path.exists(self.target):
+                shutil.rmtree(self.ready)
+            else:
+                logging.warning('上次恢复在替换 "%s" 时中断，继续完成替换', self.target)
+                os.rename(self.ready, self.target)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+
+    def __enter__(self):
+        self.recover()
+        os.makedirs(self.path)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            return False
+        try:
+            self.commit()
+        except BaseException:
+            shutil.rmtree(self.path, ignore_errors=True)
+            shutil.rmtree(self.ready, ignore_errors=True)
+            raise
+        return False
+
+    def commit(self):
+        fsync_tree(self.path)
+        shared = shares_files(self.path)
+        os.rename(self.path, self.ready)
+        _fsync_path(self.root, directory=True)
+        if os.path.exists(self.previous):
+            shutil.rmtree(self.previous)
+        replaced = os.path.exists(self.target)
+        if replaced:
+            os.rename(self.target, self.previous)
+        try:
+            os.rename(self.ready, self.target)
+        except OSError:
+            if replaced:
+                os.rename(self.previous, self.target)
+            raise
+        _fsync_path(os.path.dirname(self.target), directory=True)
+        _fsync_path(self.root, directory=True)
+        if not replaced:
+            return
+        if shared:
+            shutil.rmtree(self.previous, ignore_errors=True)
+            logging.info('已替换 "%s"', self.target)
+        else:
+            logging.info('已替换 "%s"，上一版本保存在 "%s"', self.target, self.previous)
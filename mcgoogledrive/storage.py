@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import logging
+import threading
+import weakref
+from mcgoogledrive.local_drive import LocalDrive, LocalDriveHttp
+
+DISCOVERY_CACHE_FILE = 'config/discovery_drive_v3.json'
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/drive/v3/rest'
+# 本地缓存的接口描述超过该时间后尝试重新下载（下载失败时仍使用旧的缓存）
+DISCOVERY_MAX_AGE = 7 * 24 * 3600
+
+_discovery = None
+_discovery_lock = threading.Lock()
+
+# 辅助函数
+
+def _fetch_discovery(http):
+    response, content = http.request(DISCOVERY_URL)
+    if response.status != 200:
+        raise IOError(f'下载 Drive v3 接口描述失败：HTTP {response.status}')
+    return content.decode('utf-8')
+
+def _save_discovery(text):
+    os.makedirs(os.path.dirname(DISCOVERY_CACHE_FILE), exist_ok=True)
+    temp_path = f'{DISCOVERY_CACHE_FILE}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, DISCOVERY_CACHE_FILE)
+
+def discovery_document(http=None):
+    """返回 Drive v3 的接口描述（已解析），进程内只加载一次
+
+    依次使用 googleapiclient 自带的静态描述、config/ 下的本地缓存；都没有（或缓存已过期）时用 http 下载并写入缓存，
+    因此每次绑定都不需要再请求发现服务。
+    """
+    global _discovery
+    with _discovery_lock:
+        if _discovery is not None:
+            return _discovery
+        text = None
+        try:
+            from googleapiclient.discovery_cache import get_static_doc
+            text = get_static_doc('drive', 'v3')
+        except ImportError:
+            pass
+        cached = os.path.exists(DISCOVERY_CACHE_FILE)
+        if text is None and cached and time.time() - os.path.getmtime(DISCOVERY_CACHE_FILE) <= DISCOVERY_MAX_AGE:
+            with open(DISCOVERY_CACHE_FILE, 'r', encoding='utf-8') as f:
+                text = f.read()
+        if text is None and http is not None:
+            try:
+                text = _fetch_discovery(http)
+                _save_discovery(text)
+            except Exception as e:
+                if not cached:
+                    raise
+                logging.warning('更新 Drive 接口描述失败，使用本地缓存：%s', e)
+        if text is None:
+            if not cached:
+                raise FileNotFoundError('没有可用的 Drive v3 接口描述')
+            with open(DISCOVERY_CACHE_FILE, 'r', encoding='utf-8') as f:
+                text = f.read()
+        _discovery = json.loads(text)
+        return _discovery
+
+class ThreadLocalHttp:
+    """httplib2.Http 接口的代理：每个线程使用各自的 HTTP 客户端（httplib2.Http 不是线程安全的）
+
+    同一线程的请求复用同一个客户端及其连接，线程池中的线程被重复使用时连接也随之复用；
+    用它构建的 service 可以在多个线程中同时使用，请求之间既不互相阻塞，也不会共用同一个连接。
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self._clients = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def get(self):
+        """返回当前线程的 HTTP 客户端，第一次调用时创建"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = self._factory()
+            with self._lock:
+                self._clients.add(http)
+        return http
+
+    def request(self, *args, **kwargs):
+        return self.get().request(*args, **kwargs)
+
+    def close(self):
+        """关闭所有线程的客户端保持的连接"""
+        with self._lock:
+            clients = list(self._clients)
+        for http in clients:
+            close = getattr(http, 'close', None)
+            if close:
+                close()
+
+    def __getattr__(self, name):
+        # googleapiclient 会读取 timeout、redirect_codes 等属性
+        return getattr(self.get(), name)
+
+class StorageBackend:
+    """远端存储后端：构建 Drive v3 接口的 service，并为并发传输的线程提供独立的 HTTP 客户端
+
+    同步代码只通过 service 发出 Drive v3 请求（files().list / create / update / get_media 等），
+    后端之间的区别只在传输层，所以请求构造、分块上传、Range 下载等逻辑对所有后端都相同。
+    """
+
+    name = None
+
+    def new_http(self):
+        """返回一个新的 HTTP 客户端（httplib2.Http 接口，不是线程安全的，每个线程各用一个）"""
+        raise NotImplementedError
+
+    def build_service(self):
+        """构建可在多个线程中共用的 service：接口描述只加载一次，请求经由各线程自己的 HTTP 客户端发出"""
+        from googleapiclient.discovery import build_from_document
+        http = ThreadLocalHttp(self.new_http)
+        service = build_from_document(discovery_document(http), http=http)
+        service.storage_backend = self
+        return service
+
+class GoogleDriveBackend(StorageBackend):
+    """真实的 Google Drive，使用 OAuth 凭据"""
+
+    name = 'google'
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    def new_http(self):
+        from googleapiclient.http import build_http
+        from google_auth_httplib2 import AuthorizedHttp
+        # build_http 设置默认超时，并且不把可恢复上传的 308 响应当作重定向
+        return AuthorizedHttp(self.credentials, http=build_http())
+
+class LocalDriveBackend(StorageBackend):
+    """本机模拟的 Google Drive：root 为空时保存在内存中，否则保存在该目录；可设置延迟和带宽"""
+
+    name = 'local'
+
+    def __init__(self, root=None, latency=0, upload_bandwidth=0, download_bandwidth=0):
+        self.drive = LocalDrive(root, latency=latency, upload_bandwidth=upload_bandwidth,
+                                download_bandwidth=download_bandwidth)
+
+    def new_http(self):
+        return LocalDriveHttp(self.drive)
+
+def backend_of(service):
+    """返回构建 service 的存储后端；直接用 build() 创建的 service 返回 None"""
+    return getattr(service, 'storage_backend', None)
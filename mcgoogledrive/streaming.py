@@ -0,0 +1,327 @@
+import os
+import struct
+import zlib
+import zipfile
+import threading
+import logging
+from googleapiclient.http import MediaUpload
+from mcgoogledrive.scheduler import check_cancelled, propagate, JobCancelled
+from mcgoogledrive.resumable import CHUNK_ALIGNMENT
+from mcgoogledrive.metrics import stage, EXTRACT
+from mcgoogledrive.staging import link_unchanged
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_BUFFER_SIZE = 32 * 1024 * 1024
+
+class PipeClosed(IOError):
+    """读取端已关闭管道（读取完成或出错），写入端应停止"""
+
+class BoundedPipe:
+    """有界内存管道：生产者线程写入，上传线程按字节偏移读取
+
+    只保留上传端尚未确认的字节，写入方在缓冲区满时阻塞，
+    因此内存占用上限约为 max_size，而不需要任何磁盘临时文件。
+    """
+
+    def __init__(self, max_size=DEFAULT_BUFFER_SIZE):
+        self.max_size = max_size
+        self._buffer = bytearray()
+        self._offset = 0  # _buffer[0] 对应的流内绝对偏移
+        self._closed = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def write(self, data):
+        with self._cond:
+            while len(self._buffer) >= self.max_size and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise PipeClosed('管道已关闭')
+            self._buffer += data
+            self._cond.notify_all()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self, error=None):
+        """结束写入；error 不为空时，读取端会收到该异常"""
+        with self._cond:
+            self._closed = True
+            if error is not None:
+                self._error = error
+            self._cond.notify_all()
+
+    def read(self, size):
+        """顺序读取最多 size 字节，流结束时返回 b''"""
+        with self._cond:
+            while len(self._buffer) < size and not self._closed:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._offset += len(data)
+            self._cond.notify_all()
+            return data
+
+    def read_range(self, begin, length):
+        """读取 [begin, begin + length) 的数据，begin 之前的字节视为已确认并释放"""
+        with self._cond:
+            if begin < self._offset:
+                raise ValueError(f'偏移 {begin} 的数据已被释放，无法重新读取')
+            # 从断点续传时 begin 可能超过已写入的数据，边等待写入边丢弃
+            while begin > self._offset:
+                if not self._buffer:
+                    if self._closed:
+                        break
+                    self._cond.wait()
+                    continue
+                skipped = min(len(self._buffer), begin - self._offset)
+                del self._buffer[:skipped]
+                self._offset += skipped
+                self._cond.notify_all()
+            while len(self._buffer) < length and not self._closed:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            return bytes(self._buffer[:length])
+
+class PipeUpload(MediaUpload):
+    """从 BoundedPipe 读取数据的可恢复上传，总大小未知，读到流末尾时结束上传"""
+
+    def __init__(self, pipe, mimetype='application/zip', chunksize=DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self._pipe = pipe
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+
+    def chunksize(self):
+        # 每个分块必须能完整放进管道，否则读取端等待的字节数超过写入端允许缓冲的上限
+        capacity = self._pipe.max_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT or self._pipe.max_size
+        return min(self._chunksize, capacity)
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return None
+
+    def resumable(self):
+        return True
+
+    def getbytes(self, begin, length):
+        return self._pipe.read_range(begin, length)
+
+    def has_stream(self):
+        return False
+
+    def to_json(self):
+        raise NotImplementedError('流式上传无法序列化')
+
+def start_producer(pipe, produce, label='流式压缩'):
+    """在后台线程中执行 produce(pipe)，结束或出错时关闭管道
+
+    读取端先关闭管道时（已读到需要的数据，或自身出错并已报告）生产者正常退出，不作为错误记录。
+    """
+    def run():
+        try:
+            produce(pipe)
+        except PipeClosed:
+            logging.debug('%s已停止：读取端关闭了管道', label)
+        except JobCancelled as e:
+            # 取消不是错误，由读取端抛出后交给任务调度器处理
+            pipe.close(error=e)
+        except Exception as e:
+            logging.error('%s出错：%s', label, e)
+            pipe.close(error=e)
+        else:
+            pipe.close()
+    thread = threading.Thread(target=propagate(run), daemon=True)
+    thread.start()
+    return thread
+
+# 流式解压：按本地文件头顺序解析 ZIP，数据到达即写盘，同时校验 CRC
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHLLLHH')
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+_CENTRAL_SIGNATURES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06')
+_ZIP64_EXTRA_ID = 0x0001
+_READ_SIZE = 1024 * 1024
+
+class _StreamReader:
+    """为顺序流提供精确读取与回退（unread）能力"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._pending = b''
+
+    def read(self, size):
+        if self._pending:
+            data, self._pending = self._pending[:size], self._pending[size:]
+            return data
+        return self._stream.read(size)
+
+    def read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            part = self.read(size - len(data))
+            if not part:
+                raise zipfile.BadZipFile('ZIP 数据流意外结束')
+            data += part
+        return data
+
+    def unread(self, data):
+        self._pending = data + self._pending
+
+    def skip(self, size):
+        while size > 0:
+            part = self.read(min(size, _READ_SIZE))
+            if not part:
+                raise zipfile.BadZipFile('ZIP 数据流意外结束')
+            size -= len(part)
+
+def _safe_target(extract_to, name):
+    """把 ZIP 内路径映射到解压目录，拒绝绝对路径和 .. 越界"""
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or '..' in parts or os.path.isabs(name) or ':' in parts[0]:
+        raise zipfile.BadZipFile(f'非法的 ZIP 条目路径：{name}')
+    return os.path.join(extract_to, *parts)
+
+def _zip64_extra(extra):
+    """返回 ZIP64 扩展字段的内容，不存在时返回 None"""
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, data_size = struct.unpack_from('<HH', extra, offset)
+        if header_id == _ZIP64_EXTRA_ID:
+            return extra[offset + 4:offset + 4 + data_size]
+        offset += 4 + data_size
+    return None
+
+def _copy_deflated(reader, out):
+    """解压 DEFLATE 数据直到压缩流结束，返回 (crc, 压缩大小, 原始大小)"""
+    decompressor = zlib.decompressobj(-15)
+    crc = compressed = size = 0
+    while not decompressor.eof:
+        chunk = reader.read(_READ_SIZE)
+        if not chunk:
+            raise zipfile.BadZipFile('DEFLATE 数据流意外结束')
+        data = decompressor.decompress(chunk)
+        compressed += len(chunk) - len(decompressor.unused_data)
+        if decompressor.unused_data:
+            reader.unread(decompressor.unused_data)
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+        out.write(data)
+    return crc, compressed, size
+
+def _copy_stored(reader, out, size):
+    """复制已知长度的未压缩数据，返回 CRC"""
+    crc = 0
+    remaining = size
+    while remaining:
+        data = reader.read(min(remaining, _READ_SIZE))
+        if not data:
+            raise zipfile.BadZipFile('ZIP 数据流意外结束')
+        crc = zlib.crc32(data, crc)
+        out.write(data)
+        remaining -= len(data)
+    return crc
+
+def _copy_stored_until_descriptor(reader, out, zip64):
+    """未压缩且长度写在数据描述符中的条目：扫描描述符签名，并以 CRC 和长度确认边界"""
+    size_format = '<LQQ' if zip64 else '<LLL'
+    descriptor_size = struct.calcsize(size_format)
+    crc = size = 0
+    window = b''
+    while True:
+        chunk = reader.read(_READ_SIZE)
+        if not chunk:
+            raise zipfile.BadZipFile('ZIP 数据流意外结束')
+        window += chunk
+        search_from = 0
+        while True:
+            index = window.find(_DESCRIPTOR_SIGNATURE, search_from)
+            if index < 0 or index + 4 + descriptor_size > len(window):
+                break
+            candidate_crc, compressed, file_size = struct.unpack_from(size_format, window, index + 4)
+            data = window[:index]
+            if compressed == file_size == size + len(data) and candidate_crc == zlib.crc32(data, crc):
+                out.write(data)
+                reader.unread(window[index + 4 + descriptor_size:])
+                return candidate_crc, size + len(data)
+            search_from = index + 1
+        # 保留可能跨块的签名与描述符，其余数据直接落盘
+        keep = 4 + descriptor_size - 1
+        if len(window) > keep:
+            data, window = window[:-keep], window[-keep:]
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            out.write(data)
+
+def _read_descriptor(reader, zip64):
+    size_format = '<LQQ' if zip64 else '<LLL'
+    head = reader.read_exact(4)
+    if head != _DESCRIPTOR_SIGNATURE:
+        reader.unread(head)
+    return struct.unpack(size_format, reader.read_exact(struct.calcsize(size_format)))
+
+def extract_stream(stream, extract_to, link_from=None):
+    """从顺序数据流（如 BoundedPipe）中边读边解压 ZIP，CRC 校验失败时抛出 BadZipFile
+
+    指定 link_from 时，本地文件头已给出大小和 CRC 的条目若与 link_from 中对应文件相同，直接硬链接并跳过其数据；
+    长度写在数据描述符中的条目（流式压缩生成的 ZIP）只能照常解压。
+    """
+    reader = _StreamReader(stream)
+    count = 0
+    while True:
+        check_cancelled()
+        signature = reader.read(4)
+        if len(signature) < 4 or signature in _CENTRAL_SIGNATURES:
+            break
+        if signature != _LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile('无效的 ZIP 本地文件头')
+        (_, _, flags, method, _, _, crc, compressed, file_size,
+         name_length, extra_length) = _LOCAL_HEADER.unpack(signature + reader.read_exact(_LOCAL_HEADER.size - 4))
+        raw_name = reader.read_exact(name_length)
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = reader.read_exact(extra_length)
+        zip64_extra = _zip64_extra(extra)
+        zip64 = zip64_extra is not None
+        has_descriptor = bool(flags & 0x08)
+        if zip64 and not has_descriptor and file_size == 0xFFFFFFFF:
+            file_size, compressed = struct.unpack_from('<QQ', zip64_extra)
+        if flags & 0x01:
+            raise zipfile.BadZipFile(f'不支持加密条目：{name}')
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise zipfile.BadZipFile(f'不支持的压缩方式 {method}：{name}')
+
+        target = _safe_target(extract_to, name)
+        if name.endswith('/'):
+            os.makedirs(target, exist_ok=True)
+            if has_descriptor:
+                _read_descriptor(reader, zip64)
+            continue
+        if link_from and not has_descriptor and link_unchanged(name, file_size, crc, link_from, extract_to):
+            reader.skip(compressed)
+            count += 1
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 解压阶段的耗时包括等待下载数据到达
+        with stage(EXTRACT) as span, open(target, 'wb') as out:
+            if method == zipfile.ZIP_DEFLATED:
+                actual_crc, _, actual_size = _copy_deflated(reader, out)
+                if has_descriptor:
+                    crc, _, file_size = _read_descriptor(reader, zip64)
+            elif has_descriptor:
+                crc, file_size = _copy_stored_until_descriptor(reader, out, zip64)
+                actual_crc, actual_size = crc, file_size
+            else:
+                actual_crc, actual_size = _copy_stored(reader, out, file_size), file_size
+            span.add(actual_size)
+        if actual_crc != crc or actual_size != file_size:
+            raise zipfile.BadZipFile(f'CRC 校验失败：{name}')
+        count += 1
+    logging.info('流式解压完成，共 %d 个文件', count)
+    return count
@@ -0,0 +1,68 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from mcgoogledrive.folder_scan import scan_files
+
+SYNC_STATE_FILE = 'config/sync_state.json'
+
+_state_lock = threading.Lock()
+
+# 辅助函数
+
+def tree_fingerprint(folder_path, exclude_files=None, max_age=0):
+    """只根据 相对路径/大小/修改时间 计算文件夹指纹，不读取文件内容；文件列表来自 folder_scan 的遍历"""
+    # 文件夹还不存在（例如首次下载）时与空文件夹的指纹相同
+    files = scan_files(folder_path, max_age=max_age) if os.path.isdir(folder_path) else []
+    entries = [f'{arcname}\0{size}\0{mtime_ns}' for arcname, size, mtime_ns in files
+               if not (exclude_files and arcname.rpartition('/')[2] in exclude_files)]
+    digest = hashlib.sha256()
+    for entry in sorted(entries):
+        digest.update(entry.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def load_state():
+    if not os.path.exists(SYNC_STATE_FILE):
+        return {}
+    try:
+        with open(SYNC_STATE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logging.warning('同步状态文件损坏，已忽略')
+        return {}
+
+def save_state(state):
+    os.makedirs(os.path.dirname(SYNC_STATE_FILE), exist_ok=True)
+    temp_path = f'{SYNC_STATE_FILE}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, SYNC_STATE_FILE)
+
+def state_key(folder_id, file_name, folder_path):
+    return f'{folder_id}/{file_name}|{os.path.abspath(folder_path)}'
+
+def is_unchanged(folder_id, file_name, folder_path, remote_file, fingerprint):
+    """本地文件夹与远端文件都和上次同步时一致时返回 True
+
+    远端以 md5Checksum 判断（来自元数据缓存，无需下载），本地以文件夹指纹判断。
+    """
+    if not remote_file or not remote_file.get('md5Checksum') or fingerprint is None:
+        return False
+    with _state_lock:
+        record = load_state().get(state_key(folder_id, file_name, folder_path))
+    return bool(record) and record.get('remote_md5') == remote_file['md5Checksum'] \
+        and record.get('fingerprint') == fingerprint
+
+def record_sync(folder_id, file_name, folder_path, remote_file, fingerprint):
+    """同步成功后记录本地指纹与远端 md5Checksum"""
+    if not remote_file or not remote_file.get('md5Checksum'):
+        return
+    with _state_lock:
+        state = load_state()
+        state[state_key(folder_id, file_name, folder_path)] = {
+            'fingerprint': fingerprint,
+            'remote_md5': remote_file['md5Checksum'],
+        }
+        save_state(state)
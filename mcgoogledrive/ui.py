@@ -3,11 +3,24 @@ import tkinter as tk
 from tkinter import filedialog, scrolledtext
 import threading
 import logging
-from datetime import datetime, timezone
+from collections import deque
+from functools import partial
 from mcgoogledrive.drive_sync import TOKEN_FILE, GoogleDriveSync
-from mcgoogledrive.config import load_config, save_config
+from mcgoogledrive.config import load_config, save_config, upload_options, download_options, batch_options, incremental_options, \
+    bandwidth_options, metrics_options
+from mcgoogledrive.bandwidth import configure_bandwidth, parse_rate
+from mcgoogledrive.metrics import configure_metrics
 from mcgoogledrive.utils import setup_logging
-from mcgoogledrive.file_operations import download_save, upload_save, download_mod, upload_mod
+from mcgoogledrive.file_operations import download_mod, upload_mod, download_saves, upload_saves, parse_world_patterns, is_batch, \
+    compare_versions
+from mcgoogledrive.folder_scan import DEFAULT_MAX_AGE
+from mcgoogledrive.content_store import manifest_name
+from mcgoogledrive.scheduler import JobScheduler, DEFAULT_MAX_WORKERS
+from mcgoogledrive.auto_sync import AutoSync, DEFAULT_DEBOUNCE, DEFAULT_QUIESCENCE
+
+LOG_MAX_LINES = 2000
+LOG_FLUSH_INTERVAL_MS = 100
+JOB_STATUS_INTERVAL_MS = 500
 
 class GoogleDriveSyncApp:
     def __init__(self, root):
@@ -17,6 +30,10 @@ class GoogleDriveSyncApp:
         self.root.title('Google Drive Sync Tool')
         self.drive_sync = GoogleDriveSync()
         self.config = load_config()
+        self.scheduler = JobScheduler(self.config.get('max_concurrent_jobs', DEFAULT_MAX_WORKERS))
+        self.auto_sync = None
+        self.apply_bandwidth()
+        configure_metrics(**metrics_options(self.config))
 
         # UI Elements
         self.setup_ui()
@@ -27,11 +44,11 @@ class GoogleDriveSyncApp:
 
     def setup_ui(self):
         logging.info('设置 UI 元素')
-        self.root.geometry('600x600')
+        self.root.geometry('600x640')
         self.root.configure(padx=20, pady=20)
 
         # 设置最小宽度
-        self.root.minsize(600, 600)
+        self.root.minsize(600, 640)
 
         # Google Drive 绑定按钮
         self.button_frame = tk.Frame(self.root)
@@ -69,6 +86,21 @@ class GoogleDriveSyncApp:
         self.folder_entry.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
         self.folder_entry.insert(0, self.config.get('save_folder', ''))
 
+        # 带宽限制输入框（每秒字节数，可写作 2M、512K，0 或留空表示不限速）
+        self.bandwidth_frame = tk.Frame(self.root)
+        self.bandwidth_frame.pack(fill='x', pady=5)
+        self.bandwidth_frame.columnconfigure([2, 4], weight=1)
+        self.bandwidth_label = tk.Label(self.bandwidth_frame, text='带宽限制', width=15, anchor='w')
+        self.bandwidth_label.grid(row=0, column=0, padx=5, pady=5)
+        tk.Label(self.bandwidth_frame, text='上传').grid(row=0, column=1, padx=5, pady=5)
+        self.upload_limit_entry = tk.Entry(self.bandwidth_frame)
+        self.upload_limit_entry.grid(row=0, column=2, padx=5, pady=5, sticky='ew')
+        self.upload_limit_entry.insert(0, str(self.config.get('upload_rate_limit') or ''))
+        tk.Label(self.bandwidth_frame, text='下载').grid(row=0, column=3, padx=5, pady=5)
+        self.download_limit_entry = tk.Entry(self.bandwidth_frame)
+        self.download_limit_entry.grid(row=0, column=4, padx=5, pady=5, sticky='ew')
+        self.download_limit_entry.insert(0, str(self.config.get('download_rate_limit') or ''))
+
         # 存档版本比较结果显示
         self.saves_version_frame = tk.Frame(self.root)
         self.saves_version_frame.pack(fill='x', pady=2)
@@ -149,6 +181,17 @@ class GoogleDriveSyncApp:
         self.version_compare_button = tk.Button(self.save_config_sub_frame, text='版本比较', command=self.version_compare_thread)
         self.version_compare_button.grid(row=0, column=1, padx=5, pady=5, sticky='ew')
 
+        # 任务队列状态与取消按钮
+        self.job_frame = tk.Frame(self.root)
+        self.job_frame.pack(fill='x', pady=5)
+        self.job_frame.columnconfigure(1, weight=1)
+        self.job_label = tk.Label(self.job_frame, text='任务队列', anchor='w', width=15)
+        self.job_label.grid(row=0, column=0, padx=5, pady=5, sticky='w')
+        self.job_status = tk.Label(self.job_frame, text='', anchor='w')
+        self.job_status.grid(row=0, column=1, padx=5, pady=5, sticky='w')
+        self.cancel_jobs_button = tk.Button(self.job_frame, text='取消任务', command=self.cancel_jobs)
+        self.cancel_jobs_button.grid(row=0, column=2, padx=5, pady=5, sticky='e')
+
         # 日志显示框
         self.log_frame = tk.Frame(self.root)
         self.log_frame.pack(fill='both', expand=True, pady=10)
@@ -160,11 +203,21 @@ class GoogleDriveSyncApp:
 
         # 更新按钮状态
         self.update_buttons_state()
+        self.update_job_status()
 
     def setup_logging_handler(self):
         handler = LoggingHandler(self.log_text)
         logging.getLogger().addHandler(handler)
 
+    def update_job_status(self):
+        running, pending = self.scheduler.counts()
+        self.job_status.config(text=f'运行中 {running} 个，等待中 {pending} 个')
+        self.root.after(JOB_STATUS_INTERVAL_MS, self.update_job_status)
+
+    def cancel_jobs(self):
+        count = self.scheduler.cancel()
+        logging.info('已请求取消 %d 个任务', count)
+
     def select_path(self):
         logging.info('选择游戏文件夹路径')
         path = filedialog.askdirectory(mustexist=True, title='选择游戏文件夹路径（包含 assets, versions, saves, mods 等子文件夹）')
@@ -181,6 +234,7 @@ class GoogleDriveSyncApp:
             self.drive_sync.bind_google_drive()
             logging.info('Google Drive 绑定成功')
             self.update_bind_button()
+            self.start_auto_sync()
         except Exception as e:
             logging.error(f'绑定 Google Drive 时出错: {e}')
 
@@ -208,12 +262,31 @@ class GoogleDriveSyncApp:
                 self.drive_sync.bind_google_drive()
                 self.update_bind_button()
                 if self.check_config_validity():
-                    self.version_compare_thread()
+                    # 本函数在后台线程中运行，提交比较任务要回到 Tk 主线程读取输入框
+                    self.root.after(0, self.version_compare_thread)
+                    self.start_auto_sync()
             else:
                 logging.info('未找到本地凭据，跳过自动绑定')
         except Exception as e:
             logging.error(f'自动绑定 Google Drive 时出错: {e}')
 
+    def start_auto_sync(self):
+        # auto_upload 开启时监视存档，存档静止后自动上传变动的文件
+        if not self.config.get('auto_upload') or self.auto_sync or not self.check_config_validity():
+            return
+        try:
+            self.auto_sync = AutoSync(self.drive_sync.service, self.drive_sync.folder_id, self.config['save_path'],
+                                      parse_world_patterns(self.config['save_folder']),
+                                      include_mods=self.config.get('auto_upload_mods', False), scheduler=self.scheduler,
+                                      upload_options=upload_options(self.config),
+                                      incremental_options=incremental_options(self.config),
+                                      debounce=self.config.get('auto_upload_debounce', DEFAULT_DEBOUNCE),
+                                      quiescence=self.config.get('auto_upload_quiescence', DEFAULT_QUIESCENCE))
+            self.auto_sync.start()
+        except Exception as e:
+            self.auto_sync = None
+            logging.error(f'启动自动上传时出错: {e}')
+
     def update_bind_button(self):
         self.bind_drive_button.config(text='Google Drive 已绑定', state=tk.DISABLED)
         self.rebind_drive_button.config(state=tk.NORMAL)
@@ -235,45 +308,57 @@ class GoogleDriveSyncApp:
 
     def save_config(self):
         logging.info('保存配置')
+        upload_limit = self.upload_limit_entry.get().strip()
+        download_limit = self.download_limit_entry.get().strip()
+        try:
+            parse_rate(upload_limit)
+            parse_rate(download_limit)
+        except ValueError:
+            logging.error('带宽限制格式不正确，请填写每秒字节数，例如 2M 或 512K')
+            return
         self.config['save_path'] = self.path_entry.get()
         self.config['save_folder'] = self.folder_entry.get()
+        self.config['upload_rate_limit'] = upload_limit
+        self.config['download_rate_limit'] = download_limit
         save_config(self.config)
         logging.info('配置已保存')
+        # 新的限速对正在进行的传输立即生效
+        self.apply_bandwidth()
         self.update_buttons_state()
 
+    def apply_bandwidth(self):
+        try:
+            configure_bandwidth(**bandwidth_options(self.config))
+        except ValueError as e:
+            logging.error('带宽配置无效：%s', e)
+
     def download_save_thread(self):
-        logging.info('启动下载存档线程')
-        threading.Thread(target=lambda: download_save(
-            self.drive_sync.service,
-            self.drive_sync.folder_id,
-            self.folder_entry.get(),
-            self.path_entry.get()
-        ), daemon=True).start()
+        logging.info('提交下载存档任务')
+        # 存档名填写 "world1, world2" 或 "world*" 时批量同步所有匹配的存档
+        patterns = parse_world_patterns(self.folder_entry.get())
+        name = '批量下载存档' if is_batch(patterns) else '下载存档'
+        self.scheduler.submit(name, f'saves:{",".join(patterns)}',
+                              partial(download_saves, **batch_options(self.config), **download_options(self.config)),
+                              self.drive_sync.service, self.drive_sync.folder_id, self.path_entry.get(), patterns)
 
     def upload_save_thread(self):
-        logging.info('启动上传存档线程')
-        threading.Thread(target=lambda: upload_save(
-            self.drive_sync.service,
-            self.drive_sync.folder_id,
-            self.folder_entry.get(),
-            self.path_entry.get()
-        ), daemon=True).start()
+        logging.info('提交上传存档任务')
+        patterns = parse_world_patterns(self.folder_entry.get())
+        name = '批量上传存档' if is_batch(patterns) else '上传存档'
+        self.scheduler.submit(name, f'saves:{",".join(patterns)}',
+                              partial(upload_saves, **batch_options(self.config), **upload_options(self.config),
+                                      **incremental_options(self.config)),
+                              self.drive_sync.service, self.drive_sync.folder_id, self.path_entry.get(), patterns)
 
     def download_mod_thread(self):
-        logging.info('启动下载 MOD 线程')
-        threading.Thread(target=lambda: download_mod(
-            self.drive_sync.service,
-            self.drive_sync.folder_id,
-            self.path_entry.get()
-        ), daemon=True).start()
+        logging.info('提交下载 MOD 任务')
+        self.scheduler.submit('下载 MOD', 'mods', partial(download_mod, **download_options(self.config)),
+                              self.drive_sync.service, self.drive_sync.folder_id, self.path_entry.get())
 
     def upload_mod_thread(self):
-        logging.info('启动上传 MOD 线程')
-        threading.Thread(target=lambda: upload_mod(
-            self.drive_sync.service,
-            self.drive_sync.folder_id,
-            self.path_entry.get()
-        ), daemon=True).start()
+        logging.info('提交上传 MOD 任务')
+        self.scheduler.submit('上传 MOD', 'mods', partial(upload_mod, **upload_options(self.config)),
+                              self.drive_sync.service, self.drive_sync.folder_id, self.path_entry.get())
 
     def test_bind(self):
         logging.info('测试绑定，获取文件列表')
@@ -286,121 +371,89 @@ class GoogleDriveSyncApp:
             logging.error(f'测试绑定时出错: {e}')
 
     def version_compare_thread(self):
-        logging.info('启动版本比较线程')
-        threading.Thread(target=self.version_compare, daemon=True).start()
+        logging.info('提交版本比较任务')
+        # 输入框只能在 Tk 主线程读取，取值后再交给后台任务
+        self.scheduler.submit('版本比较', 'compare', self.version_compare, self.folder_entry.get(), self.path_entry.get())
 
-    def version_compare(self):
+    def version_compare(self, world, save_path):
+        """在调度器的工作线程中执行：只做比较和记录日志，界面由 Tk 主线程更新"""
         logging.info('开始版本比较')
         try:
-            # 定义需要查找的文件名
-            save_zip_name = f"{self.folder_entry.get()}.zip"
-            mods_zip_name = "mods.zip"
-
-            # 通过文件名查找存档ZIP文件
-            save_query = f'name = "{save_zip_name}" and "{self.drive_sync.folder_id}" in parents and trashed=false'
-            save_results = self.drive_sync.service.files().list(
-                q=save_query,
-                spaces='drive',
-                fields='files(id, name, modifiedTime, size)'
-            ).execute()
-            save_items = save_results.get('files', [])
-            if not save_items:
-                logging.error(f'未找到名为 "{save_zip_name}" 的存档文件')
+            incremental = self.config.get('incremental_sync', True)
+            result = compare_versions(self.drive_sync.service, self.drive_sync.folder_id, world, save_path,
+                                      incremental=incremental,
+                                      max_age=self.config.get('scan_cache_seconds', DEFAULT_MAX_AGE))
+            if not result['save']['drive']:
+                if incremental:
+                    # 增量模式下先找清单，没有时再找 ZIP
+                    logging.error(f'未找到存档 "{world}" 的清单 "{manifest_name(world)}" 或存档文件 "{world}.zip"')
+                else:
+                    logging.error(f'未找到名为 "{world}.zip" 的存档文件')
                 return
-            drive_saves_file = save_items[0]
-
-            # 通过文件名查找MOD ZIP文件
-            mods_query = f'name = "{mods_zip_name}" and "{self.drive_sync.folder_id}" in parents and trashed=false'
-            mods_results = self.drive_sync.service.files().list(
-                q=mods_query,
-                spaces='drive',
-                fields='files(id, name, modifiedTime, size)'
-            ).execute()
-            mods_items = mods_results.get('files', [])
-            if not mods_items:
-                logging.error(f'未找到名为 "{mods_zip_name}" 的MOD文件')
+            if not result['mods']['drive']:
+                logging.error('未找到名为 "mods.zip" 的MOD文件')
                 return
-            drive_mods_file = mods_items[0]
 
-            # 转换 Google Drive 的时间格式为本地可读格式
-            drive_saves_time_utc = datetime.strptime(drive_saves_file["modifiedTime"], "%Y-%m-%dT%H:%M:%S.%fZ")
-            drive_mods_time_utc = datetime.strptime(drive_mods_file["modifiedTime"], "%Y-%m-%dT%H:%M:%S.%fZ")
-
-            # 转换为本地时间
-            drive_saves_time = drive_saves_time_utc.replace(tzinfo=timezone.utc).astimezone()
-            drive_mods_time = drive_mods_time_utc.replace(tzinfo=timezone.utc).astimezone()
-
-            # 更新 UI 中的 Google Drive 存档信息
-            self.drive_saves_time.config(text=f'修改时间: {drive_saves_time.strftime("%Y-%m-%d %H:%M:%S")}')
-            self.drive_saves_size.config(text=f'大小: {drive_saves_file.get("size")} bytes')
-
-            # 更新 UI 中的 Google Drive MOD 信息
-            self.drive_mods_time.config(text=f'修改时间: {drive_mods_time.strftime("%Y-%m-%d %H:%M:%S")}')
-            self.drive_mods_size.config(text=f'大小: {drive_mods_file.get("size")} bytes')
-
-            # 获取本地存档和 MOD 文件的路径
-            local_saves_path = os.path.join(self.path_entry.get(), 'saves', self.folder_entry.get())
-            local_mods_path = os.path.join(self.path_entry.get(), 'mods')
+            # 更新 UI 中的 Google Drive 存档与 MOD 信息
+            self.root.after(0, self.show_version, self.drive_saves_time, self.drive_saves_size, result['save']['drive'])
+            self.root.after(0, self.show_version, self.drive_mods_time, self.drive_mods_size, result['mods']['drive'])
 
             # 检查本地存档和 MOD 文件夹是否存在
-            if not os.path.exists(local_saves_path):
-                logging.error(f'本地存档路径不存在: {local_saves_path}')
+            if not result['save']['local']:
+                logging.error(f'本地存档路径不存在: {os.path.join(save_path, "saves", world)}')
                 return
-            if not os.path.exists(local_mods_path):
-                logging.error(f'本地 MOD 路径不存在: {local_mods_path}')
+            if not result['mods']['local']:
+                logging.error(f'本地 MOD 路径不存在: {os.path.join(save_path, "mods")}')
                 return
 
-            # 获取本地存档文件夹内所有文件的最新修改时间
-            local_saves_time = self.get_latest_modified_time(local_saves_path)
-            local_mods_time = datetime.fromtimestamp(os.path.getmtime(local_mods_path))
-
-            # 获取文件夹大小
-            local_saves_size = self.get_folder_size(local_saves_path)
-            local_mods_size = self.get_folder_size(local_mods_path)
-
-            # 更新 UI 中的本地存档信息
-            self.local_saves_time.config(text=f'修改时间: {local_saves_time.strftime("%Y-%m-%d %H:%M:%S")}')
-            self.local_saves_size.config(text=f'大小: {local_saves_size} bytes')
-
-            # 更新 UI 中的本地 MOD 信息
-            self.local_mods_time.config(text=f'修改时间: {local_mods_time.strftime("%Y-%m-%d %H:%M:%S")}')
-            self.local_mods_size.config(text=f'大小: {local_mods_size} bytes')
+            # 更新 UI 中的本地存档与 MOD 信息
+            self.root.after(0, self.show_version, self.local_saves_time, self.local_saves_size, result['save']['local'])
+            self.root.after(0, self.show_version, self.local_mods_time, self.local_mods_size, result['mods']['local'])
 
             logging.info('版本比较成功，已刷新数据显示')
 
         except Exception as e:
             logging.error(f'版本比较时出错: {e}')
 
-    # 辅助方法：获取文件夹内最新文件的修改时间
-    def get_latest_modified_time(self, folder_path):
-        latest_time = None
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_time = os.path.getmtime(file_path)
-                if latest_time is None or file_time > latest_time:
-                    latest_time = file_time
-        return datetime.fromtimestamp(latest_time) if latest_time else None
-
-    def get_folder_size(self, folder_path):
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(folder_path):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                total_size += os.path.getsize(fp)
-        return total_size
+    def show_version(self, time_label, size_label, info):
+        time_label.config(text=f'修改时间: {info["modified_time"].strftime("%Y-%m-%d %H:%M:%S")}')
+        size_label.config(text=f'大小: {info["size"]} bytes')
 
 class LoggingHandler(logging.Handler):
-    def __init__(self, log_widget):
+    """把日志写入 Tk 日志框：任意线程只把消息放进有界队列，由 Tk 主线程定时批量写入
+
+    日志框只保留最近 max_lines 行，长时间运行时内存与重绘开销保持不变。
+    """
+
+    def __init__(self, log_widget, max_lines=LOG_MAX_LINES, interval_ms=LOG_FLUSH_INTERVAL_MS):
         super().__init__()
         self.log_widget = log_widget
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        # deque 的 append/popleft 是线程安全的；超过上限时自动丢弃最旧的消息
+        self.pending = deque(maxlen=max_lines)
+        self.log_widget.after(self.interval_ms, self.flush_pending)
 
     def emit(self, record):
-        msg = self.format(record)
-        self.log_widget.configure(state='normal')
-        self.log_widget.insert(tk.END, f'{msg}\n')
-        self.log_widget.configure(state='disabled')
-        self.log_widget.yview(tk.END)
+        try:
+            self.pending.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def flush_pending(self):
+        lines = []
+        while self.pending:
+            lines.append(self.pending.popleft())
+        if lines:
+            self.log_widget.configure(state='normal')
+            self.log_widget.insert(tk.END, '\n'.join(lines) + '\n')
+            # 删除超出上限的旧行（文本末尾总有一个空行）
+            excess = int(self.log_widget.index('end-1c').split('.')[0]) - 1 - self.max_lines
+            if excess > 0:
+                self.log_widget.delete('1.0', f'{excess + 1}.0')
+            self.log_widget.configure(state='disabled')
+            self.log_widget.yview(tk.END)
+        self.log_widget.after(self.interval_ms, self.flush_pending)
 
 if __name__ == '__main__':
     logging.info('启动应用程序')
@@ -0,0 +1,16 @@
+import pytest
+
+@pytest.fixture
+def drive(tmp_path, monkeypatch):
+    """本地模拟的 Google Drive，返回 (service, 专属文件夹 ID, 后端)；config/ 下的状态文件写在临时目录中"""
+    pytest.importorskip('googleapiclient')
+    from mcgoogledrive import file_index, folder_scan
+    from mcgoogledrive.drive_sync import GoogleDriveSync
+    from mcgoogledrive.storage import LocalDriveBackend
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(file_index, '_index', None)
+    folder_scan.invalidate()
+    backend = LocalDriveBackend()
+    drive_sync = GoogleDriveSync()
+    drive_sync.use_backend(backend)
+    return drive_sync.service, drive_sync.folder_id, backend
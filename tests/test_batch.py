@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip('googleapiclient')
+from mcgoogledrive import batch as batch_module
+from mcgoogledrive.batch import DriveBatch
+from mcgoogledrive.local_drive import LocalDriveHttp
+from mcgoogledrive.storage import LocalDriveBackend
+
+class FlakyHttp(LocalDriveHttp):
+    """统计 HTTP 请求数；flaky 中的文件 ID 第一次请求时返回 503"""
+
+    def __init__(self, drive, calls, flaky):
+        super().__init__(drive)
+        self.calls = calls
+        self.flaky = flaky
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.calls.append(uri)
+        return super().request(uri, method, body, headers, **kwargs)
+
+    def _respond(self, uri, method, body, headers):
+        for file_id in list(self.flaky):
+            if file_id in uri:
+                self.flaky.discard(file_id)
+                return 503, {'content-type': 'application/json'}, b'{"error": {"code": 503, "message": "unavailable"}}'
+        return super()._respond(uri, method, body, headers)
+
+class FlakyBackend(LocalDriveBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.flaky = set()
+
+    def new_http(self):
+        return FlakyHttp(self.drive, self.calls, self.flaky)
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(batch_module, 'backoff_delay', lambda attempt: 0)
+    return FlakyBackend()
+
+def _create_files(service, count):
+    return [service.files().create(body={'name': f'f{index}'}, fields='id').execute()['id'] for index in range(count)]
+
+def test_splits_into_batches_of_100(backend):
+    service = backend.build_service()
+    file_ids = _create_files(service, 250)
+    batch = DriveBatch(service)
+    for file_id in file_ids:
+        batch.add(service.files().get(fileId=file_id, fields='id, name'))
+    del backend.calls[:]
+    results = batch.execute()
+    assert len(backend.calls) == 3
+    assert [response['id'] for response, error in results] == file_ids
+    assert all(error is None for _, error in results)
+
+def test_retries_only_failed_requests(backend):
+    service = backend.build_service()
+    file_ids = _create_files(service, 10)
+    backend.flaky.update(file_ids[2:4])
+    batch = DriveBatch(service)
+    for file_id in file_ids:
+        batch.add(service.files().get(fileId=file_id, fields='id'))
+    del backend.calls[:]
+    results = batch.execute()
+    # 第一次批量请求中两个子请求返回 503，重试时只重发这两个
+    assert len(backend.calls) == 2
+    assert [response['id'] for response, _ in results] == file_ids
+
+def test_single_retry_is_sent_without_batch(backend):
+    service = backend.build_service()
+    file_ids = _create_files(service, 3)
+    backend.flaky.add(file_ids[1])
+    batch = DriveBatch(service)
+    for file_id in file_ids:
+        batch.add(service.files().get(fileId=file_id, fields='id'))
+    del backend.calls[:]
+    batch.execute()
+    assert '/batch/' in backend.calls[0] and '/batch/' not in backend.calls[1]
+
+def test_not_found_is_reported_per_request(backend):
+    service = backend.build_service()
+    file_ids = _create_files(service, 2)
+    batch = DriveBatch(service)
+    seen = []
+    for file_id in file_ids[:1] + ['missing'] + file_ids[1:]:
+        batch.add(service.files().delete(fileId=file_id), callback=lambda response, error: seen.append(error))
+    results = batch.execute()
+    assert results[0][1] is None and results[2][1] is None
+    assert batch_module.error_status(results[1][1]) == 404
+    assert len(seen) == 3 and seen[1] is results[1][1]
+    assert all(file_id not in backend.drive.files for file_id in file_ids)
@@ -0,0 +1,58 @@
+import random
+import pytest
+from mcgoogledrive import chunking
+from mcgoogledrive.chunking import chunk_boundaries, chunk_params, ChunkParams, DEFAULT_CHUNK_PARAMS
+
+PARAMS = ChunkParams(min_size=1024, avg_size=4096, max_size=16384)
+
+def _data(size, seed=1):
+    return random.Random(seed).randbytes(size)
+
+def _pure_python(monkeypatch, data, params):
+    monkeypatch.setattr(chunking, '_window_cuts', lambda *args: None)
+    return chunk_boundaries(data, params)
+
+@pytest.mark.parametrize('size', [0, 1, 1024, 1025, 50000, 300000])
+def test_boundaries_cover_data(size):
+    boundaries = chunk_boundaries(_data(size), PARAMS)
+    if not size:
+        assert boundaries == []
+        return
+    assert [start for start, _ in boundaries] == [0] + [end for _, end in boundaries[:-1]]
+    assert boundaries[-1][1] == size
+    for start, end in boundaries[:-1]:
+        assert PARAMS.min_size < end - start <= PARAMS.max_size
+
+def test_boundaries_deterministic():
+    data = _data(200000)
+    assert chunk_boundaries(data, PARAMS) == chunk_boundaries(bytes(data), PARAMS)
+
+def test_edit_only_changes_nearby_chunks():
+    data = bytearray(_data(400000))
+    before = chunk_boundaries(bytes(data), PARAMS)
+    data[200000:200010] = b'0123456789'
+    after = chunk_boundaries(bytes(data), PARAMS)
+    unchanged = set(before) & set(after)
+    # 改写处之前的块完全相同，之后的块在几个块内重新对齐
+    assert all(bound in unchanged for bound in before if bound[1] <= 200000 - PARAMS.max_size)
+    assert len(unchanged) >= len(before) - 8
+
+def test_numpy_matches_pure_python(monkeypatch):
+    pytest.importorskip('numpy')
+    for params in (PARAMS, DEFAULT_CHUNK_PARAMS, ChunkParams(64, 128, 512)):
+        data = _data(3 * 1024 * 1024 + 17, seed=params.avg_size)
+        vectorised = chunk_boundaries(data, params)
+        assert vectorised == _pure_python(monkeypatch, data, params)
+        monkeypatch.undo()
+
+def test_low_entropy_data_cuts_at_max_size():
+    boundaries = chunk_boundaries(bytes(100000), PARAMS)
+    assert all(end - start == PARAMS.max_size for start, end in boundaries[:-1])
+
+def test_chunk_params_validation():
+    assert chunk_params(None) == DEFAULT_CHUNK_PARAMS
+    assert chunk_params({'avg_size': 32768}).avg_size == 32768
+    with pytest.raises(ValueError):
+        chunk_params({'avg_size': 3000})
+    with pytest.raises(ValueError):
+        chunk_params({'min_size': 100000, 'avg_size': 65536})
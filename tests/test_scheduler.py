@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from mcgoogledrive.scheduler import JobScheduler, check_cancelled, propagate, DONE, CANCELLED, FAILED
+
+@pytest.fixture
+def scheduler():
+    scheduler = JobScheduler(max_workers=3)
+    yield scheduler
+    scheduler.shutdown()
+
+def test_same_target_never_runs_concurrently(scheduler):
+    lock = threading.Lock()
+    active = {'a': 0, 'b': 0}
+    overlap = []
+    peak = []
+
+    def work(target):
+        with lock:
+            active[target] += 1
+            overlap.append(active[target])
+            peak.append(sum(active.values()))
+        threading.Event().wait(0.05)
+        with lock:
+            active[target] -= 1
+
+    jobs = [scheduler.submit(f'job {index}', target, work, target) for index in range(3) for target in 'ab']
+    for job in jobs:
+        assert scheduler.wait(job, 10) == DONE
+    assert max(overlap) == 1
+    # 不同目标的任务可以同时运行
+    assert max(peak) == 2
+
+def test_duplicate_pending_job_is_merged(scheduler):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work(name):
+        calls.append(name)
+        started.set()
+        release.wait(5)
+
+    running = scheduler.submit('upload', 'saves:w', work, 'first')
+    assert started.wait(5)
+    pending = scheduler.submit('upload', 'saves:w', work, 'second')
+    assert scheduler.submit('upload', 'saves:w', work, 'third') is pending
+    assert scheduler.submit('download', 'saves:w', work, 'other') is not pending
+    release.set()
+    for job in (running, pending):
+        assert scheduler.wait(job, 10) == DONE
+    assert calls[:2] == ['first', 'second'] and 'third' not in calls
+
+def test_cancel_pending_and_running(scheduler):
+    started = threading.Event()
+
+    def work():
+        started.set()
+        while True:
+            check_cancelled()
+            threading.Event().wait(0.01)
+
+    running = scheduler.submit('long', 't', work)
+    assert started.wait(5)
+    pending = scheduler.submit('queued', 't', work)
+    assert scheduler.cancel() == 2
+    assert scheduler.wait(running, 10) == CANCELLED
+    assert pending.status == CANCELLED
+
+def test_cancellation_reaches_worker_threads(scheduler):
+    started = threading.Event()
+
+    def child():
+        started.set()
+        while True:
+            check_cancelled()
+            threading.Event().wait(0.01)
+
+    def work():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(propagate(child)).result()
+
+    job = scheduler.submit('parallel', 't', work)
+    assert started.wait(5)
+    scheduler.cancel(job.id)
+    assert scheduler.wait(job, 10) == CANCELLED
+
+def test_error_marks_job_failed(scheduler):
+    def work():
+        raise IOError('disk full')
+
+    job = scheduler.submit('broken', 't', work)
+    assert scheduler.wait(job, 10) == FAILED
+    assert job.error == 'disk full'
+
+def test_check_cancelled_outside_job_is_noop():
+    check_cancelled()
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+
+pytest.importorskip('googleapiclient')
+from mcgoogledrive.snapshots import select_snapshots, parse_snapshot_name, snapshot_name, SnapshotStore
+from mcgoogledrive.content_store import ContentStore
+
+NOW = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+
+def test_newest_is_always_kept():
+    times = [NOW - timedelta(days=30), NOW]
+    assert select_snapshots(times, {}) == {NOW}
+    assert select_snapshots([], {'hourly': 24}) == set()
+
+def test_one_snapshot_per_period():
+    # 最近 3 小时内每 10 分钟一个快照：每小时只保留最新的一个
+    times = [NOW - timedelta(minutes=10 * index) for index in range(18)]
+    keep = select_snapshots(times, {'hourly': 24})
+    assert len(keep) == 4
+    assert NOW in keep
+    assert all(when == max(t for t in times if t.replace(minute=0) == when.replace(minute=0)) for when in keep)
+
+def test_counts_limit_each_granularity():
+    times = [NOW - timedelta(hours=6 * index) for index in range(40)]
+    keep = select_snapshots(times, {'hourly': 2, 'daily': 3, 'weekly': 2})
+    evening = NOW.replace(hour=18)
+    # 时间段按 UTC 纪元对齐：每天从 0 点开始，每周从周四开始
+    assert keep == {
+        NOW, NOW - timedelta(hours=6),
+        evening - timedelta(days=1), evening - timedelta(days=2),
+        evening - timedelta(days=4),
+    }
+
+def test_names_round_trip_with_microseconds():
+    when = NOW.replace(microsecond=123456)
+    assert parse_snapshot_name(snapshot_name('my@world', when)) == ('my@world', when)
+    assert parse_snapshot_name('w@20260301T123000Z.manifest.json') == ('w', NOW)
+    assert parse_snapshot_name('w.manifest.json') is None
+    assert parse_snapshot_name('w@garbage.manifest.json') is None
+
+def test_same_second_snapshots_do_not_overwrite(drive):
+    service, folder_id, _ = drive
+    snapshots = SnapshotStore(ContentStore(service, folder_id))
+    for index in range(3):
+        snapshots.create('w', {'files': {}, 'index': index}, when=NOW.replace(microsecond=index))
+    assert len(snapshots.list('w')) == 3
+    assert snapshots.load('w', NOW)[1]['index'] == 2
+    assert snapshots.prune('w', {}) == 2
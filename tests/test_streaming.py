@@ -0,0 +1,109 @@
+import io
+import os
+import zlib
+import zipfile
+import threading
+import pytest
+
+pytest.importorskip('googleapiclient')
+from mcgoogledrive import staging
+from mcgoogledrive.streaming import BoundedPipe, PipeClosed, extract_stream
+
+class _Unseekable(io.RawIOBase):
+    """只能顺序写入的输出流，zipfile 写入时会为每个条目加上数据描述符"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+FILES = {
+    'level.dat': os.urandom(3000),
+    'region/r.0.0.mca': os.urandom(50000),
+    'data/notes.txt': b'hello world\n' * 2000,
+}
+
+def _zip(files, seekable=True, compress_type=zipfile.ZIP_DEFLATED):
+    out = io.BytesIO() if seekable else _Unseekable()
+    with zipfile.ZipFile(out, 'w', compress_type) as zip_ref:
+        for name, data in files.items():
+            zip_ref.writestr(name, data)
+    return bytes(out.getvalue() if seekable else out.data)
+
+def _pipe_with(data, max_size=1 << 20):
+    pipe = BoundedPipe(max_size)
+    def produce():
+        for start in range(0, len(data), 7000):
+            pipe.write(data[start:start + 7000])
+        pipe.close()
+    threading.Thread(target=produce, daemon=True).start()
+    return pipe
+
+def _read_tree(folder):
+    files = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, folder).replace(os.sep, '/')] = f.read()
+    return files
+
+def test_read_range_skips_ahead_of_writer():
+    data = os.urandom(100000)
+    pipe = _pipe_with(data, max_size=16 * 1024)
+    # 断点续传时从写入端还没写到的位置开始读，缓冲区比跳过的数据小
+    assert pipe.read_range(60000, 1000) == data[60000:61000]
+    assert pipe.read_range(61000, 5000) == data[61000:66000]
+    with pytest.raises(ValueError):
+        pipe.read_range(10, 10)
+
+def test_read_range_past_end_returns_empty():
+    pipe = _pipe_with(b'abc')
+    assert pipe.read_range(10, 5) == b''
+
+def test_write_after_close_raises():
+    pipe = BoundedPipe()
+    pipe.close()
+    with pytest.raises(PipeClosed):
+        pipe.write(b'x')
+
+def test_close_with_error_reaches_reader():
+    pipe = BoundedPipe()
+    pipe.close(error=IOError('boom'))
+    with pytest.raises(IOError):
+        pipe.read(10)
+
+@pytest.mark.parametrize('seekable', [True, False], ids=['sizes-in-header', 'data-descriptor'])
+@pytest.mark.parametrize('compress_type', [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED], ids=['deflated', 'stored'])
+def test_extract_stream(tmp_path, seekable, compress_type):
+    data = _zip(FILES, seekable, compress_type)
+    flags = {info.flag_bits & 0x08 for info in zipfile.ZipFile(io.BytesIO(data)).infolist()}
+    assert flags == ({0} if seekable else {0x08})
+    extract_stream(_pipe_with(data), str(tmp_path))
+    assert _read_tree(tmp_path) == FILES
+
+@pytest.mark.parametrize('seekable', [True, False], ids=['sizes-in-header', 'data-descriptor'])
+def test_extract_stream_detects_corruption(tmp_path, seekable):
+    data = bytearray(_zip({'a.bin': os.urandom(20000)}, seekable, zipfile.ZIP_STORED))
+    data[10000] ^= 0xFF
+    with pytest.raises(zipfile.BadZipFile):
+        extract_stream(_pipe_with(bytes(data)), str(tmp_path))
+
+def test_extract_stream_links_unchanged_files(tmp_path, monkeypatch):
+    # 支持克隆的文件系统上会先克隆，这里固定走硬链接以便按 inode 判断
+    monkeypatch.setattr(staging, 'clone_file', lambda source, target: False)
+    current = tmp_path / 'current'
+    for name, content in FILES.items():
+        (current / name).parent.mkdir(parents=True, exist_ok=True)
+        (current / name).write_bytes(content)
+    changed = dict(FILES, **{'level.dat': b'new'})
+    target = tmp_path / 'new'
+    extract_stream(_pipe_with(_zip(changed)), str(target), link_from=str(current))
+    assert _read_tree(target) == changed
+    assert (target / 'region/r.0.0.mca').stat().st_ino == (current / 'region/r.0.0.mca').stat().st_ino
+    assert zlib.crc32((target / 'level.dat').read_bytes()) == zlib.crc32(b'new')
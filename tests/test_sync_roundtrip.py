@@ -0,0 +1,129 @@
+"""每种同步方式在本地模拟的 Google Drive 上完整走一遍上传和下载，比较两端的文件内容"""
+import os
+import random
+import shutil
+import pytest
+
+pytest.importorskip('googleapiclient')
+from mcgoogledrive.file_operations import upload_save, download_save, upload_save_incremental, download_save_incremental, \
+    upload_save_paths, upload_mod, download_mod, upload_saves, download_saves, restore_snapshot
+from mcgoogledrive.staging import STAGING_FOLDER
+
+WORLD = 'world'
+
+def _write(folder, files):
+    for name, data in files.items():
+        path = os.path.join(folder, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+def _read_tree(folder):
+    files = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, folder).replace(os.sep, '/')] = f.read()
+    return files
+
+def _world_files(seed=0):
+    rnd = random.Random(seed)
+    return {
+        'level.dat': rnd.randbytes(2000),
+        'region/r.0.0.mca': rnd.randbytes(40000),
+        # 超过切块阈值，增量模式下按内容切块
+        'region/r.1.0.mca': rnd.randbytes(1536 * 1024),
+        'data/raids.dat': b'',
+        'stats/player.json': b'{"stat": 1}\n' * 500,
+    }
+
+def _edit(files):
+    edited = dict(files)
+    big = bytearray(edited['region/r.1.0.mca'])
+    big[700000:700100] = bytes(100)
+    edited['region/r.1.0.mca'] = bytes(big)
+    edited['level.dat'] = b'changed'
+    edited['playerdata/new.dat'] = b'new player'
+    del edited['stats/player.json']
+    return edited
+
+@pytest.fixture
+def game(tmp_path):
+    game = tmp_path / 'game'
+    _write(game / 'saves' / WORLD, _world_files())
+    return str(game)
+
+def _world(root):
+    return os.path.join(root, 'saves', WORLD)
+
+@pytest.mark.parametrize('upload_streaming', [False, True], ids=['zip', 'zip-streaming-upload'])
+@pytest.mark.parametrize('download_streaming', [False, True], ids=['download', 'streaming-download'])
+def test_zip_round_trip(drive, game, tmp_path, upload_streaming, download_streaming):
+    service, folder_id, _ = drive
+    other = str(tmp_path / 'other')
+    upload_save(service, folder_id, WORLD, game, streaming=upload_streaming)
+    download_save(service, folder_id, WORLD, other, streaming=download_streaming)
+    assert _read_tree(_world(other)) == _read_tree(_world(game))
+
+    # 第二轮：修改、新增和删除的文件都同步过去，没有留下暂存目录
+    edited = _edit(_world_files())
+    shutil.rmtree(_world(game))
+    _write(_world(game), edited)
+    upload_save(service, folder_id, WORLD, game, streaming=upload_streaming)
+    download_save(service, folder_id, WORLD, other, streaming=download_streaming)
+    assert _read_tree(_world(other)) == edited
+    assert not [name for name in os.listdir(os.path.join(other, STAGING_FOLDER)) if not name.endswith('.previous')]
+
+def test_incremental_round_trip(drive, game, tmp_path):
+    service, folder_id, _ = drive
+    other = str(tmp_path / 'other')
+    upload_save_incremental(service, folder_id, WORLD, game, retention=None)
+    download_save_incremental(service, folder_id, WORLD, other)
+    assert _read_tree(_world(other)) == _read_tree(_world(game))
+
+    edited = _edit(_world_files())
+    shutil.rmtree(_world(game))
+    _write(_world(game), edited)
+    upload_save_incremental(service, folder_id, WORLD, game, retention=None)
+    download_save_incremental(service, folder_id, WORLD, other)
+    assert _read_tree(_world(other)) == edited
+
+def test_changed_paths_round_trip(drive, game, tmp_path):
+    service, folder_id, _ = drive
+    other = str(tmp_path / 'other')
+    upload_save_incremental(service, folder_id, WORLD, game, retention=None)
+    _write(_world(game), {'level.dat': b'only this changed'})
+    upload_save_paths(service, folder_id, WORLD, game, [os.path.join(_world(game), 'level.dat')], retention=None)
+    download_save_incremental(service, folder_id, WORLD, other)
+    assert _read_tree(_world(other)) == dict(_world_files(), **{'level.dat': b'only this changed'})
+
+def test_snapshot_restore(drive, game):
+    service, folder_id, _ = drive
+    original = _read_tree(_world(game))
+    upload_save_incremental(service, folder_id, WORLD, game, retention={'hourly': 24})
+    # 本地改坏存档后恢复最新快照：改过的文件还原，多出的文件删除
+    _write(_world(game), {'level.dat': b'broken', 'extra.dat': b'stale'})
+    restore_snapshot(service, folder_id, WORLD, game)
+    assert _read_tree(_world(game)) == original
+
+def test_mods_round_trip(drive, tmp_path):
+    service, folder_id, _ = drive
+    game, other = str(tmp_path / 'game'), str(tmp_path / 'other')
+    mods = {f'mod{index}.jar': os.urandom(5000 + index) for index in range(5)}
+    _write(os.path.join(game, 'mods'), mods)
+    upload_mod(service, folder_id, game)
+    download_mod(service, folder_id, other)
+    assert _read_tree(os.path.join(other, 'mods')) == mods
+
+@pytest.mark.parametrize('incremental', [True, False], ids=['incremental', 'zip'])
+def test_batch_round_trip(drive, tmp_path, incremental):
+    service, folder_id, _ = drive
+    game, other = str(tmp_path / 'game'), str(tmp_path / 'other')
+    worlds = {f'world{index}': _world_files(seed=index) for index in range(3)}
+    for name, files in worlds.items():
+        _write(os.path.join(game, 'saves', name), files)
+    upload_saves(service, folder_id, game, ['world*'], incremental=incremental, retention=None)
+    download_saves(service, folder_id, other, ['world*'], incremental=incremental)
+    for name, files in worlds.items():
+        assert _read_tree(os.path.join(other, 'saves', name)) == files